@@ -0,0 +1,580 @@
+"""
+Benchmark Module
+
+This module times the hot paths of the threading on synthetic templates and
+sequences over a range of lengths, and end to end on the native pairs of the
+bundled `data/example*` sets, so that the effect of a change on each stage
+can be measured and compared against a saved baseline.
+
+The stages are the scalar and vectorized DOPE lookups, the distance matrix,
+the full and score-only low-level engines, the high-level matrix and the
+end-to-end process_template, which also parses the PDB file. Each case runs
+in a fresh process, for a meaningful peak RSS, on a single core and with
+inputs generated from a fixed seed, so that runs are reproducible. Cases
+beyond the cell budget of their stage are skipped.
+
+A first call of each case is timed on its own, then every repeat calls the
+case as many times as fit in 0.1 s, so that short cases are timed above the
+noise. The benchmark reports the wall time per call of the fastest and of
+the median repeats and of the first call, the number of cells per second
+and the peak resident set size of the process. In process_template, the
+first call also builds the energy profile of the template, which the later
+calls reuse from the in-memory cache as the workers of a run do.
+
+Functions:
+- synthetic_template: Generates the C-alpha coordinates of a template.
+- synthetic_sequence: Generates a sequence of residues.
+- write_pdb: Writes C-alpha coordinates to a PDB file.
+- benchmark_cases: Lists the cases of the benchmark.
+- run_case: Times a case.
+- run_benchmarks: Runs all the cases, each in a fresh process.
+- compare_to_baseline: Flags the regressions against a saved baseline.
+
+Usage:
+    python src/benchmark.py [--lengths 10,30,100,300] [--repeats 3] \
+                            [--engine batched] \
+                            [--output_file benchmark.json] \
+                            [--baseline baseline.json] [--threshold 0.1]
+
+Example:
+    from benchmark import benchmark_cases, run_benchmarks
+    cases = benchmark_cases([10, 30], ['fill_high_level_matrix'])
+    results = run_benchmarks(cases, df_dope, repeats=3)
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from Bio.SeqUtils import IUPACData
+import numpy as np
+
+from config import DOPE_CACHE, DOPE_URL
+from energy_profile import get_template_profile
+from load_data import (coordinates_to_distance_matrix, load_dope_cached,
+                       pdb_to_c_alpha_coordinates, read_fasta)
+from main import process_template
+from process_dope import (compile_dope, encode_sequence, find_dope_score,
+                          find_dope_scores)
+from process_matrix import (LOW_LEVEL_ENGINES, fill_high_level_matrix,
+                            fill_low_level_matrices)
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Stages of the benchmark, in order
+STAGES = ['find_dope_score', 'find_dope_scores',
+          'coordinates_to_distance_matrix', 'fill_low_level_matrices',
+          'fill_low_level_scores', 'fill_high_level_matrix',
+          'process_template']
+
+# Lengths of the synthetic templates and sequences
+DEFAULT_LENGTHS = [10, 30, 100, 300]
+
+# Largest number of cells of a case, and of the cases of the slow stages
+MAX_CELLS = 2 * 10**8
+STAGE_MAX_CELLS = {
+    'find_dope_score': 10**4,           # One DataFrame lookup per cell
+    'fill_low_level_matrices': 10**5    # Filled cell by cell, in Python
+}
+
+# Fixtures: the example sets bundled with the repository
+FIXTURES = 'data/example*'
+
+# Shortest duration of a timed repeat, in seconds
+MIN_REPEAT_TIME = 0.1
+
+# Relative slowdown, or growth of the peak RSS, flagged as a regression
+REGRESSION_THRESHOLD = 0.1
+
+# Distance between consecutive C-alpha atoms, in Angstroms
+CA_DISTANCE = 3.8
+
+RESIDUES = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def synthetic_template(n: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Generate the C-alpha coordinates of a template as a random walk with
+    steps of 3.8 A, so that the distances cover the range of the DOPE table.
+
+    Args:
+        n (int): Number of residues.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        np.ndarray: C-alpha coordinates with shape (n, 3).
+    """
+    steps = rng.normal(size=(n, 3))
+    steps *= CA_DISTANCE / np.linalg.norm(steps, axis=1, keepdims=True)
+    return np.cumsum(steps, axis=0)
+
+
+def synthetic_sequence(m: int, rng: np.random.Generator) -> str:
+    """
+    Generate a sequence of residues drawn uniformly.
+
+    Args:
+        m (int): Length of the sequence.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        str: Sequence of one-letter residue names.
+    """
+    return ''.join(rng.choice(list(RESIDUES), m))
+
+
+def write_pdb(coords: np.ndarray, sequence: str, pdb_file: str) -> None:
+    """
+    Write C-alpha coordinates to a PDB file, one ATOM record per residue.
+
+    Args:
+        coords (np.ndarray): C-alpha coordinates with shape (n, 3).
+        sequence (str): One-letter names of the n residues.
+        pdb_file (str): Path of the PDB file to write.
+    """
+    with open(pdb_file, 'w') as f:
+        for k, (residue, (x, y, z)) in enumerate(zip(sequence, coords), 1):
+            name = IUPACData.protein_letters_1to3[residue].upper()
+            f.write(f"ATOM  {k:5d}  CA  {name} A{k:4d}    "
+                    f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00           C\n")
+        f.write("END\n")
+
+
+def _case_cells(stage: str, n: int, m: int) -> int:
+    """Return the number of cells computed by a case of a stage."""
+    if stage == 'coordinates_to_distance_matrix':
+        return n * n
+    if stage in ('fill_low_level_matrices', 'fill_low_level_scores',
+                 'process_template'):
+        return n * m * n * m
+    return n * m
+
+
+def benchmark_cases(lengths: list, stages: list = None,
+                    fixtures: str = FIXTURES,
+                    max_cells: int = MAX_CELLS) -> list:
+    """
+    List the cases of the benchmark: a synthetic template and sequence of
+    each length for every stage, and the native pairs of the fixtures for
+    process_template. Cases beyond the cell budget of their stage are
+    skipped.
+
+    Args:
+        lengths (list): Lengths of the synthetic templates and sequences.
+        stages (list, optional): Stages to benchmark. Defaults to all STAGES.
+        fixtures (str, optional): Glob pattern of the example sets, each
+                                  holding `sequences/` and `structures/`.
+                                  Defaults to FIXTURES.
+        max_cells (int, optional): Largest number of cells of a case.
+                                   Defaults to MAX_CELLS.
+
+    Returns:
+        list: Cases, as dictionaries with the 'stage', the 'case' name, the
+              template and sequence lengths 'n' and 'm' and the 'cells',
+              plus the 'template_file' and 'sequence_file' of fixtures.
+    """
+    stages = stages or STAGES
+    cases = []
+    for stage in stages:
+        for length in lengths:
+            cases.append({'stage': stage, 'case': f"synthetic_{length}",
+                          'n': length, 'm': length})
+
+    # Native pairs of the example sets: the sequence of each structure
+    if 'process_template' in stages:
+        for example_dir in sorted(glob.glob(fixtures)):
+            structures_dir = os.path.join(example_dir, 'structures')
+            sequences_dir = os.path.join(example_dir, 'sequences')
+            if not os.path.isdir(structures_dir) \
+                    or not os.path.isdir(sequences_dir):
+                continue
+            structures = {os.path.splitext(file)[0].lower(): file
+                          for file in os.listdir(structures_dir)}
+            for sequence_file in sorted(os.listdir(sequences_dir)):
+                stem = os.path.splitext(sequence_file)[0].lower()
+                if stem not in structures:
+                    continue
+                template_file = os.path.join(structures_dir,
+                                             structures[stem])
+                sequence_file = os.path.join(sequences_dir, sequence_file)
+                cases.append({
+                    'stage': 'process_template',
+                    'case': f"{os.path.basename(example_dir)}/"
+                            f"{structures[stem]}",
+                    'n': len(pdb_to_c_alpha_coordinates(template_file)),
+                    'm': len(read_fasta(sequence_file)),
+                    'template_file': template_file,
+                    'sequence_file': sequence_file
+                })
+
+    selected = []
+    for case in cases:
+        case['cells'] = _case_cells(case['stage'], case['n'], case['m'])
+        if case['cells'] > min(max_cells, STAGE_MAX_CELLS.get(case['stage'],
+                                                              max_cells)):
+            logging.info(f"Skipping {case['stage']} {case['case']}: "
+                         f"{case['cells']} cells over the budget")
+            continue
+        selected.append(case)
+    return selected
+
+
+def _peak_rss_mb() -> float:
+    """Return the peak resident set size of the process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _prepare_case(case: dict, df_dope, engine: str, seed: int,
+                  work_dir: str):
+    """Build the inputs of a case and return the function to time."""
+    stage, n, m = case['stage'], case['n'], case['m']
+    rng = np.random.default_rng(np.random.SeedSequence([seed, n, m]))
+    coords = synthetic_template(n, rng)
+    sequence = synthetic_sequence(m, rng)
+
+    if stage == 'coordinates_to_distance_matrix':
+        return lambda: coordinates_to_distance_matrix(coords)
+    if stage == 'process_template':
+        if 'template_file' in case:
+            templates_dir, template = os.path.split(case['template_file'])
+            sequence = read_fasta(case['sequence_file'])
+        else:
+            templates_dir, template = work_dir, 'synthetic.pdb'
+            write_pdb(coords, synthetic_sequence(n, rng),
+                      os.path.join(work_dir, template))
+        return lambda: process_template(template, templates_dir, sequence,
+                                        df_dope, 0.0, False, 1,
+                                        engine=engine)
+
+    dist_matrix = coordinates_to_distance_matrix(coords)
+    if stage == 'find_dope_score':
+        pairs = [(sequence[i % m], sequence[j], dist_matrix[i, j % n])
+                 for i in range(n) for j in range(m)]
+        return lambda: [find_dope_score(res1, res2, distance, df_dope)
+                        for res1, res2, distance in pairs]
+    if stage == 'find_dope_scores':
+        dope_tensor, dope_distances = compile_dope(df_dope)
+        codes = encode_sequence(sequence)
+        distances = dist_matrix[:, np.arange(m) % n]
+        return lambda: find_dope_scores(codes[np.arange(n) % m, None],
+                                        codes[None, :], distances,
+                                        dope_tensor, dope_distances)
+    if stage == 'fill_high_level_matrix':
+        terminal_scores = rng.uniform(-50, 10, size=(n, m)).round(2)
+        return lambda: fill_high_level_matrix(terminal_scores, 0.0,
+                                              sequence, False)
+
+    profile = get_template_profile(dist_matrix, df_dope)
+    if stage == 'fill_low_level_matrices':
+        return lambda: fill_low_level_matrices(n, m, sequence, dist_matrix,
+                                               0.0, df_dope, profile)
+    if stage == 'fill_low_level_scores':
+        return lambda: LOW_LEVEL_ENGINES[engine](
+            n=n, m=m, sequence=sequence, dist_matrix=dist_matrix,
+            gap_score=0.0, df_dope=df_dope, profile=profile, jobs=1
+        )
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_case(case: dict, df_dope, engine: str = 'batched',
+             repeats: int = 3, seed: int = 0) -> dict:
+    """
+    Time a case, best run in a fresh process for its peak RSS.
+
+    Args:
+        case (dict): Case returned by benchmark_cases.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        engine (str, optional): Low-level engine of fill_low_level_scores
+                                and process_template. Defaults to 'batched'.
+        repeats (int, optional): Number of timed repeats, after a first
+                                 call. Defaults to 3.
+        seed (int, optional): Seed of the synthetic inputs, combined with
+                              the lengths of the case. Defaults to 0.
+
+    Returns:
+        dict: The case with its 'wall_time' per call of the fastest
+              repeat, in seconds, 'wall_time_median', 'wall_time_first',
+              'calls_per_repeat', 'cells_per_second' and 'peak_rss_mb', and
+              the 'energy_score' of process_template.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as work_dir:
+        function = _prepare_case(case, df_dope, engine, seed, work_dir)
+        start = time.perf_counter()
+        output = function()
+        first_time = time.perf_counter() - start
+
+        # Call short cases several times per repeat
+        number = max(1, int(np.ceil(MIN_REPEAT_TIME / max(first_time,
+                                                           1e-9))))
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            times.append((time.perf_counter() - start) / number)
+
+    result = {key: value for key, value in case.items()
+              if key not in ('template_file', 'sequence_file')}
+    result.update({
+        'wall_time': min(times),
+        'wall_time_median': statistics.median(times),
+        'wall_time_first': first_time,
+        'calls_per_repeat': number,
+        'cells_per_second': case['cells'] / max(min(times), 1e-9),
+        'peak_rss_mb': round(_peak_rss_mb(), 1)
+    })
+    if case['stage'] == 'process_template':
+        result['energy_score'] = float(output)
+    return result
+
+
+def run_benchmarks(cases: list, df_dope, engine: str = 'batched',
+                   repeats: int = 3, seed: int = 0) -> list:
+    """
+    Run the cases of the benchmark, each in a fresh process.
+
+    Args:
+        cases (list): Cases returned by benchmark_cases.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        engine (str, optional): Low-level engine of fill_low_level_scores
+                                and process_template. Defaults to 'batched'.
+        repeats (int, optional): Number of timed repeats. Defaults to 3.
+        seed (int, optional): Seed of the synthetic inputs. Defaults to 0.
+
+    Returns:
+        list: Results of the cases, see run_case.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, case, df_dope, engine, repeats,
+                                 seed).result()
+        logging.info(f"{result['stage']:<32}{result['case']:<24}"
+                     f"{result['wall_time']:>10.4f} s"
+                     f"{result['cells_per_second']:>12.3g} cells/s"
+                     f"{result['peak_rss_mb']:>9.1f} MiB")
+        results.append(result)
+    return results
+
+
+def compare_to_baseline(results: list, baseline: list,
+                        threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    Compare results to a baseline, case by case.
+
+    A case regresses if its wall time or its peak RSS grew by more than
+    `threshold` relative to the baseline. Cases missing from either side
+    are not compared.
+
+    Args:
+        results (list): Results returned by run_benchmarks.
+        baseline (list): Results of a baseline run.
+        threshold (float, optional): Relative growth flagged as a
+                                     regression.
+                                     Defaults to REGRESSION_THRESHOLD.
+
+    Returns:
+        list: Comparisons of the common cases, as dictionaries with the
+              'stage', the 'case', the 'time_ratio' and 'rss_ratio' of the
+              results to the baseline and whether the case is a
+              'regression'.
+    """
+    reference = {(result['stage'], result['case']): result
+                 for result in baseline}
+    comparisons = []
+    for result in results:
+        key = (result['stage'], result['case'])
+        if key not in reference:
+            continue
+        time_ratio = result['wall_time'] / max(reference[key]['wall_time'],
+                                               1e-9)
+        rss_ratio = result['peak_rss_mb'] / reference[key]['peak_rss_mb']
+        regression = time_ratio > 1 + threshold or rss_ratio > 1 + threshold
+        comparisons.append({'stage': key[0], 'case': key[1],
+                            'time_ratio': time_ratio, 'rss_ratio': rss_ratio,
+                            'regression': regression})
+        log = logging.warning if regression else logging.info
+        log(f"{key[0]:<32}{key[1]:<24}time x{time_ratio:.2f}  "
+            f"RSS x{rss_ratio:.2f}{'  REGRESSION' if regression else ''}")
+    return comparisons
+
+
+def main() -> None:
+    """
+    Main function to run the benchmark, save its results to a JSON file and
+    compare them to a baseline.
+
+    Command-line Arguments:
+        --lengths (optional): A comma-separated list of synthetic lengths.
+        --stages (optional): A comma-separated list of stages to run.
+        --repeats (optional): Number of timed repeats per case.
+        --seed (optional): Seed of the synthetic inputs.
+        --engine (optional): Name of the low-level engine.
+        --max_cells (optional): Largest number of cells of a case.
+        --fixtures (optional): Glob pattern of the example sets.
+        --dope (optional): URL or path of the DOPE score data file.
+        --dope_cache (optional): Path of the cached DOPE CA-CA table.
+        --output_file (optional): Path of the JSON results file.
+        --baseline (optional): Path of the JSON results of a baseline run.
+        --threshold (optional): Relative growth flagged as a regression.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the stages of the threading."
+    )
+    parser.add_argument(
+        '--lengths',
+        type=str,
+        default=','.join(map(str, DEFAULT_LENGTHS)),
+        help='Comma-separated lengths of the synthetic templates and '
+             'sequences'
+        )
+    parser.add_argument(
+        '--stages',
+        type=str,
+        default=','.join(STAGES),
+        help='Comma-separated stages to benchmark, default is all stages'
+        )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=3,
+        help='Number of timed repeats per case'
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the synthetic templates and sequences'
+        )
+    parser.add_argument(
+        '--engine',
+        type=str,
+        choices=sorted(LOW_LEVEL_ENGINES),
+        default='batched',
+        help='Low-level engine of fill_low_level_scores and process_template'
+        )
+    parser.add_argument(
+        '--max_cells',
+        type=int,
+        default=MAX_CELLS,
+        help='Largest number of cells of a case, larger cases are skipped'
+        )
+    parser.add_argument(
+        '--fixtures',
+        type=str,
+        default=FIXTURES,
+        help='Glob pattern of the example sets timed end to end'
+        )
+    parser.add_argument(
+        '--dope',
+        type=str,
+        default=DOPE_URL,
+        help='URL or path of the DOPE score data file'
+        )
+    parser.add_argument(
+        '--dope_cache',
+        type=str,
+        default=DOPE_CACHE,
+        help='Path of the cached DOPE CA-CA table (.npy)'
+        )
+    parser.add_argument(
+        '--output_file',
+        type=str,
+        default='benchmark.json',
+        help='Path of the JSON file of the results'
+        )
+    parser.add_argument(
+        '--baseline',
+        type=str,
+        help='JSON results of a baseline run to compare to'
+        )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help='Relative growth of the wall time or peak RSS flagged as a '
+             'regression'
+        )
+
+    args = parser.parse_args()
+
+    stages = args.stages.split(',')
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    lengths = [int(length) for length in args.lengths.split(',')]
+
+    df_dope = load_dope_cached(args.dope, args.dope_cache)
+    cases = benchmark_cases(lengths, stages, args.fixtures, args.max_cells)
+    logging.info(f"Running {len(cases)} benchmark cases...")
+    results = run_benchmarks(cases, df_dope, args.engine, args.repeats,
+                             args.seed)
+
+    report = {
+        'metadata': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'engine': args.engine,
+            'repeats': args.repeats,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['metadata'].get('engine') != args.engine:
+            logging.warning(f"The baseline ran the "
+                            f"{baseline['metadata'].get('engine')} engine")
+        report['comparison'] = compare_to_baseline(
+            results, baseline['results'], args.threshold
+        )
+        regressions = [comparison for comparison in report['comparison']
+                       if comparison['regression']]
+
+    directory = os.path.dirname(args.output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Benchmark results saved to '{args.output_file}'.")
+
+    if regressions:
+        logging.error(f"{len(regressions)} cases regressed by more than "
+                      f"{args.threshold:.0%} against '{args.baseline}'.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Checkpoint Module
+
+This module streams results to an append-only CSV file as they are
+computed, so that a run that crashes or is preempted keeps all the results
+it completed, and a resumed run skips them. Rows are flushed to disk as
+soon as they are written, and a resumed run drops the partial last line
+left by an interrupted write.
+
+The options of the run that change the results, such as the gap score or
+the DOPE table, are saved as a fingerprint in a `<checkpoint_file>.json`
+sidecar, and a run with another fingerprint refuses to resume from the
+file. Rows with a missing value, such as failed pairs, are not counted as
+completed, so a resumed run computes them again.
+
+Functions:
+- open_checkpoint: Opens a checkpoint file for appending, optionally
+  resuming from its completed rows.
+- append_rows: Appends rows to a checkpoint file.
+- load_checkpoint: Reads the rows of a checkpoint file.
+- remove_checkpoint: Removes a checkpoint file once its run is done.
+
+Example:
+    from checkpoint import open_checkpoint, append_rows
+    checkpoint, completed = open_checkpoint('scores_checkpoint.csv',
+                                            ['sequence', 'template', 'score'],
+                                            resume=True,
+                                            fingerprint={'gap_score': 0.0})
+    append_rows(checkpoint, [('1CRN.fasta', '1crn.pdb', -2878.54)])
+    checkpoint.close()
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+import csv
+import json
+import logging
+import os
+
+import pandas as pd
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _drop_partial_line(checkpoint_file: str) -> None:
+    """Truncate a file after its last complete line."""
+    with open(checkpoint_file, 'rb+') as f:
+        content = f.read()
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            logging.warning(f"Dropping a partial line of '{checkpoint_file}'")
+            f.truncate(end)
+
+
+def _load_fingerprint(checkpoint_file: str):
+    """Read the fingerprint of a checkpoint file, or None if it has none."""
+    try:
+        with open(f"{checkpoint_file}.json", 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_fingerprint(checkpoint_file: str, fingerprint: dict) -> None:
+    """Write the fingerprint sidecar of a checkpoint file atomically."""
+    with open(f"{checkpoint_file}.json.tmp", 'w') as f:
+        json.dump(fingerprint, f)
+    os.replace(f"{checkpoint_file}.json.tmp", f"{checkpoint_file}.json")
+
+
+def open_checkpoint(checkpoint_file: str, columns: list,
+                    resume: bool = False, fingerprint: dict = None) -> tuple:
+    """
+    Open a checkpoint file for appending.
+
+    Args:
+        checkpoint_file (str): Path of the checkpoint CSV file.
+        columns (list): Names of the columns of the rows.
+        resume (bool, optional): If True and the file exists, its rows are
+                                 kept and returned. Otherwise the file is
+                                 started over. Defaults to False.
+        fingerprint (dict, optional): Options of the run that change the
+                                      results, saved with the file and
+                                      compared on resume. Values must be
+                                      JSON serializable. Defaults to None.
+
+    Returns:
+        tuple: The file opened for appending and a DataFrame of the
+               completed rows, without the rows with a missing value.
+
+    Raises:
+        ValueError: If the columns or the fingerprint of the file to resume
+                    differ.
+    """
+    directory = os.path.dirname(checkpoint_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if resume and os.path.exists(checkpoint_file) \
+            and os.path.getsize(checkpoint_file) > 0:
+        _drop_partial_line(checkpoint_file)
+        completed = load_checkpoint(checkpoint_file)
+        if list(completed.columns) != list(columns):
+            raise ValueError(f"Cannot resume '{checkpoint_file}': columns "
+                             f"{list(completed.columns)} instead of "
+                             f"{list(columns)}.")
+        # Compare the fingerprints through JSON, as they are saved
+        saved = _load_fingerprint(checkpoint_file)
+        if saved != json.loads(json.dumps(fingerprint)):
+            changed = sorted(key for key in {**(saved or {}),
+                                             **(fingerprint or {})}
+                             if (saved or {}).get(key)
+                             != (fingerprint or {}).get(key))
+            raise ValueError(f"Cannot resume '{checkpoint_file}': it was "
+                             f"written by a run with other options "
+                             f"({', '.join(changed) or 'fingerprint'}).")
+        completed = completed.dropna()
+        logging.info(f"Resuming from {len(completed)} rows of "
+                     f"'{checkpoint_file}'")
+        return open(checkpoint_file, 'a', newline=''), completed
+
+    checkpoint = open(checkpoint_file, 'w', newline='')
+    append_rows(checkpoint, [columns])
+    if fingerprint is not None:
+        _save_fingerprint(checkpoint_file, fingerprint)
+    elif os.path.exists(f"{checkpoint_file}.json"):
+        os.remove(f"{checkpoint_file}.json")
+    return checkpoint, pd.DataFrame(columns=columns)
+
+
+def append_rows(checkpoint, rows: list) -> None:
+    """
+    Append rows to a checkpoint file and flush them to disk.
+
+    Args:
+        checkpoint (file): File returned by open_checkpoint.
+        rows (list): Rows to append, in the order of the columns.
+    """
+    csv.writer(checkpoint).writerows(rows)
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
+
+
+def load_checkpoint(checkpoint_file: str) -> pd.DataFrame:
+    """
+    Read the rows of a checkpoint file.
+
+    Args:
+        checkpoint_file (str): Path of the checkpoint CSV file.
+
+    Returns:
+        pd.DataFrame: The rows of the file, with the 'sequence' and
+                      'template' names read as strings.
+    """
+    return pd.read_csv(checkpoint_file, keep_default_na=False,
+                       na_values=['', 'nan', 'NaN'],
+                       dtype={'sequence': str, 'template': str})
+
+
+def remove_checkpoint(checkpoint_file: str) -> None:
+    """
+    Remove a checkpoint file and its fingerprint, once the results of its
+    run are saved.
+
+    Args:
+        checkpoint_file (str): Path of the checkpoint CSV file.
+    """
+    for path in [checkpoint_file, f"{checkpoint_file}.json"]:
+        if os.path.exists(path):
+            os.remove(path)
@@ -5,6 +5,9 @@ Configuration and constants for the protein threading algorithm.
 # DOPE score URL
 DOPE_URL = "https://www.dsimb.inserm.fr/~gelly/doc/dope.par"
 
+# Local binary cache of the DOPE CA-CA table
+DOPE_CACHE = 'data/dope_ca.npy'
+
 # Directory paths
 TEMPLATES_DIR = 'data/example1/structures/'
 SEQUENCES_DIR = 'data/example1/sequences/'
@@ -0,0 +1,324 @@
+"""
+Template Energy Profile Module
+
+This module precomputes, for a template, the DOPE energies of every pair of
+template positions for every pair of residue types. The energies used by the
+dynamic programming engines only depend on the residue types at two sequence
+positions and on the template distance between two positions, so a profile
+is built once per template and reused for every query sequence, shuffle and
+gap score: the engines only gather values from it.
+
+With a distance cutoff, only the pairs of template positions within the
+cutoff (the contacts) are scored, and all the other pairs share a single
+far-field table, the DOPE scores beyond the last DOPE distance. The cost and
+the size of such a profile scale with the number of contacts instead of n^2,
+and a cutoff at or beyond the last DOPE distance gives the exact energies.
+
+Profiles are kept in an in-memory LRU cache, bounded by the bytes of the
+profiles it holds, and dense profiles can be persisted on disk as .npy
+files, keyed by a hash of the distance matrix, of the DOPE table and of the
+cutoff.
+
+Classes:
+- TemplateProfile: DOPE energies of a template for all residue-type pairs.
+- ContactProfile: DOPE energies of the contacts of a template within a
+  distance cutoff, with a far-field table for all the other pairs.
+
+Functions:
+- build_template_profile: Builds the profile of a distance matrix.
+- get_template_profile: Returns a profile through the in-memory and on-disk
+  caches.
+
+Example:
+    from energy_profile import get_template_profile
+    profile = get_template_profile(dist_matrix, df_dope)
+    energies = profile.low_level_energies(i, codes[j], codes)
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from process_dope import compile_dope, find_dope_scores
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Bytes of the profiles kept in the in-memory cache of each process, on top
+# of the most recent profile, which is always kept
+PROFILE_CACHE_BYTES = 2**28
+
+# Number of contacts scored at once when building a contact profile
+CONTACT_CHUNK = 4096
+
+_profile_cache = OrderedDict()
+
+
+class TemplateProfile:
+    """
+    DOPE energies of a template for all pairs of residue types.
+
+    Attributes:
+        energies (np.ndarray): Energies with shape (n, n, 20, 20), where
+            energies[i, k, a, b] is the DOPE score between residue codes a
+            and b at the template distance dist_matrix[i, k].
+        key (str): Hash of the distance matrix and of the DOPE table.
+    """
+
+    def __init__(self, energies: np.ndarray, key: str = None):
+        self.energies = energies
+        self.key = key
+
+    @property
+    def n(self) -> int:
+        """Number of template positions."""
+        return self.energies.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory footprint of the energies."""
+        return self.energies.nbytes
+
+    def low_level_energies(self, i: int, code_j: int,
+                           codes: np.ndarray) -> np.ndarray:
+        """
+        Gather the energies of the low-level matrix fixing (i, j).
+
+        Args:
+            i (int): Template position fixed by the low-level matrix.
+            code_j (int): Residue code of the sequence position j.
+            codes (np.ndarray): Residue codes of the sequence.
+
+        Returns:
+            np.ndarray: Energies with shape (n, m), where [k, l] is the DOPE
+                        score between sequence[j] and sequence[l] at
+                        dist_matrix[i, k].
+        """
+        return self.energies[i, :, code_j, :][:, codes]
+
+    def origin_energies(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Gather the energies of the origins of all low-level matrices.
+
+        Args:
+            codes (np.ndarray): Residue codes of the sequence.
+
+        Returns:
+            np.ndarray: Energies with shape (n, m), where [i, j] is the DOPE
+                        score between sequence[0] and sequence[j] at
+                        dist_matrix[0, i].
+        """
+        return self.energies[0, :, codes[0], :][:, codes]
+
+    def pair_energies(self, i, k, code_a, code_b) -> np.ndarray:
+        """
+        Gather the energies of arrays of template positions and residue codes.
+
+        Args:
+            i (array_like): First template positions.
+            k (array_like): Second template positions.
+            code_a (array_like): Residue codes at the first positions.
+            code_b (array_like): Residue codes at the second positions.
+
+        Returns:
+            np.ndarray: Energies with the broadcast shape of the arguments.
+        """
+        return self.energies[i, k, code_a, code_b]
+
+
+class ContactProfile(TemplateProfile):
+    """
+    DOPE energies of the contacts of a template within a distance cutoff.
+
+    Attributes:
+        table (np.ndarray): Energies with shape (n_contacts + 1, 20, 20), 
+            where table[0] is the far-field table shared by all the pairs 
+            beyond the cutoff and table[c] holds the energies of contact c.
+        contacts (np.ndarray): Indices into table with shape (n, n), 0 for 
+            the pairs beyond the cutoff.
+        cutoff (float): Distance cutoff of the contacts.
+        key (str): Hash of the distance matrix, DOPE table and cutoff.
+    """
+
+    def __init__(self, table: np.ndarray, contacts: np.ndarray,
+                 cutoff: float, key: str = None):
+        self.table = table
+        self.contacts = contacts
+        self.cutoff = cutoff
+        self.key = key
+
+    @property
+    def n(self) -> int:
+        """Number of template positions."""
+        return self.contacts.shape[0]
+
+    @property
+    def n_contacts(self) -> int:
+        """Number of pairs of template positions within the cutoff."""
+        return self.table.shape[0] - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Memory footprint of the table and of the contact indices."""
+        return self.table.nbytes + self.contacts.nbytes
+
+    def low_level_energies(self, i: int, code_j: int,
+                           codes: np.ndarray) -> np.ndarray:
+        """See TemplateProfile.low_level_energies."""
+        return self.table[self.contacts[i][:, None], code_j, codes[None, :]]
+
+    def origin_energies(self, codes: np.ndarray) -> np.ndarray:
+        """See TemplateProfile.origin_energies."""
+        return self.table[self.contacts[0][:, None], codes[0], 
+                          codes[None, :]]
+
+    def pair_energies(self, i, k, code_a, code_b) -> np.ndarray:
+        """See TemplateProfile.pair_energies."""
+        return self.table[self.contacts[i, k], code_a, code_b]
+
+
+def _profile_key(dist_matrix: np.ndarray, dope_tensor: np.ndarray,
+                 cutoff: float = None) -> str:
+    """Hash a distance matrix together with a DOPE table and a cutoff."""
+    digest = hashlib.sha256()
+    digest.update(str(dist_matrix.shape).encode())
+    digest.update(np.ascontiguousarray(dist_matrix, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(dope_tensor).tobytes())
+    if cutoff is not None:
+        digest.update(f"cutoff={float(cutoff)!r}".encode())
+    return digest.hexdigest()
+
+
+def build_template_profile(dist_matrix: np.ndarray, df_dope: pd.DataFrame,
+                           cutoff: float = None) -> TemplateProfile:
+    """
+    Build the energy profile of a template.
+
+    Args:
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        cutoff (float, optional): Distance cutoff of the contacts. A dense 
+                                  profile is built if None. Defaults to None.
+
+    Returns:
+        TemplateProfile: The energy profile of the template.
+    """
+    dope_tensor, dope_distances = compile_dope(df_dope)
+    key = _profile_key(dist_matrix, dope_tensor, cutoff)
+    if cutoff is not None:
+        return _build_contact_profile(dist_matrix, dope_tensor, 
+                                      dope_distances, cutoff, key)
+    return _build_profile(dist_matrix, dope_tensor, dope_distances, key)
+
+
+def _build_profile(dist_matrix: np.ndarray, dope_tensor: np.ndarray,
+                   dope_distances: np.ndarray, key: str) -> TemplateProfile:
+    """Score every residue-type pair at every template distance."""
+    n = dist_matrix.shape[0]
+    n_residues = dope_tensor.shape[0]
+    logging.debug(f"Building energy profile of a template with {n} residues")
+    residues = np.arange(n_residues)
+    energies = np.empty((n, n, n_residues, n_residues), dtype=float)
+    for i in range(n):
+        energies[i] = find_dope_scores(
+            residues[None, :, None], residues[None, None, :],
+            dist_matrix[i][:, None, None], dope_tensor, dope_distances
+        )
+    return TemplateProfile(energies, key)
+
+
+def _build_contact_profile(dist_matrix: np.ndarray, dope_tensor: np.ndarray,
+                           dope_distances: np.ndarray, cutoff: float,
+                           key: str) -> ContactProfile:
+    """Score the contacts of a template and the far-field residue pairs."""
+    n = dist_matrix.shape[0]
+    n_residues = dope_tensor.shape[0]
+    residues = np.arange(n_residues)
+
+    # Neighbour list of the template within the cutoff
+    rows, cols = np.nonzero(dist_matrix <= cutoff)
+    contacts = np.zeros((n, n), dtype=np.int32)
+    contacts[rows, cols] = np.arange(1, len(rows) + 1)
+    logging.debug(f"Building contact profile of a template with {n} residues "
+                  f"and {len(rows)} contacts within {cutoff} A")
+
+    table = np.empty((len(rows) + 1, n_residues, n_residues), dtype=float)
+    table[0] = find_dope_scores(residues[:, None], residues[None, :],
+                                dope_distances[-1], dope_tensor, 
+                                dope_distances)
+    for start in range(0, len(rows), CONTACT_CHUNK):
+        chunk = slice(start, start + CONTACT_CHUNK)
+        distances = dist_matrix[rows[chunk], cols[chunk]]
+        table[start + 1:start + 1 + len(distances)] = find_dope_scores(
+            residues[None, :, None], residues[None, None, :],
+            distances[:, None, None], dope_tensor, dope_distances
+        )
+    return ContactProfile(table, contacts, cutoff, key)
+
+
+def get_template_profile(dist_matrix: np.ndarray, df_dope: pd.DataFrame,
+                         cache_dir: str = None,
+                         cutoff: float = None) -> TemplateProfile:
+    """
+    Return the energy profile of a template through the caches.
+
+    Profiles are looked up in the in-memory cache of the process, then in
+    `cache_dir` if it is set, and are built (and saved to `cache_dir`) only
+    if neither holds them. Contact profiles are cheap to build and are only
+    kept in memory. The least recently used profiles are evicted from memory
+    once the others exceed PROFILE_CACHE_BYTES.
+
+    Args:
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        cache_dir (str, optional): Directory of the on-disk profile cache.
+                                   Defaults to None.
+        cutoff (float, optional): Distance cutoff of the contacts. A dense 
+                                  profile is used if None. Defaults to None.
+
+    Returns:
+        TemplateProfile: The energy profile of the template.
+    """
+    dope_tensor, dope_distances = compile_dope(df_dope)
+    key = _profile_key(dist_matrix, dope_tensor, cutoff)
+
+    if key in _profile_cache:
+        _profile_cache.move_to_end(key)
+        return _profile_cache[key]
+
+    profile_file = os.path.join(cache_dir, f"{key}.npy") \
+        if cache_dir and cutoff is None else None
+    if cutoff is not None:
+        profile = _build_contact_profile(dist_matrix, dope_tensor,
+                                         dope_distances, cutoff, key)
+    elif profile_file and os.path.exists(profile_file):
+        logging.debug(f"Loading energy profile from '{profile_file}'")
+        profile = TemplateProfile(np.load(profile_file, mmap_mode='r'), key)
+    else:
+        profile = _build_profile(dist_matrix, dope_tensor, dope_distances,
+                                 key)
+        if profile_file:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(f"{profile_file}.{os.getpid()}.tmp", 'wb') as f:
+                np.save(f, profile.energies)
+            os.replace(f"{profile_file}.{os.getpid()}.tmp", profile_file)
+            logging.debug(f"Energy profile saved to '{profile_file}'")
+
+    _profile_cache[key] = profile
+    cached_bytes = sum(cached.nbytes for cached in _profile_cache.values())
+    while cached_bytes - profile.nbytes > PROFILE_CACHE_BYTES:
+        cached_bytes -= _profile_cache.popitem(last=False)[1].nbytes
+    return profile
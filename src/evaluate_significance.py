@@ -15,22 +15,48 @@ Features:
   is less than 30, logging warnings if the distribution is not normal.
 - Compute z-scores for the original sequences based on the energy score 
   distribution of shuffled sequences.
+- Optionally add shuffles in batches and stop each sequence-template pair 
+  as soon as its z-score is settled (adaptive mode).
+- Stream the z-scores of each sequence to a checkpoint file as soon as it 
+  is done, and resume interrupted runs from it.
+- Optionally time the stages of each task in the workers, and save a JSON 
+  summary and a Chrome trace of the run.
 - Save the calculated z-scores to a CSV file.
 
 Usage:
     python script.py --input_csv <path_to_input_csv> \
                      --output_file <path_to_output_csv> \
                      --gap_score <gap_score> \
-                     --n_shuffles <number_of_shuffles>
+                     --n_shuffles <number_of_shuffles> \
+                     [--dope <dope_file>] [--dope_cache <dope_cache>] \
+                     [--library <library_file>] [--fasta <fasta_file>] \
+                     [--seed <seed>] [--adaptive] [--batch_size <size>] \
+                     [--z_tolerance <tolerance>] [--resume] [--profile]
 
 Arguments:
     --input_csv : Path to the input CSV file with sequence and template scores.
     --output_file : Path where the output CSV file with z-scores will be saved.
     --gap_score : The gap score to use for energy calculation.
     --n_shuffles : The number of times to shuffle each sequence.
+    --dope : URL or path of the DOPE score data file.
+    --dope_cache : Path of the cached DOPE CA-CA table.
+    --library : Path of a compiled template library.
+    --fasta : Multi-record FASTA file holding the sequences of the input CSV.
+    --seed : Seed of the shuffles, for reproducible z-scores.
+    --adaptive : Add shuffles in batches, up to --n_shuffles, until the 
+                 z-score of each pair is settled.
+    --batch_size : Number of shuffles added per batch in adaptive mode.
+    --z_tolerance : Half-width of the z-score confidence interval at which 
+                    adaptive mode stops a pair.
+    --resume : Skip the sequences already saved to the checkpoint file 
+               `<output_file>_checkpoint.csv` by an interrupted run.
+    --profile : Save the timings of the stages of each task to 
+                `<output_file>_profile.json` and a Chrome trace to 
+                `<output_file>_trace.json`.
 """
 
 import argparse
+import hashlib
 import pandas as pd
 import numpy as np
 import logging
@@ -38,9 +64,15 @@ from tqdm import tqdm
 import os
 from scipy.stats import shapiro
 
-from config import DOPE_URL, TEMPLATES_DIR, SEQUENCES_DIR
-from load_data import load_dope, read_fasta
-from main import process_sequences_and_templates
+from checkpoint import (append_rows, load_checkpoint, open_checkpoint, 
+                        remove_checkpoint)
+from config import DOPE_CACHE, DOPE_URL, TEMPLATES_DIR, SEQUENCES_DIR
+from load_data import (load_dope_cached, read_fasta, read_fasta_index,
+                       fetch_fasta_records)
+from main import process_sequence_batch
+from profiling import enable_profiling, export_profile
+from result_cache import engine_key, hash_dope, hash_sequence
+from shared_store import shared_store
 
 
 # Configure logging
@@ -48,22 +80,37 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Z-score below which a sequence-template match is significant
+SIGNIFICANCE_THRESHOLD = -1.96
 
-def shuffle_sequence(sequence, n_shuffles):
+# Critical value of the 95% confidence interval of the z-scores
+CONFIDENCE_CRITICAL = 1.96
+
+
+def shuffle_sequence(sequence, n_shuffles, seed=None):
     """Generate multiple shuffled versions of a sequence.
 
+    Every shuffle is drawn from its own random stream spawned from `seed`, 
+    so the shuffles only depend on the seed, and not on the number of 
+    workers or on the order in which sequences are processed. Successive 
+    calls with the same SeedSequence continue its streams.
+
     Args:
         sequence (str): The sequence to shuffle.
         n_shuffles (int): The number of shuffled sequences to generate.
+        seed (numpy.random.SeedSequence or int, optional): The seed of the 
+            shuffles, fresh entropy if None.
 
     Returns:
         list: A list of shuffled sequences.
     """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
     sequence_list = list(sequence)
-    shuffled_sequences = []
-    for _ in range(n_shuffles):
-        np.random.shuffle(sequence_list)
-        shuffled_sequences.append(''.join(sequence_list))
+    shuffled_sequences = [
+        ''.join(np.random.default_rng(stream).permutation(sequence_list))
+        for stream in seed.spawn(n_shuffles)
+    ]
     logging.debug(f"{n_shuffles} shuffled sequences generated.")
     return shuffled_sequences
 
@@ -85,6 +132,38 @@ def calculate_z_scores(original_scores, shuffled_scores):
     return np.round(z_scores, 2)
 
 
+def z_score_settled(original_score, shuffled_scores, 
+                    tolerance=0.25, threshold=SIGNIFICANCE_THRESHOLD):
+    """Check whether more shuffles can still change a z-score meaningfully.
+
+    The standard error of a z-score estimated from S shuffles, with both 
+    the mean and the standard deviation estimated, is about 
+    sqrt((1 + z^2 / 2) / S). The z-score is settled when its 95% confidence 
+    interval is narrower than the tolerance, or lies entirely on one side 
+    of the significance threshold.
+
+    Args:
+        original_score (float): The original sequence energy score.
+        shuffled_scores (numpy.ndarray): The shuffled sequences energy scores.
+        tolerance (float): Largest half-width of a settled interval.
+        threshold (float): The significance threshold of the z-scores.
+
+    Returns:
+        bool: True if the z-score is settled.
+    """
+    std_shuffled = np.std(shuffled_scores)
+    if len(shuffled_scores) < 2 or std_shuffled == 0:
+        return False
+    z_score = (original_score - np.mean(shuffled_scores)) / std_shuffled
+    if np.isnan(z_score):
+        return True
+    half_width = CONFIDENCE_CRITICAL * np.sqrt(
+        (1 + z_score**2 / 2) / len(shuffled_scores)
+    )
+    return (half_width <= tolerance or z_score + half_width < threshold 
+            or z_score - half_width > threshold)
+
+
 def perform_shapiro_test(shuffled_energy_scores, seq_file):
     """Perform Shapiro-Wilk test to check for normality of the shuffled scores.
 
@@ -104,9 +183,13 @@ def perform_shapiro_test(shuffled_energy_scores, seq_file):
 
 
 def process_sequence(df, seq_file, original_seq, templates, df_dope, 
-                     templates_dir, gap_score, n_shuffles):
+                     templates_dir, gap_score, n_shuffles, library=None,
+                     store=None, seed=None):
     """Process a single sequence: shuffle, calculate energies, and z-scores.
 
+    All the shuffles have the length of the original sequence, so they are 
+    scored as a single batch per template with process_sequence_batch.
+
     Args:
         df (pandas.DataFrame): The DataFrame containing energy scores.
         seq_file (str): The sequence file name.
@@ -116,6 +199,10 @@ def process_sequence(df, seq_file, original_seq, templates, df_dope,
         templates_dir (str): The templates directory path.
         gap_score (float): The gap score to use for energy calculation.
         n_shuffles (int): The number of shuffled sequences to generate.
+        library (str): Path of a compiled template library, or None.
+        store (str): Shared store of the DOPE table and of the templates, 
+                     or None.
+        seed (numpy.random.SeedSequence): Seed of the shuffles, or None.
 
     Returns:
         numpy.ndarray: Z-scores for the original sequence.
@@ -123,19 +210,18 @@ def process_sequence(df, seq_file, original_seq, templates, df_dope,
     logging.info(f"Processing sequence {seq_file}...")
 
     # Generate shuffled sequences
-    shuffled_sequences = shuffle_sequence(original_seq, n_shuffles)
-
-    # Calculate energy scores for the shuffled sequences
-    shuffled_energy_scores = []
-    for shuffled_seq in shuffled_sequences:
-        shuffled_energy = process_sequences_and_templates(
-            sequences=[(seq_file, shuffled_seq)],
-            templates=templates,
-            df_dope=df_dope,
-            templates_dir=templates_dir,
-            gap_score=gap_score
-        )
-        shuffled_energy_scores.append(shuffled_energy)
+    shuffled_sequences = shuffle_sequence(original_seq, n_shuffles, seed)
+
+    # Calculate energy scores for the shuffled sequences, in one batch
+    shuffled_energy_scores = process_sequence_batch(
+        sequences=shuffled_sequences,
+        templates=templates,
+        df_dope=df_dope,
+        templates_dir=templates_dir,
+        gap_score=gap_score,
+        library=library,
+        store=store
+    )
 
     # Perform Shapiro-Wilk test if n_shuffles < 30
     if n_shuffles < 30:
@@ -145,14 +231,94 @@ def process_sequence(df, seq_file, original_seq, templates, df_dope,
     original_energy_scores = df.loc[seq_file].values
 
     # Calculate z-scores
-    shuffled_energy_scores_array = np.array(shuffled_energy_scores)
     z_scores = calculate_z_scores(original_energy_scores, 
-                                  shuffled_energy_scores_array)
+                                  shuffled_energy_scores)
 
     return z_scores
 
 
-def main(input_csv, output_file, gap_score, n_shuffles):
+def process_sequence_adaptive(df, seq_file, original_seq, templates, df_dope,
+                              templates_dir, gap_score, max_shuffles, 
+                              batch_size, tolerance, library=None, 
+                              store=None, seed=None):
+    """Process a single sequence with an adaptive number of shuffles.
+
+    Shuffles are scored in batches against the templates whose z-score is 
+    not settled yet (see z_score_settled), until every z-score is settled 
+    or `max_shuffles` shuffles have been scored. The shuffles are drawn in 
+    the same order as in process_sequence, so every template sees a prefix 
+    of the same shuffles.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing energy scores.
+        seq_file (str): The sequence file name.
+        original_seq (str): The original sequence.
+        templates (list): The list of templates.
+        df_dope (pandas.DataFrame): The DOPE scores DataFrame.
+        templates_dir (str): The templates directory path.
+        gap_score (float): The gap score to use for energy calculation.
+        max_shuffles (int): The largest number of shuffles per template.
+        batch_size (int): The number of shuffles added per batch.
+        tolerance (float): Largest half-width of a settled z-score interval.
+        library (str): Path of a compiled template library, or None.
+        store (str): Shared store of the DOPE table and of the templates, 
+                     or None.
+        seed (numpy.random.SeedSequence): Seed of the shuffles, or None.
+
+    Returns:
+        tuple: Z-scores for the original sequence and number of shuffles 
+               used for each template.
+    """
+    logging.info(f"Processing sequence {seq_file} adaptively...")
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    original_energy_scores = df.loc[seq_file].values.astype(float)
+
+    shuffled_energy_scores = [[] for _ in templates]
+    active = list(range(len(templates)))
+    n_used = 0
+    while active and n_used < max_shuffles:
+        shuffled_sequences = shuffle_sequence(
+            original_seq, min(batch_size, max_shuffles - n_used), seed
+        )
+        batch_scores = process_sequence_batch(
+            sequences=shuffled_sequences,
+            templates=[templates[t] for t in active],
+            df_dope=df_dope,
+            templates_dir=templates_dir,
+            gap_score=gap_score,
+            library=library,
+            store=store
+        )
+        n_used += len(shuffled_sequences)
+        for column, t in enumerate(active):
+            shuffled_energy_scores[t].extend(batch_scores[:, column])
+
+        # Keep the templates whose z-score is not settled yet
+        active = [t for t in active if not z_score_settled(
+            original_energy_scores[t], shuffled_energy_scores[t], tolerance
+        )]
+        logging.debug(f"{n_used} shuffles scored, {len(active)} templates "
+                      f"not settled.")
+
+    # Perform Shapiro-Wilk test if max_shuffles < 30
+    if max_shuffles < 30:
+        perform_shapiro_test(np.concatenate(shuffled_energy_scores), seq_file)
+
+    z_scores = np.array([
+        calculate_z_scores(original_energy_scores[t], 
+                           np.array(shuffled_energy_scores[t]))
+        for t in range(len(templates))
+    ])
+    n_shuffles_used = np.array([len(scores) 
+                                for scores in shuffled_energy_scores])
+    return z_scores, n_shuffles_used
+
+
+def main(input_csv, output_file, gap_score, n_shuffles, 
+         dope=DOPE_URL, dope_cache=DOPE_CACHE, library=None, fasta=None,
+         seed=None, adaptive=False, batch_size=10, z_tolerance=0.25,
+         resume=False, profile=False):
     """Main function to shuffle sequences and calculate z-scores.
 
     Args:
@@ -160,6 +326,32 @@ def main(input_csv, output_file, gap_score, n_shuffles):
         output_file (str): Path to save the output CSV file.
         gap_score (float): Gap score to use for energy calculation.
         n_shuffles (int): Number of times to shuffle each sequence.
+        dope (str): URL or path of the DOPE score data file.
+        dope_cache (str): Path of the cached DOPE CA-CA table.
+        library (str): Path of a compiled template library, or None.
+        fasta (str): Multi-record FASTA file to read the sequences from by 
+                     record ID, or None to read them from SEQUENCES_DIR.
+        seed (int): Seed of the shuffles, or None for fresh entropy. Each 
+                    sequence of the input CSV gets its own seed spawned from 
+                    it, by row.
+        adaptive (bool): If True, use at most n_shuffles shuffles per pair, 
+                         added in batches until the z-score is settled, and 
+                         save the number of shuffles used per pair to 
+                         `<output_file>_n_shuffles.csv`.
+        batch_size (int): Number of shuffles added per batch in adaptive 
+                          mode.
+        z_tolerance (float): Half-width of the z-score confidence interval 
+                             at which adaptive mode stops a pair.
+        resume (bool): If True, skip the sequences already saved to the 
+                       checkpoint file `<output_file>_checkpoint.csv`, to 
+                       which the z-scores of each sequence are streamed as 
+                       soon as it is done, until the z-scores are saved. 
+                       The sequences with a failed pair 
+                       are processed again, and a checkpoint written with 
+                       other options, input scores or sequences is refused.
+        profile (bool): If True, save the timings of the stages of each task 
+                        to `<output_file>_profile.json` and a Chrome trace 
+                        to `<output_file>_trace.json`.
     """
     logging.debug("Starting the z-score calculation process.")
     
@@ -167,6 +359,14 @@ def main(input_csv, output_file, gap_score, n_shuffles):
     if n_shuffles < 1:
         logging.error("Number of shuffles must be greater than 1.")
         return
+
+    # Check the batches and the tolerance of adaptive mode
+    if batch_size < 1:
+        logging.error("Batch size must be at least 1.")
+        return
+    if z_tolerance <= 0:
+        logging.error("Z-score tolerance must be positive.")
+        return
     
     # Warn if n_shuffles is < 30
     if n_shuffles < 30:
@@ -187,34 +387,139 @@ def main(input_csv, output_file, gap_score, n_shuffles):
     templates = df.columns.tolist()
 
     # Load DOPE scores
-    df_dope = load_dope(DOPE_URL)
-
-    # Initialize a DataFrame to hold z-scores
-    z_scores_df = pd.DataFrame(index=sequences, columns=templates)
-
-    # Process each sequence and calculate z-scores
-    for seq_file in tqdm(sequences[::-1], desc="Processing sequences"):
-        fasta_path = os.path.join(SEQUENCES_DIR, seq_file)
-        if not os.path.exists(fasta_path):
-            logging.warning(f"FASTA file {fasta_path} not found, skipping.")
-            continue
-
-        # Load the original sequence
-        original_seq = read_fasta(fasta_path)
-
-        # Process the sequence
-        z_scores = process_sequence(
-            df, seq_file, original_seq, templates, df_dope, 
-            TEMPLATES_DIR, gap_score, n_shuffles
+    df_dope = load_dope_cached(dope, dope_cache)
+
+    stem = os.path.splitext(output_file)[0]
+    if profile:
+        enable_profiling()
+
+    # Stream the z-scores and numbers of shuffles of each pair to a 
+    # checkpoint file, and skip the sequences it already holds on resume, 
+    # provided the options and the input scores of the run are the same
+    checkpoint_file = f"{stem}_checkpoint.csv"
+    fingerprint = {
+        'gap_score': float(gap_score), 'dope': hash_dope(df_dope), 
+        'engine': engine_key(), 'n_shuffles': n_shuffles, 'seed': seed, 
+        'adaptive': adaptive, 'batch_size': batch_size, 
+        'z_tolerance': z_tolerance,
+        'scores': hashlib.sha256(
+            pd.util.hash_pandas_object(df).to_numpy().tobytes()
+        ).hexdigest()
+    }
+    try:
+        checkpoint, completed_df = open_checkpoint(
+            checkpoint_file, 
+            ['sequence', 'template', 'sequence_hash', 'z_score', 
+             'n_shuffles'], 
+            resume, fingerprint
         )
-
-        # Store z-scores in the DataFrame
-        z_scores_df.loc[seq_file] = z_scores
+    except ValueError as e:
+        logging.error(e)
+        return
+    completed = {
+        seq_file: rows['sequence_hash'].iloc[0] 
+        for seq_file, rows in completed_df.groupby('sequence')
+        if set(templates) <= set(rows['template'])
+    }
+
+    # Spawn one seed per sequence, by row of the input CSV
+    root_seed = np.random.SeedSequence(seed)
+    logging.info(f"Shuffle seed: {root_seed.entropy}")
+    sequence_seeds = dict(zip(sequences, root_seed.spawn(len(sequences))))
+
+    # Index the records of the multi-record FASTA file
+    fasta_index = read_fasta_index(fasta) if fasta else None
+
+    # Process each sequence and calculate z-scores, with the DOPE table and 
+    # the templates shared once with the workers of all the shuffles
+    try:
+        with shared_store(df_dope, templates, TEMPLATES_DIR, library) as store:
+            for seq_file in tqdm(sequences[::-1], desc="Processing sequences"):
+                if fasta:
+                    if seq_file not in fasta_index:
+                        logging.warning(f"Record {seq_file} not found in "
+                                        f"{fasta}, skipping.")
+                        continue
+                    _, original_seq = next(fetch_fasta_records(
+                        fasta, [seq_file], index=fasta_index
+                    ))
+                else:
+                    fasta_path = os.path.join(SEQUENCES_DIR, seq_file)
+                    if not os.path.exists(fasta_path):
+                        logging.warning(f"FASTA file {fasta_path} not found, "
+                                        f"skipping.")
+                        continue
+
+                    # Load the original sequence
+                    original_seq = read_fasta(fasta_path)
+
+                sequence_hash = hash_sequence(original_seq)
+                if seq_file in completed:
+                    if completed[seq_file] != sequence_hash:
+                        logging.error(f"Cannot resume '{checkpoint_file}': "
+                                      f"the sequence of {seq_file} "
+                                      f"changed.")
+                        return
+                    logging.debug(f"Sequence {seq_file} already done, "
+                                  f"skipping.")
+                    continue
+
+                # Process the sequence
+                if adaptive:
+                    z_scores, n_shuffles_used = process_sequence_adaptive(
+                        df, seq_file, original_seq, templates, df_dope, 
+                        TEMPLATES_DIR, gap_score, n_shuffles, batch_size, 
+                        z_tolerance, library, store, sequence_seeds[seq_file]
+                    )
+                else:
+                    z_scores = process_sequence(
+                        df, seq_file, original_seq, templates, df_dope, 
+                        TEMPLATES_DIR, gap_score, n_shuffles, library, store,
+                        sequence_seeds[seq_file]
+                    )
+                    n_shuffles_used = [n_shuffles] * len(templates)
+
+                # Stream the z-scores of the sequence to the checkpoint file
+                append_rows(checkpoint, list(zip([seq_file] * len(templates), 
+                                                 templates, 
+                                                 [sequence_hash] 
+                                                 * len(templates), 
+                                                 z_scores, 
+                                                 n_shuffles_used)))
+    finally:
+        checkpoint.close()
+
+    # Read the z-scores and numbers of shuffles back, in the order of the 
+    # input CSV
+    rows = load_checkpoint(checkpoint_file).drop_duplicates(
+        ['sequence', 'template'], keep='last'
+    )
+    z_scores_df, n_shuffles_df = [
+        rows.pivot(index='sequence', columns='template', values=values)
+        .reindex(index=sequences, columns=templates)
+        .rename_axis(index=None, columns=None)
+        for values in ['z_score', 'n_shuffles']
+    ]
 
     # Save the z-scores to an output file
     z_scores_df.to_csv(output_file)
     logging.info(f"Z-scores saved to {output_file}")
 
+    # Save the numbers of shuffles used per pair
+    if adaptive:
+        n_shuffles_file = f"{stem}_n_shuffles.csv"
+        n_shuffles_df.to_csv(n_shuffles_file)
+        used = n_shuffles_df.to_numpy(dtype=float)
+        logging.info(f"Adaptive mode used {np.nansum(used):.0f} shuffles out "
+                     f"of {np.sum(~np.isnan(used)) * n_shuffles}. Numbers of "
+                     f"shuffles saved to {n_shuffles_file}")
+
+    # The checkpoint is only kept until the z-scores are saved
+    remove_checkpoint(checkpoint_file)
+
+    if profile:
+        export_profile(f"{stem}_profile.json", f"{stem}_trace.json")
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -244,8 +549,70 @@ if __name__ == '__main__':
         default=100,
         help='Number of times to shuffle each sequence.' 
     )
+    parser.add_argument(
+        '--dope',
+        type=str,
+        default=DOPE_URL,
+        help='URL or path of the DOPE score data file.'
+    )
+    parser.add_argument(
+        '--dope_cache',
+        type=str,
+        default=DOPE_CACHE,
+        help='Path of the cached DOPE CA-CA table (.npy).'
+    )
+    parser.add_argument(
+        '--library',
+        type=str,
+        help='Compiled template library to read the templates from.'
+    )
+    parser.add_argument(
+        '--fasta',
+        type=str,
+        help='Multi-record FASTA file holding the sequences by record ID.'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed of the shuffles, default is fresh entropy (logged).'
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='Add shuffles in batches, up to --n_shuffles, until the z-score '
+             'of each pair is settled.'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=10,
+        help='Number of shuffles added per batch in adaptive mode.'
+    )
+    parser.add_argument(
+        '--z_tolerance',
+        type=float,
+        default=0.25,
+        help='Half-width of the z-score confidence interval at which '
+             'adaptive mode stops a pair.'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Skip the sequences already saved to the checkpoint file '
+             '<output_file stem>_checkpoint.csv by an interrupted run.'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Save the timings of the stages of each task to '
+             '<output_file stem>_profile.json and a Chrome trace to '
+             '<output_file stem>_trace.json.'
+    )
 
     args = parser.parse_args()
 
     # Run the main function with parsed arguments
-    main(args.input_csv, args.output_file, args.gap_score, args.n_shuffles)
+    main(args.input_csv, args.output_file, args.gap_score, args.n_shuffles,
+         args.dope, args.dope_cache, args.library, args.fasta, args.seed,
+         args.adaptive, args.batch_size, args.z_tolerance, args.resume,
+         args.profile)
@@ -8,19 +8,36 @@ threading algorithms used in sequence-structure prediction.
 
 Functions:
 - read_fasta: Reads a FASTA file and returns the sequence as a string.
+- iter_fasta: Streams the records of a multi-record FASTA file.
+- index_fasta: Writes a .fai offset index of a multi-record FASTA file.
+- read_fasta_index: Reads (and refreshes) the .fai index of a FASTA file.
+- fetch_fasta_records: Reads selected records of an indexed FASTA file.
 - pdb_to_c_alpha_coordinates: Converts a PDB file to a numpy array of 
   C-alpha coordinates.
+- read_c_alpha: Streams a PDB or mmCIF file and returns the residue sequence 
+  and the C-alpha coordinates of its first model.
+- read_c_alpha_directory: Runs read_c_alpha on all the structure files of a 
+  directory with a pool of workers.
 - coordinates_to_distance_matrix: Converts a numpy array of coordinates 
   to a distance matrix.
+- coordinates_to_distance_matrices: Converts a list of coordinate arrays 
+  to distance matrices in a single vectorized pass.
 - load_dope: Loads and prepares the DOPE score data from the given URL.
+- load_dope_cached: Loads the DOPE score data through a local binary cache 
+  which is memory-mapped on later runs.
+- save_dope_table: Saves a DOPE table as a .npy file and a JSON sidecar.
+- load_dope_table: Memory-maps a DOPE table saved by save_dope_table.
 
 Usage:
     This module can be imported and used to preprocess data for threading
     algorithms in sequence-structure prediction. 
 
 Example:
-    from load_data import read_fasta, pdb_to_c_alpha_coordinates, \
-                             coordinates_to_distance_matrix, load_dope
+    from load_data import read_fasta, iter_fasta, fetch_fasta_records, \
+                             pdb_to_c_alpha_coordinates, \
+                             read_c_alpha, read_c_alpha_directory, \
+                             coordinates_to_distance_matrix, load_dope, \
+                             load_dope_cached
 """
 
 __authors__ = "Nadezhda Zhukova"
@@ -30,9 +47,17 @@ __date__ = "2024-09-06"
 __version__ = "1.0.0"
 
 
+import gzip
+import hashlib
+import io
+import json
 import logging
+from multiprocessing import cpu_count
 import os
+import shlex
+import urllib.request
 from Bio.SeqUtils import IUPACData
+from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 
@@ -41,6 +66,14 @@ if not logging.getLogger().hasHandlers():
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
 
+# One-letter names of the residues, keyed by their PDB three-letter names
+RESIDUE_3TO1 = {name.upper(): letter for name, letter 
+                in IUPACData.protein_letters_3to1_extended.items()}
+
+# Extensions of the structure files read by read_c_alpha
+PDB_EXTENSIONS = ('.pdb', '.ent')
+MMCIF_EXTENSIONS = ('.cif', '.mmcif')
+
 
 def read_fasta(fasta_file: str) -> str:
     """
@@ -68,15 +101,195 @@ def read_fasta(fasta_file: str) -> str:
                        if not line.startswith('>'))
     
     # Validate the sequence to ensure it only contains known residues
+    validate_sequence(sequence)
+    
+    logging.debug(f"FASTA sequence length: {len(sequence)}")
+    return sequence
+
+
+def validate_sequence(sequence: str) -> None:
+    """
+    Check that a sequence only contains known residues.
+
+    Args:
+        sequence (str): The sequence string.
+
+    Raises:
+        ValueError: If the sequence contains invalid residues.
+    """
     valid_residues = set(IUPACData.protein_letters)
     if not set(sequence).issubset(valid_residues):
         invalid_residues = set(sequence) - valid_residues
         raise ValueError(
             f"Sequence contains invalid residues: "
             f"{', '.join(invalid_residues)}")
-    
-    logging.debug(f"FASTA sequence length: {len(sequence)}")
-    return sequence
+
+
+def iter_fasta(fasta_file: str, validate: bool = True):
+    """
+    Stream the records of a (multi-record) FASTA file.
+
+    Records are read one at a time, so the memory footprint does not depend 
+    on the number of records, and each record is validated when it is 
+    yielded.
+
+    Args:
+        fasta_file (str): The path to the FASTA file.
+        validate (bool): If True, check the residues of every record.
+
+    Yields:
+        tuple: The record ID (the first word of the header) and the sequence.
+
+    Raises:
+        FileNotFoundError: If the FASTA file does not exist.
+        ValueError: If a sequence contains invalid residues.
+    """
+    logging.debug(f"Streaming FASTA records from '{fasta_file}'")
+    if not os.path.exists(fasta_file):
+        raise FileNotFoundError(f"FASTA file '{fasta_file}' not found.")
+
+    with open(fasta_file, 'r') as file:
+        record_id = None
+        chunks = []
+        for line in file:
+            if line.startswith('>'):
+                if record_id is not None:
+                    yield _fasta_record(record_id, chunks, validate)
+                record_id = line[1:].split(maxsplit=1)[0] \
+                    if line[1:].strip() else ''
+                chunks = []
+            elif record_id is not None:
+                chunks.append(line.strip().upper())
+        if record_id is not None:
+            yield _fasta_record(record_id, chunks, validate)
+
+
+def _fasta_record(record_id: str, chunks: list, validate: bool) -> tuple:
+    """Join the lines of a FASTA record and validate its sequence."""
+    sequence = ''.join(chunks)
+    if validate:
+        try:
+            validate_sequence(sequence)
+        except ValueError as e:
+            raise ValueError(f"Record '{record_id}': {e}")
+    return record_id, sequence
+
+
+def index_fasta(fasta_file: str, index_file: str = None) -> str:
+    """
+    Write a samtools-style .fai index of a (multi-record) FASTA file.
+
+    Each line of the index holds the record ID, the sequence length, the 
+    byte offset of the sequence, and the number of bases and bytes per line.
+
+    Args:
+        fasta_file (str): The path to the FASTA file.
+        index_file (str, optional): The path of the index. Defaults to 
+                                    `<fasta_file>.fai`.
+
+    Returns:
+        str: The path of the index.
+    """
+    index_file = index_file or f"{fasta_file}.fai"
+    logging.debug(f"Indexing FASTA file '{fasta_file}' into '{index_file}'")
+
+    entries = []
+    with open(fasta_file, 'rb') as file:
+        offset = 0
+        entry = None
+        for line in file:
+            if line.startswith(b'>'):
+                if entry is not None:
+                    entries.append(entry)
+                header = line[1:].decode().split(maxsplit=1)
+                entry = [header[0] if header else '', 0, 
+                         offset + len(line), 0, 0]
+            elif entry is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if entry[3] == 0:
+                    entry[3], entry[4] = bases, len(line)
+                entry[1] += len(line.strip())
+            offset += len(line)
+        if entry is not None:
+            entries.append(entry)
+
+    with open(f"{index_file}.tmp", 'w') as file:
+        for entry in entries:
+            file.write('\t'.join(str(field) for field in entry) + '\n')
+    os.replace(f"{index_file}.tmp", index_file)
+
+    logging.debug(f"Indexed {len(entries)} FASTA records")
+    return index_file
+
+
+def read_fasta_index(fasta_file: str) -> dict:
+    """
+    Read the .fai index of a FASTA file, (re)building it if it is missing 
+    or older than the file.
+
+    Args:
+        fasta_file (str): The path to the FASTA file.
+
+    Returns:
+        dict: Sequence length and byte offset of each record, keyed by ID.
+
+    Raises:
+        FileNotFoundError: If the FASTA file does not exist.
+    """
+    if not os.path.exists(fasta_file):
+        raise FileNotFoundError(f"FASTA file '{fasta_file}' not found.")
+    index_file = f"{fasta_file}.fai"
+    if (not os.path.exists(index_file) 
+            or os.path.getmtime(index_file) < os.path.getmtime(fasta_file)):
+        index_fasta(fasta_file, index_file)
+
+    index = {}
+    with open(index_file, 'r') as file:
+        for line in file:
+            fields = line.rstrip('\n').split('\t')
+            index[fields[0]] = (int(fields[1]), int(fields[2]))
+    return index
+
+
+def fetch_fasta_records(fasta_file: str, ids: list, validate: bool = True,
+                        index: dict = None):
+    """
+    Fetch records of a (multi-record) FASTA file by ID.
+
+    The records are located through the .fai index of the file, so only the 
+    selected records are read.
+
+    Args:
+        fasta_file (str): The path to the FASTA file.
+        ids (list): IDs of the records to fetch.
+        validate (bool): If True, check the residues of every record.
+        index (dict, optional): Index returned by `read_fasta_index`. Read 
+                                from the .fai file if None. Defaults to None.
+
+    Yields:
+        tuple: The record ID and the sequence, in the order of `ids`.
+
+    Raises:
+        FileNotFoundError: If the FASTA file does not exist.
+        KeyError: If a record ID is not in the file.
+        ValueError: If a sequence contains invalid residues.
+    """
+    if index is None:
+        index = read_fasta_index(fasta_file)
+
+    with open(fasta_file, 'r') as file:
+        for record_id in ids:
+            if record_id not in index:
+                raise KeyError(f"Record '{record_id}' not found in "
+                               f"'{fasta_file}'.")
+            _, offset = index[record_id]
+            file.seek(offset)
+            chunks = []
+            for line in file:
+                if line.startswith('>'):
+                    break
+                chunks.append(line.strip().upper())
+            yield _fasta_record(record_id, chunks, validate)
 
 
 def pdb_to_c_alpha_coordinates(pdb_file: str) -> np.ndarray:
@@ -90,50 +303,245 @@ def pdb_to_c_alpha_coordinates(pdb_file: str) -> np.ndarray:
                     where n is the number of residues in the protein.
     """
     logging.debug(f"Extracting C-alpha coordinates from PDB file '{pdb_file}'")
-    with open(pdb_file, 'r') as f:
-        lines = f.readlines()
-    
-    coords = []
-    for line in lines:
-        if line.startswith('ATOM') and 'CA' in line:
-            x = float(line[30:38])
-            y = float(line[38:46])
-            z = float(line[46:54])
-            coords.append([x, y, z])
-    
-    coords = np.array(coords)
+    _, coords = read_c_alpha(pdb_file, dtype=float)
     logging.debug(f"Extracted {coords.shape[0]} C-alpha coordinates")
     return coords
 
 
-def coordinates_to_distance_matrix(coords: np.ndarray) -> np.ndarray:
+def read_c_alpha(structure_file: str, chain: str = None, altloc: str = None,
+                 dtype=np.float32) -> tuple:
+    """Read the residue sequence and C-alpha coordinates of a structure.
+
+    The file is streamed line by line and reading stops at the end of the 
+    first model. Only the alpha carbons of ATOM records are kept (calcium 
+    ions are ignored), and a single alternate location is kept per residue. 
+    Files ending in .cif or .mmcif (optionally gzipped) are read as mmCIF, 
+    other files as PDB.
+
+    Args:
+        structure_file (str): The path to the PDB or mmCIF file.
+        chain (str, optional): Chain identifier to keep. All chains are kept 
+                               if None. Defaults to None.
+        altloc (str, optional): Alternate location to keep. The first one 
+                                of each residue is kept if None. 
+                                Defaults to None.
+        dtype (data-type): The data type of the coordinates.
+
+    Returns:
+        tuple: The one-letter residue sequence (str, 'X' for unknown 
+               residues) and the C-alpha coordinates with shape (n, 3).
+
+    Raises:
+        FileNotFoundError: If the structure file does not exist.
+    """
+    logging.debug(f"Reading C-alpha atoms from '{structure_file}'")
+    name = structure_file[:-3] if structure_file.endswith('.gz') \
+        else structure_file
+    opener = gzip.open if structure_file.endswith('.gz') else open
+    reader = _iter_c_alpha_mmcif if name.lower().endswith(MMCIF_EXTENSIONS) \
+        else _iter_c_alpha_pdb
+
+    residues = []
+    coords = []
+    seen = set()
+    with opener(structure_file, 'rt') as f:
+        for (atom_chain, residue_id, atom_altloc, 
+             residue_name, xyz) in reader(f):
+            if chain is not None and atom_chain != chain:
+                continue
+            if altloc is not None and atom_altloc not in ('', altloc):
+                continue
+            if (atom_chain, residue_id) in seen:
+                continue
+            seen.add((atom_chain, residue_id))
+            residues.append(RESIDUE_3TO1.get(residue_name, 'X'))
+            coords.append(xyz)
+
+    coords = np.array(coords, dtype=dtype).reshape(-1, 3)
+    logging.debug(f"Read {coords.shape[0]} C-alpha atoms")
+    return ''.join(residues), coords
+
+
+def _iter_c_alpha_pdb(lines):
+    """Yield the C-alpha atoms of the first model of PDB lines."""
+    in_model = False
+    for line in lines:
+        record = line[:6]
+        if record == 'ATOM  ' and line[12:16] == ' CA ':
+            yield (line[21], line[22:27], line[16].strip(), line[17:20].strip(),
+                   (float(line[30:38]), float(line[38:46]), 
+                    float(line[46:54])))
+        elif record == 'MODEL ':
+            if in_model:
+                return
+            in_model = True
+        elif record.startswith('END'):
+            return
+
+
+def _iter_c_alpha_mmcif(lines):
+    """Yield the C-alpha atoms of the first model of mmCIF lines."""
+    tags = []
+    model = None
+    lines = iter(lines)
+    for line in lines:
+        if line.startswith('_atom_site.'):
+            tags.append(line.split()[0][len('_atom_site.'):])
+            continue
+        if not tags:
+            continue
+        if line.startswith(('_', 'loop_', '#', 'data_')):
+            return
+        values = shlex.split(line) if '"' in line or "'" in line \
+            else line.split()
+        if len(values) != len(tags):
+            continue
+        atom = dict(zip(tags, values))
+        atom_model = atom.get('pdbx_PDB_model_num')
+        if model is None:
+            model = atom_model
+        elif atom_model != model:
+            return
+        if (atom.get('group_PDB') != 'ATOM' 
+                or atom.get('label_atom_id') != 'CA'):
+            continue
+        altloc = atom.get('label_alt_id', '.')
+        insertion = atom.get('pdbx_PDB_ins_code', '?')
+        yield (atom.get('auth_asym_id', atom.get('label_asym_id')),
+               (atom.get('auth_seq_id', atom.get('label_seq_id')), insertion),
+               '' if altloc in ('.', '?') else altloc,
+               atom.get('label_comp_id'),
+               (float(atom['Cartn_x']), float(atom['Cartn_y']), 
+                float(atom['Cartn_z'])))
+
+
+def read_c_alpha_directory(structures_dir: str, jobs: int = cpu_count(),
+                           chain: str = None, altloc: str = None,
+                           dtype=np.float32) -> dict:
+    """Read the C-alpha atoms of all the structure files of a directory.
+
+    Args:
+        structures_dir (str): Directory containing PDB or mmCIF files.
+        jobs (int): Number of parallel jobs to use.
+        chain (str, optional): Chain identifier to keep. Defaults to None.
+        altloc (str, optional): Alternate location to keep. Defaults to None.
+        dtype (data-type): The data type of the coordinates.
+
+    Returns:
+        dict: Residue sequence and C-alpha coordinates of each structure, 
+              keyed by file name and sorted by file name.
+    """
+    extensions = PDB_EXTENSIONS + MMCIF_EXTENSIONS
+    files = sorted(
+        file for file in os.listdir(structures_dir)
+        if file.lower().removesuffix('.gz').endswith(extensions)
+    )
+    logging.debug(f"Reading {len(files)} structures from '{structures_dir}'")
+    results = Parallel(n_jobs=jobs)(
+        delayed(read_c_alpha)(os.path.join(structures_dir, file), 
+                              chain, altloc, dtype)
+        for file in files
+    )
+    return dict(zip(files, results))
+
+
+def coordinates_to_distance_matrix(coords: np.ndarray, dtype=np.float64,
+                                   condensed: bool = False) -> np.ndarray:
     """Convert a numpy array of coordinates to a distance matrix.
 
     Args:
         coords (np.ndarray): A numpy array of coordinates with shape (n, 3),
                              where n is the number of residues.
+        dtype (data-type): The data type of the distances (e.g., np.float32 
+                           to halve the memory footprint).
+        condensed (bool): If True, return only the upper triangle of the 
+                          matrix, in the row-major order of 
+                          scipy.spatial.distance.pdist.
 
     Returns:
-        np.ndarray: A distance matrix with shape (n, n).
+        np.ndarray: A distance matrix with shape (n, n), or the condensed 
+                    distances with shape (n * (n - 1) / 2,).
     """
     logging.debug("Calculating distance matrix")
-    n = coords.shape[0]
-    dist_matrix = np.zeros((n, n))
-    for i in range(n):
-        for j in range(i+1, n):
-            dist_matrix[i, j] = np.linalg.norm(coords[i] - coords[j])
-            dist_matrix[j, i] = dist_matrix[i, j]
-    
-    logging.debug(f"Distance matrix shape: {dist_matrix.shape}")
-    return dist_matrix
+    return coordinates_to_distance_matrices([coords], dtype, condensed)[0]
+
+
+def coordinates_to_distance_matrices(coords_list: list, dtype=np.float64,
+                                     condensed: bool = False,
+                                     max_pairs: int = 2**22) -> list:
+    """Convert a list of coordinate arrays to distance matrices at once.
+
+    The pairwise differences of the arrays are computed in vectorized passes 
+    of at most `max_pairs` pairs, with the same per-pair arithmetic as 
+    np.linalg.norm, so the float64 distances are identical to a pairwise loop.
+
+    Args:
+        coords_list (list): Numpy arrays of coordinates with shape (n, 3).
+        dtype (data-type): The data type of the distances.
+        condensed (bool): If True, return only the upper triangles of the 
+                          matrices.
+        max_pairs (int): Number of pairs above which the arrays are split 
+                         into several passes, to bound the memory footprint.
+
+    Returns:
+        list: The distance matrices, in the order of `coords_list`.
+    """
+    dist_matrices = []
+    batch = []
+    batch_pairs = 0
+    for index, coords in enumerate(coords_list):
+        batch.append(np.asarray(coords, dtype=float))
+        batch_pairs += batch[-1].shape[0] * (batch[-1].shape[0] - 1) // 2
+        if batch_pairs >= max_pairs or index == len(coords_list) - 1:
+            dist_matrices.extend(
+                _distance_matrices_pass(batch, dtype, condensed)
+            )
+            batch = []
+            batch_pairs = 0
+
+    logging.debug(f"Calculated {len(dist_matrices)} distance matrices")
+    return dist_matrices
+
+
+def _distance_matrices_pass(coords_list: list, dtype, 
+                            condensed: bool) -> list:
+    """Compute the distance matrices of a batch in one vectorized pass."""
+    upper_indices = [np.triu_indices(coords.shape[0], 1) 
+                     for coords in coords_list]
+    pair_counts = [rows.size for rows, _ in upper_indices]
+
+    # Differences of the upper-triangle pairs of all arrays
+    differences = np.concatenate(
+        [coords[rows] - coords[columns]
+         for coords, (rows, columns) in zip(coords_list, upper_indices)]
+    )
+    distances = np.sqrt(
+        (differences[:, None, :] @ differences[:, :, None])[:, 0, 0]
+    ).astype(dtype, copy=False)
+
+    dist_matrices = []
+    for coords, (rows, columns), upper in zip(
+            coords_list, upper_indices, 
+            np.split(distances, np.cumsum(pair_counts)[:-1])):
+        if condensed:
+            dist_matrices.append(upper)
+            continue
+        n = coords.shape[0]
+        dist_matrix = np.zeros((n, n), dtype=dtype)
+        dist_matrix[rows, columns] = upper
+        dist_matrix[columns, rows] = upper
+        dist_matrices.append(dist_matrix)
+
+    return dist_matrices
 
 
-def load_dope(url: str) -> pd.DataFrame:
+def load_dope(url) -> pd.DataFrame:
     """
     Load and prepare the DOPE score data from the given URL.
     
     Args:
-        url (str): The URL to the DOPE score data file.
+        url (str or file-like): The URL, path or buffer of the DOPE score 
+                                data file.
     
     Returns:
         pd.DataFrame: Processed DataFrame with only CA-CA interactions and 
@@ -162,3 +570,110 @@ def load_dope(url: str) -> pd.DataFrame:
     
     logging.debug(f"DOPE score data loaded with shape: {df_dope.shape}")
     return df_dope
+
+
+def load_dope_cached(source: str, cache_file: str) -> pd.DataFrame:
+    """
+    Load the DOPE score data through a local binary cache.
+
+    The CA-CA table is stored in `cache_file` as a .npy file, alongside a 
+    `<cache_file>.json` sidecar with the residue names, the distance columns 
+    and the SHA-256 hash of the source file. The cache is memory-mapped on 
+    later runs. If the source is a local file, the cache is rebuilt when the 
+    hash of the file changes. If the source is a URL, an existing cache is 
+    used as is, so that runs do not need network access.
+
+    Args:
+        source (str): The URL or local path of the DOPE score data file.
+        cache_file (str): The path of the cached CA-CA table (.npy).
+
+    Returns:
+        pd.DataFrame: Processed DataFrame with only CA-CA interactions and 
+                      converted residue names to single-letter format.
+
+    Raises:
+        FileNotFoundError: If the local DOPE score data file does not exist.
+    """
+    metadata_file = f"{cache_file}.json"
+    is_url = source.startswith(('http://', 'https://', 'ftp://'))
+    content = None
+
+    if is_url:
+        source_hash = None
+    else:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"DOPE file '{source}' not found.")
+        with open(source, 'rb') as f:
+            content = f.read()
+        source_hash = hashlib.sha256(content).hexdigest()
+
+    # Use the cache if it exists and matches the source file
+    try:
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        if source_hash is None or metadata['sha256'] == source_hash:
+            df_dope = load_dope_table(cache_file)
+            logging.debug(f"DOPE score data loaded from cache '{cache_file}'")
+            return df_dope
+        logging.info(f"DOPE file '{source}' changed, rebuilding the cache.")
+    except (OSError, ValueError, KeyError):
+        logging.debug(f"No valid DOPE cache found at '{cache_file}'")
+
+    if content is None:
+        with urllib.request.urlopen(source) as response:
+            content = response.read()
+        source_hash = hashlib.sha256(content).hexdigest()
+    df_dope = load_dope(io.BytesIO(content))
+
+    save_dope_table(df_dope, cache_file, source=source, sha256=source_hash)
+    logging.info(f"DOPE score data cached to '{cache_file}'")
+
+    return df_dope
+
+
+def save_dope_table(df_dope: pd.DataFrame, table_file: str,
+                    **metadata) -> None:
+    """
+    Save a DOPE table as a .npy file with a `<table_file>.json` sidecar.
+
+    The table is written first and the sidecar, which validates it, last, 
+    both atomically.
+
+    Args:
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        table_file (str): The path of the table (.npy).
+        **metadata: Additional entries of the sidecar.
+    """
+    table_dir = os.path.dirname(table_file)
+    if table_dir:
+        os.makedirs(table_dir, exist_ok=True)
+    with open(f"{table_file}.tmp", 'wb') as f:
+        np.save(f, df_dope.iloc[:, 2:].to_numpy(dtype=float))
+    os.replace(f"{table_file}.tmp", table_file)
+    metadata.update({
+        'res1': df_dope['res1'].tolist(),
+        'res2': df_dope['res2'].tolist(),
+        'distances': df_dope.columns[2:].tolist()
+    })
+    with open(f"{table_file}.json.tmp", 'w') as f:
+        json.dump(metadata, f)
+    os.replace(f"{table_file}.json.tmp", f"{table_file}.json")
+
+
+def load_dope_table(table_file: str) -> pd.DataFrame:
+    """
+    Memory-map a DOPE table saved by save_dope_table.
+
+    Args:
+        table_file (str): The path of the table (.npy).
+
+    Returns:
+        pd.DataFrame: DataFrame containing DOPE scores.
+    """
+    with open(f"{table_file}.json", 'r') as f:
+        metadata = json.load(f)
+    table = np.load(table_file, mmap_mode='r')
+    df_dope = pd.DataFrame(table, columns=metadata['distances'])
+    df_dope.insert(0, 'res1', metadata['res1'])
+    df_dope.insert(1, 'res2', metadata['res2'])
+    return df_dope
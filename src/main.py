@@ -10,6 +10,9 @@ Features:
 - Compute distance matrices from template coordinates.
 - Fill low-level matrices with DOPE scores.
 - Calculate energy scores for sequence-template pairs.
+- Sweep several gap scores at once, sharing all the template data.
+- Reuse the scores of pairs computed by earlier runs from a result cache.
+- Stream the scores to a checkpoint file and resume interrupted runs.
 - Save the results to a CSV file.
 """
 
@@ -20,18 +23,33 @@ __date__ = "2024-09-06"
 __version__ = "1.2.0"
 
 import argparse
+from itertools import islice
 import logging
 from multiprocessing import cpu_count
 import os
 
-from joblib import Parallel, delayed
 import numpy as np
 import pandas as pd
 
-from config import DOPE_URL, SEQUENCES_DIR, TEMPLATES_DIR
-from load_data import (load_dope, read_fasta, pdb_to_c_alpha_coordinates,
+from checkpoint import (append_rows, load_checkpoint, open_checkpoint, 
+                        remove_checkpoint)
+from config import DOPE_CACHE, DOPE_URL, SEQUENCES_DIR, TEMPLATES_DIR
+from load_data import (load_dope_cached, read_fasta, iter_fasta,
+                       fetch_fasta_records, pdb_to_c_alpha_coordinates,
                        coordinates_to_distance_matrix)
-from process_matrix import fill_low_level_matrices, fill_high_level_matrix
+from energy_profile import get_template_profile
+from profiling import enable_profiling, export_profile, stage, task
+from process_matrix import (BAND_ENGINES, LOW_LEVEL_ENGINES, TILE_BYTES, 
+                            fill_high_level_matrix,
+                            fill_high_level_matrices,
+                            fill_low_level_scores_gaps)
+from result_cache import (engine_key, hash_dope, hash_sequence, 
+                          hash_template, lookup_scores, open_cache, 
+                          store_scores)
+from scheduler import (parse_memory, run_tasks, task_cost, task_memory, 
+                       tile_matrix_bytes)
+from shared_store import attach_store, create_store, remove_store
+from template_library import load_library
 
 
 # Setup logging configuration
@@ -41,6 +59,10 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# Number of sequences whose tasks are queued at once, so that sequences 
+# streamed from a FASTA file are not all held in memory
+SEQUENCES_PER_QUEUE = 1024
+
 
 def load_templates(templates_dir: str) -> list:
     """
@@ -68,10 +90,107 @@ def load_sequences(sequences_dir: str) -> list:
     return os.listdir(sequences_dir)
 
 
+def load_template_distances(template: str, templates_dir: str,
+                            library: str = None) -> np.ndarray:
+    """
+    Load the distance matrix of a template.
+
+    Args:
+        template (str): The template file name.
+        templates_dir (str): Directory where templates are stored.
+        library (str, optional): Path of a compiled template library to read 
+                                 the template from instead of templates_dir. 
+                                 Defaults to None.
+
+    Returns:
+        np.ndarray: Distance matrix of the template.
+
+    Raises:
+        KeyError: If the template is not in the library.
+        FileNotFoundError: If the template file does not exist.
+    """
+    if library:
+        with stage('load_library'):
+            templates = load_library(library)
+            if template not in templates:
+                raise KeyError(f"Template not found in library: {template}")
+            return np.asarray(templates[template]['dist_matrix'], 
+                              dtype=float)
+
+    pdb_file = os.path.join(templates_dir, template)
+    if not os.path.exists(pdb_file):
+        raise FileNotFoundError(f"PDB file not found: {pdb_file}")
+    with stage('parse_pdb'):
+        coords = pdb_to_c_alpha_coordinates(pdb_file)
+    with stage('distance_matrix'):
+        return coordinates_to_distance_matrix(coords)
+
+
+def template_coordinates(templates: list, templates_dir: str,
+                         library: str = None) -> list:
+    """
+    Read the C-alpha coordinates of each template. Missing templates have 
+    no coordinates, their error is reported when they are processed.
+
+    Args:
+        templates (list): List of template file names.
+        templates_dir (str): Directory where templates are stored.
+        library (str, optional): Path of a compiled template library to read 
+                                 the templates from instead of templates_dir. 
+                                 Defaults to None.
+
+    Returns:
+        list: C-alpha coordinates of each template, None if it is missing.
+    """
+    if library:
+        with stage('load_library'):
+            library_templates = load_library(library)
+            return [library_templates[template]['coords']
+                    if template in library_templates else None
+                    for template in templates]
+
+    coords_list = []
+    with stage('parse_pdb', templates=len(templates)):
+        for template in templates:
+            try:
+                coords_list.append(pdb_to_c_alpha_coordinates(
+                    os.path.join(templates_dir, template)
+                ))
+            except (OSError, ValueError):
+                coords_list.append(None)
+    return coords_list
+
+
+def template_lengths(templates: list, templates_dir: str,
+                     library: str = None) -> list:
+    """
+    Read the number of residues of each template, to estimate the cost of 
+    the tasks. Missing templates have length 0.
+
+    Args:
+        templates (list): List of template file names.
+        templates_dir (str): Directory where templates are stored.
+        library (str, optional): Path of a compiled template library to read 
+                                 the templates from instead of templates_dir. 
+                                 Defaults to None.
+
+    Returns:
+        list: Number of residues of each template.
+    """
+    return [0 if coords is None else len(coords) 
+            for coords in template_coordinates(templates, templates_dir, 
+                                               library)]
+
+
 def process_template(template: str, templates_dir: str,
                      sequence: str, df_dope: pd.DataFrame,
                      gap_score: float, print_alignments: bool,
-                     jobs: int, verbose: bool = False) -> float:
+                     jobs: int, verbose: bool = False,
+                     library: str = None, profile_cache: str = None,
+                     engine: str = 'wavefront',
+                     engine_options: dict = None,
+                     cutoff: float = None,
+                     band: int = None) -> float:
     """
     Process a single template by calculating the energy score for a sequence.
 
@@ -80,39 +199,81 @@ def process_template(template: str, templates_dir: str,
         templates_dir (str): Directory where templates are stored.
         sequence (str): Sequence of residues.
         df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        jobs (int): Number of processes filling the low-level matrices of 
+                    the template.
         verbose (bool): If True, enables verbose output.
+        library (str, optional): Path of a compiled template library. If set, 
+                                 the template is read from the library instead 
+                                 of templates_dir. Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        engine (str): Name of the low-level engine in LOW_LEVEL_ENGINES. 
+                      'full' keeps the (n, m, n, m) low-level matrices, 
+                      'score' only their terminal values, and 'wavefront' 
+                      also fills them one anti-diagonal at a time, and 
+                      'batched' fills tiles of them at once. 
+                      Defaults to 'wavefront'.
+        engine_options (dict, optional): Keyword arguments of the engine, 
+                                         such as the 'tile_size' or the 
+                                         'fixed_point' mode of the 'batched' 
+                                         engine, which also fills the 
+                                         high-level matrix in fixed point. 
+                                         Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Pairs of template positions beyond it share 
+                                  far-field energies. Defaults to None.
+        band (int, optional): Width of the diagonal band of the low-level 
+                              and high-level matrices, see 
+                              process_matrix.band_limits. Requires an 
+                              engine of BAND_ENGINES. Defaults to None.
 
     Returns:
         float: Computed energy score for the template.
 
     Raises:
+        ValueError: If a band is given for an engine without band support.
         Exception: If processing the template fails.
     """
+    if band is not None and engine not in BAND_ENGINES:
+        raise ValueError(f"The {engine} engine does not support a band, "
+                         f"use one of {sorted(BAND_ENGINES)}.")
     try:
-        pdb_file = os.path.join(templates_dir, template)
-        
-        if not os.path.exists(pdb_file):
-            raise FileNotFoundError(f"PDB file not found: {pdb_file}")
+        with task('process_template', template=template, m=len(sequence)):
+            dist_matrix = load_template_distances(template, templates_dir, 
+                                                  library)
+            n = dist_matrix.shape[0]
+            m = len(sequence)
+            logging.info(f"Processing template {template} with {n} "
+                         f"residues.")
 
-        coords = pdb_to_c_alpha_coordinates(pdb_file)
-        dist_matrix = coordinates_to_distance_matrix(coords)
-        n = coords.shape[0]
-        m = len(sequence)
-        logging.info(f"Processing template {template} with {n} residues.")
-
-        low_level_matrices = fill_low_level_matrices(n=n, m=m, 
-                                                     sequence=sequence,
-                                                     dist_matrix=dist_matrix,
-                                                     gap_score=gap_score,
-                                                     df_dope=df_dope)
-        high_level_matrix = fill_high_level_matrix(low_level_matrices,
-                                                   gap_score, sequence, 
-                                                   print_alignments)
-        energy_score = high_level_matrix[-1, -1]
-        energy_score = round(energy_score, 2)
-        logging.info(f"Processed template {template}. "
-                     f"Energy score: {energy_score}")
-        return energy_score
+            with stage('energy_profile'):
+                profile = get_template_profile(dist_matrix, df_dope, 
+                                               profile_cache, cutoff)
+            low_level_engine = LOW_LEVEL_ENGINES[engine]
+            band_options = {'band': band} if band is not None else {}
+            with stage('low_level_fill', engine=engine, n=n, m=m):
+                low_level_matrices = low_level_engine(
+                    n=n, m=m, sequence=sequence, dist_matrix=dist_matrix,
+                    gap_score=gap_score, df_dope=df_dope, profile=profile,
+                    jobs=jobs, **(engine_options or {}), **band_options
+                )
+            fixed_point = (engine_options or {}).get('fixed_point', False)
+            with stage('high_level_fill'):
+                high_level_matrix = fill_high_level_matrix(
+                    low_level_matrices, gap_score, sequence, 
+                    print_alignments, band, fixed_point=fixed_point
+                )
+            energy_score = high_level_matrix[-1, -1]
+            energy_score = round(energy_score, 2)
+            logging.info(f"Processed template {template}. "
+                         f"Energy score: {energy_score}")
+            return energy_score
+    except MemoryError:
+        logging.error(f"Out of memory processing template {template} with "
+                      f"a sequence of length {len(sequence)}, see "
+                      f"--max_memory.")
+        return float('nan')
     except Exception as e:
         logging.error(f"Error processing template {template}: {e}")
         return float('nan')
@@ -121,70 +282,734 @@ def process_template(template: str, templates_dir: str,
 def process_template_wrapper(template: str, sequence: str, templates_dir: str, 
                              df_dope: pd.DataFrame, gap_score: float, 
                              print_alignments: bool, jobs: int, 
-                             verbose: bool) -> float:
+                             verbose: bool, library: str = None,
+                             profile_cache: str = None,
+                             engine: str = 'wavefront',
+                             engine_options: dict = None,
+                             cutoff: float = None,
+                             band: int = None,
+                             store: str = None) -> float:
     """
     Wrapper function for process_template to use with multiprocessing.
+    If a shared store is given, the DOPE table and the templates are read 
+    from the store instead of df_dope and library.
     """
+    if store is not None:
+        df_dope, library = attach_store(store)
     return process_template(
         template, templates_dir, sequence, df_dope, gap_score, 
-        print_alignments, jobs, verbose
+        print_alignments, jobs, verbose, library, profile_cache, engine,
+        engine_options, cutoff, band
     )
 
 
+def process_template_sequences(template: str, templates_dir: str,
+                               sequences: list, df_dope: pd.DataFrame,
+                               gap_score: float, jobs: int = 1,
+                               library: str = None, 
+                               profile_cache: str = None,
+                               tile_size: int = None, cutoff: float = None,
+                               band: int = None, store: str = None,
+                               fixed_point: bool = False) -> np.ndarray:
+    """
+    Calculate the energy scores of several sequences of the same length, 
+    such as the shuffles of a sequence, against a single template.
+
+    The template is loaded and profiled once, and the dynamic programming 
+    runs along a sequence axis with process_template_gaps. The scores are 
+    identical to those of process_template.
+
+    Args:
+        template (str): The template file name.
+        templates_dir (str): Directory where templates are stored.
+        sequences (list): Sequences of residues, all of the same length.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        gap_score (float): The gap score to be used.
+        jobs (int): Number of processes filling the low-level matrices.
+        library (str, optional): Path of a compiled template library. 
+                                 Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+                                   Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices. 
+                              Defaults to None.
+        store (str, optional): Shared store to read the DOPE table and the 
+                               templates from. Defaults to None.
+        fixed_point (bool, optional): If True, runs both dynamic programming 
+                                      levels in int32 hundredths. 
+                                      Defaults to False.
+
+    Returns:
+        np.ndarray: Energy scores of the sequences, NaN if processing the 
+                    template fails.
+    """
+    return process_template_gaps(
+        template, templates_dir, sequences, df_dope, [gap_score], jobs, 
+        library, profile_cache, tile_size, cutoff, band, store, fixed_point
+    )[0]
+
+
+def process_template_gaps(template: str, templates_dir: str,
+                          sequences: list, df_dope: pd.DataFrame,
+                          gap_scores: list, jobs: int = 1,
+                          library: str = None, profile_cache: str = None,
+                          tile_size: int = None, cutoff: float = None,
+                          band: int = None, store: str = None,
+                          fixed_point: bool = False) -> np.ndarray:
+    """
+    Calculate the energy scores of several sequences of the same length 
+    against a single template, for several gap scores.
+
+    The template is loaded and profiled once, and the dynamic programming 
+    runs along a (gap score, sequence) axis with fill_low_level_scores_gaps 
+    and fill_high_level_matrices.
+
+    Args:
+        template (str): The template file name.
+        templates_dir (str): Directory where templates are stored.
+        sequences (list): Sequences of residues, all of the same length.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        gap_scores (list): The gap scores to be used.
+        jobs (int): Number of processes filling the low-level matrices.
+        library (str, optional): Path of a compiled template library. 
+                                 Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+                                   Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices. 
+                              Defaults to None.
+        store (str, optional): Shared store to read the DOPE table and the 
+                               templates from. Defaults to None.
+        fixed_point (bool, optional): If True, runs both dynamic programming 
+                                      levels in int32 hundredths. 
+                                      Defaults to False.
+
+    Returns:
+        np.ndarray: Energy scores with shape (len(gap_scores), 
+                    len(sequences)), NaN if processing the template fails.
+    """
+    if store is not None:
+        df_dope, library = attach_store(store)
+    try:
+        with task('process_template_gaps', template=template, 
+                  m=len(sequences[0]), sequences=len(sequences), 
+                  gap_scores=len(gap_scores)):
+            dist_matrix = load_template_distances(template, templates_dir, 
+                                                  library)
+            n = dist_matrix.shape[0]
+            m = len(sequences[0])
+            logging.info(f"Processing template {template} with {n} residues "
+                         f"against {len(sequences)} sequences and "
+                         f"{len(gap_scores)} gap scores.")
+
+            with stage('energy_profile'):
+                profile = get_template_profile(dist_matrix, df_dope, 
+                                               profile_cache, cutoff)
+            with stage('low_level_fill', engine='batched', n=n, m=m, 
+                       batch=len(gap_scores) * len(sequences)):
+                terminal_scores = fill_low_level_scores_gaps(
+                    n, m, sequences, dist_matrix, gap_scores, df_dope, 
+                    profile, tile_size=tile_size, band=band, jobs=jobs, 
+                    fixed_point=fixed_point
+                )
+            with stage('high_level_fill'):
+                high_level_matrices = fill_high_level_matrices(
+                    terminal_scores.reshape(-1, n, m), 
+                    np.repeat(np.asarray(gap_scores, dtype=float), 
+                              len(sequences)), 
+                    band, fixed_point
+                )
+            return np.round(high_level_matrices[:, -1, -1], 2).reshape(
+                len(gap_scores), len(sequences)
+            )
+    except Exception as e:
+        logging.error(f"Error processing template {template}: {e}")
+        return np.full((len(gap_scores), len(sequences)), np.nan)
+
+
+def process_sequence_batch(sequences: list, templates: list,
+                           df_dope: pd.DataFrame, templates_dir: str,
+                           gap_score: float, jobs: int = cpu_count(),
+                           library: str = None, profile_cache: str = None,
+                           tile_size: int = None, cutoff: float = None,
+                           band: int = None, store: str = None,
+                           fixed_point: bool = False) -> np.ndarray:
+    """
+    Calculate the energy scores of several sequences of the same length 
+    against all templates.
+
+    Each template is one batched task, split into chunks of sequences when 
+    there are more jobs than templates, and the tasks are run longest first 
+    on the persistent pool of the scheduler.
+
+    Args:
+        sequences (list): Sequences of residues, all of the same length.
+        templates (list): List of templates to process.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        templates_dir (str): Directory containing template files.
+        gap_score (float): The gap score to be used.
+        jobs (int): Number of parallel jobs, split between tasks and the 
+                    low-level matrices of each task by split_jobs.
+        library (str, optional): Path of a compiled template library. 
+                                 Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+                                   Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices. 
+                              Defaults to None.
+        store (str, optional): Shared store of the DOPE table and of the 
+                               templates. Defaults to None.
+        fixed_point (bool, optional): If True, runs both dynamic programming 
+                                      levels in int32 hundredths. 
+                                      Defaults to False.
+
+    Returns:
+        np.ndarray: Energy scores with shape (len(sequences), len(templates)).
+    """
+    if not templates or not sequences:
+        return np.empty((len(sequences), len(templates)))
+
+    # Split the sequences when the templates alone cannot use all the jobs
+    n_chunks = min(len(sequences), -(-jobs // len(templates)))
+    chunks = np.array_split(np.arange(len(sequences)), n_chunks)
+    task_jobs, matrix_jobs = split_jobs(jobs, len(templates) * n_chunks)
+
+    lengths = template_lengths(
+        templates, templates_dir, 
+        attach_store(store)[1] if store is not None else library
+    )
+    tasks, costs = [], []
+    for template, n in zip(templates, lengths):
+        for chunk in chunks:
+            tasks.append((template, templates_dir, 
+                          [sequences[s] for s in chunk],
+                          df_dope if store is None else None, gap_score, 
+                          matrix_jobs, library, profile_cache, tile_size, 
+                          cutoff, band, store, fixed_point))
+            costs.append(task_cost(n, len(sequences[0]), len(chunk)))
+    results = run_tasks(process_template_sequences, tasks, costs, task_jobs)
+
+    energy_scores = np.empty((len(sequences), len(templates)))
+    for index, scores in enumerate(results):
+        energy_scores[chunks[index % n_chunks], index // n_chunks] = scores
+    return energy_scores
+
+
+def split_jobs(jobs: int, n_templates: int) -> tuple:
+    """
+    Split parallel jobs between tasks and the low-level matrices of each 
+    task. Tasks are processed in parallel first, and the cores left over 
+    are given to the low-level matrices, so that a single large template 
+    still uses all the cores.
+
+    Args:
+        jobs (int): Total number of parallel jobs.
+        n_templates (int): Number of tasks to process, such as templates or 
+                           sequence-template pairs.
+
+    Returns:
+        tuple: Number of tasks processed in parallel and number of 
+               processes filling the low-level matrices of each task.
+    """
+    template_jobs = max(1, min(jobs, n_templates))
+    return template_jobs, max(1, jobs // template_jobs)
+
+
+def fit_engine(n: int, m: int, engine: str, engine_options: dict,
+               band: int, jobs: int, max_memory: int) -> tuple:
+    """
+    Choose how to run a sequence-template pair within a memory budget.
+
+    The pair runs as requested if its estimated footprint fits. Otherwise 
+    the full and batched engines fall back to the batched engine with 
+    halved tiles, down to a single matrix per tile, then with a single 
+    process filling the low-level matrices. All the engines and tile sizes 
+    give identical scores.
+
+    Args:
+        n (int): Number of template residues.
+        m (int): Length of the sequence.
+        engine (str): Name of the requested low-level engine.
+        engine_options (dict): Keyword arguments of the engine.
+        band (int): Width of the diagonal band of the matrices, or None.
+        jobs (int): Number of processes filling the low-level matrices.
+        max_memory (int): Memory budget of the pair, in bytes.
+
+    Returns:
+        tuple: The engine, its options, the number of processes and the 
+               estimated footprint in bytes, or None if the pair does not 
+               fit in the budget.
+    """
+    engine_options = dict(engine_options or {})
+    fixed_point = engine_options.get('fixed_point', False)
+    footprint = task_memory(n, m, engine, 
+                            tile_size=engine_options.get('tile_size'),
+                            band=band, fixed_point=fixed_point, jobs=jobs)
+    if footprint <= max_memory or engine not in ('full', 'batched'):
+        return (engine, engine_options, jobs, footprint) \
+            if footprint <= max_memory else None
+
+    # Batched engine with smaller tiles, then with a single process
+    tile_size = engine_options.get('tile_size') if engine == 'batched' \
+        else None
+    tile_size = tile_size or max(1, TILE_BYTES // tile_matrix_bytes(
+        n, m, band, fixed_point
+    ))
+    for tile_jobs in sorted({jobs, 1}, reverse=True):
+        size = tile_size
+        while True:
+            footprint = task_memory(n, m, 'batched', tile_size=size, 
+                                    band=band, fixed_point=fixed_point,
+                                    jobs=tile_jobs)
+            if footprint <= max_memory:
+                return ('batched', {'tile_size': size, 
+                                    'fixed_point': fixed_point},
+                        tile_jobs, footprint)
+            if size == 1:
+                break
+            size = max(1, size // 2)
+    return None
+
+
 def process_sequences_and_templates(sequences: list, templates: list, 
                                     df_dope: pd.DataFrame, templates_dir: str, 
                                     gap_score: float, verbose: bool = False,
                                     dry_run: bool = False, 
                                     print_alignments: bool = False,
-                                    jobs: int = cpu_count()) -> pd.DataFrame:
+                                    jobs: int = cpu_count(),
+                                    library: str = None,
+                                    profile_cache: str = None,
+                                    engine: str = 'wavefront',
+                                    engine_options: dict = None,
+                                    cutoff: float = None,
+                                    band: int = None,
+                                    store: str = None,
+                                    result_cache: str = None,
+                                    checkpoint: str = None,
+                                    resume: bool = False,
+                                    max_memory: int = None,
+                                    skipped_file: str = None) -> pd.DataFrame:
     """
     Process all sequences from the list and compare them
-    with all templates, using parallel processing with joblib.
+    with all templates.
+
+    The sequence-template pairs are queued together, by windows of 
+    SEQUENCES_PER_QUEUE sequences, and run longest first on the persistent 
+    pool of the scheduler.
+
+    With a result cache, the pairs whose score is cached are not computed, 
+    and pairs with the same content (see result_cache) are computed once. 
+    Alignments are only printed for computed pairs, so the cache is not 
+    read when print_alignments is set.
+
+    With a checkpoint file, the score of each pair is appended to it as 
+    soon as it is computed, instead of being kept in memory, and the 
+    returned DataFrame is read back from it.
 
     Args:
-        sequences (list): List of sequences to process.
+        sequences (iterable): (name, sequence) pairs to process, possibly 
+                              streamed from a generator.
         templates (list): List of templates to process.
         df_dope (pd.DataFrame): DataFrame containing DOPE scores.
         templates_dir (str): Directory containing template files.
         verbose (bool): If True, enables verbose output.
         dry_run (bool): If True, only log actions without processing.
-        jobs (int): Number of parallel jobs to use for processing.
+        jobs (int): Number of parallel jobs to use for processing, split 
+                    between sequence-template pairs and the low-level 
+                    matrices of each pair by split_jobs.
+        library (str, optional): Path of a compiled template library to read 
+                                 the templates from. Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        engine (str): Name of the low-level engine. 
+                      Defaults to 'wavefront'.
+        engine_options (dict, optional): Keyword arguments of the engine. 
+                                         Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices. 
+                              Defaults to None.
+        store (str, optional): Shared store of the DOPE table and of the 
+                               templates. A store is created for the call if 
+                               None and templates are processed in parallel. 
+                               Defaults to None.
+        result_cache (str, optional): Path of the SQLite result cache. 
+                                      Defaults to None.
+        checkpoint (str, optional): Path of the checkpoint CSV file, with 
+                                    the columns 'sequence', 'template', 
+                                    'sequence_hash' and 'energy_score'. 
+                                    Defaults to None.
+        resume (bool, optional): If True, the pairs already in the 
+                                 checkpoint file are not computed again, 
+                                 except the pairs that failed. 
+                                 Defaults to False.
+        max_memory (int, optional): Memory budget of the running pairs, in 
+                                    bytes. Pairs are admitted while their 
+                                    estimated footprints fit, oversized 
+                                    pairs fall back to lower-memory engines 
+                                    (see fit_engine), and the pairs that 
+                                    still do not fit are skipped with a NaN 
+                                    score. Defaults to None (no budget).
+        skipped_file (str, optional): Path of a CSV file listing the pairs 
+                                      skipped for the memory budget, only 
+                                      written if some pairs were skipped. 
+                                      Defaults to None.
 
     Returns:
         pd.DataFrame: A DataFrame containing energy scores for all
                       sequence-template pairs.
+
+    Raises:
+        ValueError: If a band is given for an engine without band support, 
+                    or if the checkpoint file to resume was written with 
+                    other options or sequences.
     """
+    if band is not None and engine not in BAND_ENGINES:
+        raise ValueError(f"The {engine} engine does not support a band, "
+                         f"use one of {sorted(BAND_ENGINES)}.")
     energy_scores = {}
+    sequence_files = []
+    skipped = []
+    sequences = iter(sequences)
 
-    for sequence_file, sequence in sequences:
-        logging.info(
-            f"Processing sequence {sequence_file}, length: {len(sequence)}"
-        )
+    # Options of the run changing the scores, for the checkpoint and cache
+    score_key = (float(gap_score), hash_dope(df_dope), 
+                 engine_key(cutoff, band)) \
+        if (checkpoint or result_cache) and not dry_run else None
 
-        energy_scores[sequence_file] = {}
-
-        # Dry run - Log what would be processed
-        if dry_run:
-            for template in templates:
-                logging.info(f"Dry run: would process {sequence_file} "
-                             f"with template {template}")
-            continue
-
-        # Parallelize the template processing
-        results = Parallel(n_jobs=jobs)(
-            delayed(process_template_wrapper)(
-                template, sequence, templates_dir, df_dope, gap_score, 
-                print_alignments, jobs, verbose
-            ) for template in templates
+    completed = {}
+    stream = None
+    if checkpoint and not dry_run:
+        stream, completed_df = open_checkpoint(
+            checkpoint, 
+            ['sequence', 'template', 'sequence_hash', 'energy_score'], 
+            resume, 
+            fingerprint=dict(zip(['gap_score', 'dope', 'engine'], score_key))
         )
+        completed = dict(zip(zip(completed_df['sequence'].astype(str), 
+                                 completed_df['template'].astype(str)), 
+                             completed_df['sequence_hash'].astype(str)))
+
+    # Share the DOPE table and the templates with the workers
+    own_store = store is None and jobs > 1 and not dry_run
+    if own_store:
+        store = create_store(df_dope, templates, templates_dir, library)
+
+    cache = open_cache(result_cache) if result_cache and not dry_run \
+        else None
+    try:
+        coords_list = template_coordinates(
+            templates, templates_dir, 
+            attach_store(store)[1] if store is not None else library
+        ) if not dry_run else None
+        lengths = [0 if coords is None else len(coords) 
+                   for coords in coords_list or []]
+        if cache is not None:
+            template_hashes = {
+                template: None if coords is None else hash_template(coords)
+                for template, coords in zip(templates, coords_list)
+            }
+
+        while True:
+            window = list(islice(sequences, SEQUENCES_PER_QUEUE))
+            if not window:
+                break
 
-        # Store the energy scores for each template
-        for template, energy_score in zip(templates, results):
-            energy_scores[sequence_file][template] = energy_score
+            tasks, costs, sizes = [], [], []
+            for sequence_file, sequence in window:
+                logging.info(f"Processing sequence {sequence_file}, "
+                             f"length: {len(sequence)}")
+                sequence_files.append(sequence_file)
+                if stream is None:
+                    energy_scores[sequence_file] = {}
 
+                # Dry run - Log what would be processed
+                if dry_run:
+                    for template in templates:
+                        logging.info(f"Dry run: would process "
+                                     f"{sequence_file} with template "
+                                     f"{template}")
+                    continue
+
+                for template, n in zip(templates, lengths):
+                    if (sequence_file, template) in completed:
+                        if completed[sequence_file, template] \
+                                != hash_sequence(sequence):
+                            raise ValueError(f"Cannot resume '{checkpoint}':"
+                                             f" the sequence of "
+                                             f"{sequence_file} changed.")
+                        continue
+                    tasks.append((sequence_file, template, sequence))
+                    costs.append(task_cost(n, len(sequence)))
+                    sizes.append((n, len(sequence)))
+            if not tasks:
+                continue
+
+            # Key the pairs by content, or by position without a cache
+            keys = list(range(len(tasks)))
+            cached = {}
+            if cache is not None:
+                for index, (_, template, sequence) in enumerate(tasks):
+                    template_hash = template_hashes[template]
+                    if template_hash is not None:
+                        keys[index] = (hash_sequence(sequence), 
+                                       template_hash, *score_key)
+                if not print_alignments:
+                    cached = lookup_scores(cache, [
+                        key for key in keys if isinstance(key, tuple)
+                    ])
+            # Pairs to compute, each with all the pairs sharing its key
+            pending = {}
+            for index, key in enumerate(keys):
+                if key not in cached:
+                    pending.setdefault(key, []).append(index)
+            if cache is not None:
+                logging.info(f"Result cache: {len(tasks) - len(pending)} of "
+                             f"{len(tasks)} pairs cached or duplicated.")
+
+            def save_scores(indices, energy_score):
+                """Store or stream the energy score of pairs."""
+                if stream is not None:
+                    append_rows(stream, [(*tasks[index][:2], 
+                                          hash_sequence(tasks[index][2]), 
+                                          energy_score)
+                                         for index in indices])
+                    return
+                for index in indices:
+                    sequence_file, template, _ = tasks[index]
+                    energy_scores[sequence_file][template] = energy_score
+
+            for index, key in enumerate(keys):
+                if key in cached:
+                    save_scores([index], cached[key])
+
+            # Run the pending sequence-template pairs, longest first, and 
+            # save each score as soon as it is computed
+            first = [indices[0] for indices in pending.values()]
+            task_jobs, matrix_jobs = split_jobs(jobs, max(1, len(pending)))
+
+            # Fit each pair in the memory budget, or skip it
+            plans = {index: (engine, engine_options, matrix_jobs, None) 
+                     for index in first}
+            if max_memory is not None:
+                for index in first:
+                    plans[index] = fit_engine(*sizes[index], engine, 
+                                              engine_options, band, 
+                                              matrix_jobs, max_memory)
+                    sequence_file, template, _ = tasks[index]
+                    if plans[index] is None:
+                        # Smallest footprint of the pair, in any engine
+                        footprint = task_memory(
+                            *sizes[index], 'batched', tile_size=1, band=band, 
+                            fixed_point=(engine_options or {}).get(
+                                'fixed_point', False
+                            )
+                        )
+                        logging.warning(f"Skipping {sequence_file} with "
+                                        f"template {template}: it needs at "
+                                        f"least {footprint / 2**20:.1f} MiB, "
+                                        f"over the memory budget.")
+                        skipped.append((sequence_file, template, 
+                                        *sizes[index], footprint))
+                        save_scores(pending[keys[index]], float('nan'))
+                    elif plans[index][:3] != (engine, engine_options, 
+                                              matrix_jobs):
+                        logging.info(f"Running {sequence_file} with template "
+                                     f"{template} on the {plans[index][0]} "
+                                     f"engine with options "
+                                     f"{plans[index][1]} and "
+                                     f"{plans[index][2]} jobs to fit the "
+                                     f"memory budget.")
+                first = [index for index in first 
+                         if plans[index] is not None]
+
+            results = run_tasks(process_template_wrapper, [
+                (tasks[index][1], tasks[index][2], templates_dir, 
+                 df_dope if store is None else None, gap_score, 
+                 print_alignments, plans[index][2], verbose, library, 
+                 profile_cache, plans[index][0], plans[index][1], cutoff, 
+                 band, store)
+                for index in first
+            ], [costs[index] for index in first], task_jobs, 
+                callback=lambda position, energy_score: save_scores(
+                    pending[keys[first[position]]], energy_score
+                ), 
+                footprints=[plans[index][3] for index in first], 
+                max_memory=max_memory)
+            if cache is not None:
+                store_scores(cache, {keys[index]: energy_score 
+                                     for index, energy_score 
+                                     in zip(first, results)
+                                     if isinstance(keys[index], tuple)})
+    finally:
+        if own_store:
+            remove_store(store)
+        if cache is not None:
+            cache.close()
+        if stream is not None:
+            stream.close()
+
+    # Report the pairs skipped for the memory budget
+    if skipped:
+        logging.warning(f"{len(skipped)} pairs did not fit in the memory "
+                        f"budget and were skipped.")
+    if skipped and skipped_file:
+        pd.DataFrame(skipped, columns=[
+            'sequence', 'template', 'n', 'm', 'estimated_bytes'
+        ]).to_csv(skipped_file, index=False)
+        logging.info(f"Skipped pairs saved to '{skipped_file}'.")
+    elif skipped_file and not dry_run and os.path.exists(skipped_file):
+        # Drop the list of an earlier run
+        os.remove(skipped_file)
+
+    if stream is not None:
+        # Read the scores back, in the order of the sequences and templates
+        energy_scores_df = load_checkpoint(checkpoint).drop_duplicates(
+            ['sequence', 'template'], keep='last'
+        ).pivot(index='sequence', columns='template', values='energy_score')
+        return energy_scores_df.reindex(
+            index=sequence_files, columns=templates
+        ).rename_axis(index=None, columns=None)
     return pd.DataFrame(energy_scores).T
 
 
+def sweep_gap_scores(sequences: list, templates: list, 
+                     df_dope: pd.DataFrame, templates_dir: str,
+                     gap_scores: list, jobs: int = cpu_count(),
+                     library: str = None, profile_cache: str = None,
+                     tile_size: int = None, cutoff: float = None,
+                     band: int = None, store: str = None,
+                     fixed_point: bool = False) -> pd.DataFrame:
+    """
+    Calculate the energy scores of all sequence-template pairs for several 
+    gap scores at once.
+
+    The sequences are grouped by length, and each (template, length) group 
+    is one task of the scheduler that loads and profiles the template once 
+    and evaluates all the sequences and gap scores of the group along the 
+    batch axis of process_template_gaps.
+
+    Args:
+        sequences (iterable): (name, sequence) pairs to process.
+        templates (list): List of templates to process.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        templates_dir (str): Directory containing template files.
+        gap_scores (list): The gap scores to evaluate.
+        jobs (int): Number of parallel jobs, split between tasks and the 
+                    low-level matrices of each task by split_jobs.
+        library (str, optional): Path of a compiled template library. 
+                                 Defaults to None.
+        profile_cache (str, optional): Directory of the on-disk cache of 
+                                       template energy profiles. 
+                                       Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+                                   Defaults to None.
+        cutoff (float, optional): Distance cutoff of the template contacts. 
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices. 
+                              Defaults to None.
+        store (str, optional): Shared store of the DOPE table and of the 
+                               templates. A store is created for the call if 
+                               None and jobs > 1. Defaults to None.
+        fixed_point (bool, optional): If True, runs both dynamic programming 
+                                      levels in int32 hundredths. 
+                                      Defaults to False.
+
+    Returns:
+        pd.DataFrame: Long-format energy scores, with one row per gap score, 
+                      sequence and template, in the columns 'gap_score', 
+                      'sequence', 'template' and 'energy_score'.
+    """
+    sequences = list(sequences)
+    groups = {}
+    for sequence_file, sequence in sequences:
+        groups.setdefault(len(sequence), []).append((sequence_file, sequence))
+
+    own_store = store is None and jobs > 1
+    if own_store:
+        store = create_store(df_dope, templates, templates_dir, library)
+
+    try:
+        lengths = template_lengths(
+            templates, templates_dir, 
+            attach_store(store)[1] if store is not None else library
+        )
+        tasks, costs = [], []
+        for template, n in zip(templates, lengths):
+            for m, group in groups.items():
+                tasks.append((template, group))
+                costs.append(task_cost(n, m, len(group) * len(gap_scores)))
+        task_jobs, matrix_jobs = split_jobs(jobs, len(tasks))
+        results = run_tasks(process_template_gaps, [
+            (template, templates_dir, [sequence for _, sequence in group], 
+             df_dope if store is None else None, gap_scores, matrix_jobs, 
+             library, profile_cache, tile_size, cutoff, band, store, 
+             fixed_point)
+            for template, group in tasks
+        ], costs, task_jobs)
+    finally:
+        if own_store:
+            remove_store(store)
+
+    energy_scores = {}
+    for (template, group), scores in zip(tasks, results):
+        for g, gap_score in enumerate(gap_scores):
+            for (sequence_file, _), energy_score in zip(group, scores[g]):
+                energy_scores[gap_score, sequence_file, template] = \
+                    energy_score
+
+    # Rows by gap score, then in the order of the sequences and templates
+    rows = [(gap_score, sequence_file, template, 
+             energy_scores[gap_score, sequence_file, template])
+            for gap_score in gap_scores
+            for sequence_file, _ in sequences
+            for template in templates]
+    return pd.DataFrame(rows, columns=['gap_score', 'sequence', 'template', 
+                                       'energy_score'])
+
+
+def ranking_drift(energy_scores_df: pd.DataFrame, 
+                  reference_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Measure the drift of energy scores against reference energy scores.
+
+    Args:
+        energy_scores_df (pd.DataFrame): Energy scores to evaluate, such as 
+                                         those of the cutoff mode.
+        reference_df (pd.DataFrame): Reference energy scores of the same 
+                                     sequence-template pairs.
+
+    Returns:
+        pd.DataFrame: For each sequence, the largest absolute difference of 
+                      the scores ('max_abs_diff'), the Spearman correlation 
+                      of the template rankings ('spearman') and whether the 
+                      best (lowest) template is the same ('same_best').
+    """
+    drift = {}
+    for sequence_file in energy_scores_df.index:
+        scores = energy_scores_df.loc[sequence_file].astype(float)
+        reference = reference_df.loc[sequence_file, scores.index].astype(float)
+        drift[sequence_file] = {
+            'max_abs_diff': (scores - reference).abs().max(),
+            'spearman': scores.rank().corr(reference.rank()),
+            'same_best': scores.idxmin() == reference.idxmin()
+        }
+    return pd.DataFrame(drift).T
+
+
 def save_energy_scores(energy_scores_df: pd.DataFrame, 
                        filename: str = 'results/energy_scores.csv') -> None:
     """
@@ -206,9 +1031,34 @@ def main() -> None:
 
     Command-line Arguments:
         --sequences (optional): A comma-separated list of sequence filenames.
+        --fasta (optional): A multi-record FASTA file to stream sequences from.
+        --ids (optional): A comma-separated list of record IDs of --fasta.
         --templates (optional): A comma-separated list of template filenames.
         --output_file (optional): Path for the output CSV file.
         --jobs (optional): Number of parallel jobs to use.
+        --dope (optional): URL or path of the DOPE score data file.
+        --dope_cache (optional): Path of the cached DOPE CA-CA table.
+        --library (optional): Path of a compiled template library.
+        --profile_cache (optional): Directory of the template profile cache.
+        --engine (optional): Name of the low-level engine.
+        --tile_size (optional): Number of low-level matrices per tile of the 
+                                batched engine.
+        --cutoff (optional): Distance cutoff of the template contacts.
+        --report_drift (optional): If set with --cutoff, also compute the 
+                                   exact scores and report the ranking drift.
+        --band (optional): Width of the diagonal band of the matrices.
+        --fixed_point (optional): If set, runs the batched engine and the 
+                                  high-level matrix in int32 hundredths.
+        --gap_scores (optional): A comma-separated list of gap scores to 
+                                 sweep at once, saved in long format.
+        --result_cache (optional): Path of the SQLite cache of the scores 
+                                   of earlier runs.
+        --resume (optional): If set, skips the pairs already saved to the 
+                             checkpoint file of the output file.
+        --max_memory (optional): Memory budget of the running pairs.
+        --profile (optional): If set, saves the timings of the stages of 
+                              each task to a JSON summary and a Chrome trace 
+                              next to the output file.
         --dry_run (optional): If set, log actions without processing.
         --verbose (optional): Enables verbose output (debug-level logging).
     """
@@ -220,6 +1070,16 @@ def main() -> None:
         type=str, 
         help='Comma-separated list of sequence filenames'
         )
+    parser.add_argument(
+        '--fasta', 
+        type=str, 
+        help='Multi-record FASTA file to stream the sequences from'
+        )
+    parser.add_argument(
+        '--ids', 
+        type=str, 
+        help='Comma-separated list of record IDs to select from --fasta'
+        )
     parser.add_argument(
         '--templates', 
         type=str, 
@@ -231,6 +1091,13 @@ def main() -> None:
         default=0.0, 
         help='Gap score for sequence to structure alignment'
         )
+    parser.add_argument(
+        '--gap_scores',
+        type=str,
+        help='Comma-separated list of gap scores to sweep at once with the '
+             'batched engine, instead of --gap_score. The scores are saved '
+             'in long format, one row per gap score, sequence and template'
+        )
     parser.add_argument(
         '--output_file',
         type=str, 
@@ -243,6 +1110,99 @@ def main() -> None:
         default=cpu_count(), 
         help='Number of parallel jobs to run, default is all cores'
         )
+    parser.add_argument(
+        '--dope',
+        type=str,
+        default=DOPE_URL,
+        help='URL or path of the DOPE score data file'
+        )
+    parser.add_argument(
+        '--dope_cache',
+        type=str,
+        default=DOPE_CACHE,
+        help='Path of the cached DOPE CA-CA table (.npy)'
+        )
+    parser.add_argument(
+        '--library',
+        type=str,
+        help='Compiled template library to read the templates from'
+        )
+    parser.add_argument(
+        '--profile_cache',
+        type=str,
+        help='Directory to persist the template energy profiles in'
+        )
+    parser.add_argument(
+        '--engine',
+        type=str,
+        choices=list(LOW_LEVEL_ENGINES),
+        help='Low-level engine: "full" keeps the 4D low-level matrices, '
+             '"score" only their terminal values, "wavefront" also fills '
+             'them one anti-diagonal at a time, "batched" fills tiles of '
+             'them at once. Default is "wavefront", or "batched" with '
+             '--gap_scores'
+        )
+    parser.add_argument(
+        '--tile_size',
+        type=int,
+        help='Number of low-level matrices per tile of the batched engine, '
+             'default is derived from a memory budget'
+        )
+    parser.add_argument(
+        '--cutoff',
+        type=float,
+        help='Distance cutoff (in A) of the template contacts, pairs beyond '
+             'it share far-field DOPE energies, default is no cutoff'
+        )
+    parser.add_argument(
+        '--report_drift',
+        action='store_true',
+        help='With --cutoff, also compute the exact scores and save the '
+             'ranking drift of the cutoff mode'
+        )
+    parser.add_argument(
+        '--band',
+        type=int,
+        help='Number of diagonals kept on both sides of the band joining '
+             'the corners of the matrices (batched engine only), default is '
+             'no band'
+        )
+    parser.add_argument(
+        '--fixed_point',
+        action='store_true',
+        help='Fill the matrices in int32 hundredths instead of float64, with '
+             'identical scores and half the memory (batched engine only)'
+        )
+    parser.add_argument(
+        '--result_cache',
+        type=str,
+        help='Path of an SQLite cache of the energy scores, keyed by the '
+             'content of the sequences and templates: cached pairs are not '
+             'computed again'
+        )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume an interrupted run: pairs already saved to the '
+             'checkpoint file <output_file stem>_checkpoint.csv are not '
+             'computed again'
+        )
+    parser.add_argument(
+        '--max_memory',
+        type=str,
+        help='Memory budget of the running pairs, such as 8G: pairs run '
+             'only while their estimated footprints fit, oversized pairs '
+             'fall back to smaller tiles of the batched engine, and pairs '
+             'that still do not fit are skipped and listed in '
+             '<output_file stem>_skipped.csv'
+        )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Time the stages of each task in the workers and save a JSON '
+             'summary to <output_file stem>_profile.json and a Chrome trace '
+             'to <output_file stem>_trace.json'
+        )
     parser.add_argument(
         '--print_alignments', 
         action='store_true', 
@@ -261,14 +1221,66 @@ def main() -> None:
 
     args = parser.parse_args()
 
+    if args.ids and not args.fasta:
+        parser.error("--ids requires --fasta")
+    if args.report_drift and args.cutoff is None:
+        parser.error("--report_drift requires --cutoff")
+    # The gap score sweep always runs the batched engine
+    if args.gap_scores and args.engine not in (None, 'batched'):
+        parser.error("--gap_scores requires --engine batched")
+    if args.engine is None:
+        args.engine = 'batched' if args.gap_scores else 'wavefront'
+    if args.band is not None and args.engine not in BAND_ENGINES:
+        parser.error("--band requires --engine batched")
+    if args.band is not None and args.band < 0:
+        parser.error("--band must be non-negative")
+    if args.fixed_point and args.engine != 'batched':
+        parser.error("--fixed_point requires --engine batched")
+    if args.tile_size is not None and args.engine != 'batched':
+        parser.error("--tile_size requires --engine batched")
+    if args.tile_size is not None and args.tile_size < 1:
+        parser.error("--tile_size must be positive")
+    if args.gap_scores:
+        try:
+            args.gap_scores = [float(gap_score) 
+                               for gap_score in args.gap_scores.split(',')]
+        except ValueError:
+            parser.error("--gap_scores must be a comma-separated list of "
+                         "numbers")
+        if args.print_alignments or args.report_drift or args.resume \
+                or args.result_cache:
+            parser.error("--gap_scores does not support --print_alignments, "
+                         "--report_drift, --resume and --result_cache")
+    gap_scores = args.gap_scores or [args.gap_score]
+    if args.max_memory is not None:
+        if args.gap_scores:
+            parser.error("--gap_scores does not support --max_memory")
+        try:
+            args.max_memory = parse_memory(args.max_memory)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.fixed_point and any(round(gap_score, 2) != gap_score 
+                                for gap_score in gap_scores):
+        parser.error("--fixed_point requires gap scores in hundredths")
+
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    # Files written next to the output file
+    stem = os.path.splitext(args.output_file)[0]
+    if args.profile:
+        enable_profiling()
+
     logging.info("Loading DOPE score data...")
-    df_dope = load_dope(DOPE_URL)
+    df_dope = load_dope_cached(args.dope, args.dope_cache)
 
-    # Load all sequences or only the specified ones
-    if args.sequences:
+    # Stream the records of a multi-record FASTA file, or load all sequences 
+    # or only the specified ones
+    if args.fasta and args.ids:
+        sequences = fetch_fasta_records(args.fasta, args.ids.split(','))
+    elif args.fasta:
+        sequences = iter_fasta(args.fasta)
+    elif args.sequences:
         sequence_files = args.sequences.split(',')
         sequences = [
             (file, 
@@ -285,24 +1297,107 @@ def main() -> None:
     # Load all templates or only the specified ones
     if args.templates:
         templates = args.templates.split(',')
+    elif args.library:
+        templates = list(load_library(args.library))
     else:
         templates = load_templates(TEMPLATES_DIR)
 
+    # The drift report processes the sequences twice
+    if args.report_drift:
+        sequences = list(sequences)
+
+    # Sweep all the gap scores at once
+    if args.gap_scores:
+        logging.info(f"Sweeping {len(args.gap_scores)} gap scores...")
+        if args.dry_run:
+            logging.info(f"Dry run: would process {len(templates)} templates "
+                         f"with gap scores {args.gap_scores}")
+            return
+        energy_scores_df = sweep_gap_scores(
+            sequences, templates, df_dope, TEMPLATES_DIR, args.gap_scores,
+            jobs=args.jobs, library=args.library, 
+            profile_cache=args.profile_cache, tile_size=args.tile_size, 
+            cutoff=args.cutoff, band=args.band, fixed_point=args.fixed_point
+        )
+        energy_scores_df.to_csv(args.output_file, index=False)
+        logging.info(f"Energy scores saved to '{args.output_file}'.")
+        if args.profile:
+            export_profile(f"{stem}_profile.json", f"{stem}_trace.json")
+        return
+
+    # Options of the low-level engine
+    engine_options = {}
+    if args.engine == 'batched':
+        engine_options['tile_size'] = args.tile_size
+        engine_options['fixed_point'] = args.fixed_point
+
+    # Stream the scores to a checkpoint file next to the output file
     logging.info("Processing sequences and templates...")
-    energy_scores_df = process_sequences_and_templates(
-        sequences, 
-        templates, 
-        df_dope, 
-        TEMPLATES_DIR, 
-        gap_score=args.gap_score,
-        verbose=args.verbose, 
-        print_alignments=args.print_alignments,
-        dry_run=args.dry_run, 
-        jobs=args.jobs
-    )
+    try:
+        energy_scores_df = process_sequences_and_templates(
+            sequences, 
+            templates, 
+            df_dope, 
+            TEMPLATES_DIR, 
+            gap_score=args.gap_score,
+            verbose=args.verbose, 
+            print_alignments=args.print_alignments,
+            dry_run=args.dry_run, 
+            jobs=args.jobs,
+            library=args.library,
+            profile_cache=args.profile_cache,
+            engine=args.engine,
+            engine_options=engine_options,
+            cutoff=args.cutoff,
+            band=args.band,
+            result_cache=args.result_cache,
+            checkpoint=f"{stem}_checkpoint.csv",
+            resume=args.resume,
+            max_memory=args.max_memory,
+            skipped_file=f"{stem}_skipped.csv" if args.max_memory else None
+        )
+    except ValueError as e:
+        parser.error(str(e))
 
+    # The checkpoint is only kept until the output file is written
     if not args.dry_run:
         save_energy_scores(energy_scores_df, args.output_file)
+        remove_checkpoint(f"{stem}_checkpoint.csv")
+
+    if args.report_drift and not args.dry_run:
+        logging.info("Processing sequences and templates without cutoff...")
+        try:
+            reference_df = process_sequences_and_templates(
+                sequences, 
+                templates, 
+                df_dope, 
+                TEMPLATES_DIR, 
+                gap_score=args.gap_score,
+                verbose=args.verbose, 
+                jobs=args.jobs,
+                library=args.library,
+                profile_cache=args.profile_cache,
+                engine=args.engine,
+                engine_options=engine_options,
+                band=args.band,
+                result_cache=args.result_cache,
+                checkpoint=f"{stem}_reference_checkpoint.csv",
+                resume=args.resume,
+                max_memory=args.max_memory
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        drift_df = ranking_drift(energy_scores_df, reference_df)
+        drift_file = f"{stem}_drift.csv"
+        drift_df.to_csv(drift_file)
+        remove_checkpoint(f"{stem}_reference_checkpoint.csv")
+        logging.info(f"Cutoff of {args.cutoff} A: mean Spearman correlation "
+                     f"{drift_df['spearman'].mean():.3f}, largest score "
+                     f"difference {drift_df['max_abs_diff'].max():.2f}. "
+                     f"Ranking drift saved to '{drift_file}'.")
+
+    if args.profile and not args.dry_run:
+        export_profile(f"{stem}_profile.json", f"{stem}_trace.json")
 
 
 if __name__ == "__main__":
@@ -3,6 +3,9 @@ DOPE Score Processing Module
 
 This module provides functionality to find and interpolate DOPE scores 
 for given residue pairs and distances based on a DOPE score data frame.
+The data frame can also be compiled into a dense (20, 20, n_bins) tensor 
+indexed by residue codes, which allows whole arrays of residue pairs and 
+distances to be scored in a single vectorized call.
 
 DOPE (Discrete Optimized Protein Energy) score is a statistical potential
 used to evaluate the energy of protein structures. This module allows the 
@@ -17,6 +20,12 @@ Example:
     from process_dope import find_dope_score
     score = find_dope_score('A', 'W', 3.5, dope_df, verbose=True)
     print(f"DOPE Score: {score}")
+
+    from process_dope import compile_dope, encode_sequence, find_dope_scores
+    dope_tensor, dope_distances = compile_dope(dope_df)
+    codes = encode_sequence('AW')
+    scores = find_dope_scores(codes[0], codes, [3.5, 7.2],
+                              dope_tensor, dope_distances)
 """
 
 __authors__ = "Nadezhda Zhukova"
@@ -27,6 +36,7 @@ __version__ = "1.0.0"
 
 
 import logging
+from Bio.SeqUtils import IUPACData
 import numpy as np
 import pandas as pd
 
@@ -35,6 +45,10 @@ if not logging.getLogger().hasHandlers():
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Residue order used to index the compiled DOPE tensor
+AMINO_ACIDS = IUPACData.protein_letters
+RESIDUE_CODES = {residue: code for code, residue in enumerate(AMINO_ACIDS)}
+
 
 def find_dope_score(res1, res2, distance, dope_df, verbose=False):
     """
@@ -121,4 +135,106 @@ def find_dope_score(res1, res2, distance, dope_df, verbose=False):
         raise
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def encode_sequence(sequence: str) -> np.ndarray:
+    """
+    Convert a sequence of one-letter residue names to residue codes.
+
+    Args:
+        sequence (str): Sequence of residues (e.g., 'AWG').
+
+    Returns:
+        np.ndarray: Integer residue codes indexing the compiled DOPE tensor.
+
+    Raises:
+        ValueError: If the sequence contains an unknown residue.
+    """
+    try:
+        return np.array([RESIDUE_CODES[residue] for residue in sequence],
+                        dtype=np.intp)
+    except KeyError as e:
+        raise ValueError(f"No DOPE residue code for residue {e}.")
+
+
+def compile_dope(dope_df: pd.DataFrame) -> tuple:
+    """
+    Compile the DOPE DataFrame into a dense tensor indexed by residue codes.
+
+    Args:
+        dope_df (pd.DataFrame): A DataFrame containing the DOPE scores, with 
+                                columns 'res1', 'res2', and subsequent distance 
+                                columns holding the DOPE scores.
+
+    Returns:
+        tuple: The DOPE tensor with shape (20, 20, n_bins), where missing 
+               residue pairs are NaN, and the sorted distances of the bins.
+    """
+    logging.debug("Compiling DOPE scores into a dense tensor")
+    dope_distances = dope_df.columns[2:].astype(float).to_numpy()
+    dope_tensor = np.full((len(AMINO_ACIDS), len(AMINO_ACIDS), 
+                           len(dope_distances)), np.nan, dtype=float)
+
+    res1_codes = dope_df['res1'].map(RESIDUE_CODES)
+    res2_codes = dope_df['res2'].map(RESIDUE_CODES)
+    known = res1_codes.notna() & res2_codes.notna()
+    dope_tensor[res1_codes[known].astype(int), 
+                res2_codes[known].astype(int)] = \
+        dope_df.loc[known, dope_df.columns[2:]].to_numpy(dtype=float)
+
+    logging.debug(f"DOPE tensor compiled with shape: {dope_tensor.shape}")
+    return dope_tensor, dope_distances
+
+
+def find_dope_scores(res1, res2, distances, dope_tensor: np.ndarray,
+                     dope_distances: np.ndarray) -> np.ndarray:
+    """
+    Find the DOPE scores for arrays of residue codes and distances at once.
+    The arguments are broadcast against each other, and every score is 
+    clamped or linearly interpolated exactly as in `find_dope_score`.
+
+    Args:
+        res1 (array_like): Residue codes of the first residues.
+        res2 (array_like): Residue codes of the second residues.
+        distances (array_like): Distances between the residues.
+        dope_tensor (np.ndarray): DOPE tensor returned by `compile_dope`.
+        dope_distances (np.ndarray): Bin distances returned by `compile_dope`.
+
+    Returns:
+        np.ndarray: The interpolated or closest DOPE scores, with the 
+                    broadcast shape of the arguments.
+
+    Raises:
+        ValueError: If a residue pair has no DOPE scores.
+    """
+    res1, res2, distances = np.broadcast_arrays(
+        np.asarray(res1), np.asarray(res2), np.asarray(distances, dtype=float)
+    )
+
+    # Find the two closest distances to every given distance
+    upper_idx = np.clip(np.searchsorted(dope_distances, distances), 
+                        1, len(dope_distances) - 1)
+    lower_idx = upper_idx - 1
+
+    lower_dist = dope_distances[lower_idx]
+    upper_dist = dope_distances[upper_idx]
+
+    # DOPE scores at the two closest distances
+    lower_score = dope_tensor[res1, res2, lower_idx]
+    upper_score = dope_tensor[res1, res2, upper_idx]
+
+    # Linear interpolation
+    dope_scores = lower_score + (upper_score - lower_score) * \
+                  (distances - lower_dist) / (upper_dist - lower_dist)
+
+    # Clamp the distances outside the range of available columns
+    dope_scores = np.where(distances >= dope_distances[-1], 
+                           dope_tensor[res1, res2, -1], dope_scores)
+    dope_scores = np.where(distances <= dope_distances[0], 
+                           dope_tensor[res1, res2, 0], dope_scores)
+
+    if np.isnan(dope_tensor[res1, res2, 0]).any():
+        raise ValueError("No matching DOPE for some residue pairs.")
+
+    return dope_scores
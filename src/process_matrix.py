@@ -10,9 +10,34 @@ Functions:
 - initialize_low_level_matrices: Initializes a 4D matrix filled with NaN.
 - set_boundary_conditions: Sets boundaries for a given low-level matrix.
 - fill_matrix_region: Fills a region of a low-level matrix with DOPE scores.
+- fill_matrix_wavefront: Fills both regions of a low-level matrix one 
+  anti-diagonal at a time with vectorized operations.
+- fill_low_level_matrix: Fills one low-level matrix by setting boundary 
+  conditions and filling matrix regions.
 - fill_low_level_matrices: Fills multiple low-level matrices by setting 
   boundary conditions and filling matrix regions.
-- fill_high_level_matrix: Fills a high-lvl matrix using the low-lvl matrices.
+- fill_low_level_scores: Computes only the terminal values of the low-level 
+  matrices in a reusable O(n*m) scratch buffer (score-only engine).
+- fill_low_level_scores_batched: Computes the terminal values of tiles of 
+  low-level matrices stacked along a batch axis (batched engine), optionally 
+  restricted to a diagonal band.
+- fill_low_level_scores_sequences: Computes the terminal values of the 
+  low-level matrices of several sequences of the same length at once.
+- fill_low_level_scores_gaps: Computes the terminal values of the low-level 
+  matrices of several sequences for several gap scores at once.
+- band_limits: Returns the diagonal offsets delimiting a band.
+- to_fixed_point: Converts scores to int32 hundredths.
+- from_fixed_point: Converts int32 hundredths back to scores.
+- fill_shared: Runs a block function over blocks of (i, j) pairs in a 
+  process pool that writes into a shared memory-mapped result.
+- fill_high_level_matrix: Fills a high-lvl matrix using the low-lvl matrices, 
+  optionally with int8 back-pointers.
+- fill_high_level_matrices: Fills the high-level matrices of several 
+  sequences at once from their terminal values.
+- traceback_alignment: Follows the back-pointers of a high-level matrix and 
+  returns the template position aligned with each residue.
+- format_alignment: Formats an alignment as lines of template positions, 
+  connectors and residues.
 
 Usage:
     Import this module and use its functions to preprocess data for 
@@ -22,7 +47,7 @@ Example:
     from process_matrix import initialize_low_level_matrices, \
                                set_boundary_conditions, fill_matrix_region, \
                                fill_low_level_matrices, \
-                               fill_high_level_matrix
+                               fill_low_level_scores, fill_high_level_matrix
 """
 
 __authors__ = "Nadezhda Zhukova"
@@ -32,17 +57,34 @@ __date__ = "2024-09-06"
 __version__ = "1.0.0"
 
 
+from functools import partial
 import logging
+import os
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 from joblib import Parallel, delayed
-from process_dope import find_dope_score
+from energy_profile import TemplateProfile, get_template_profile
+from process_dope import find_dope_score, encode_sequence
+from profiling import stage
 
 # Setup logging configuration if not already configured
 if not logging.getLogger().hasHandlers():
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Memory budget of a tile of fill_low_level_scores_batched (bytes)
+TILE_BYTES = 2**28
+
+# Number of blocks of (i, j) pairs per parallel job, for load balancing
+BLOCKS_PER_JOB = 4
+
+# Fixed-point scores are int32 hundredths, and FIXED_NAN stands for NaN: it 
+# is larger than any score, so that it loses every minimum like NaN in fmin
+FIXED_POINT_SCALE = 100
+FIXED_NAN = 2**30
+
 
 def initialize_low_level_matrices(n: int, m: int) -> np.ndarray:
     """
@@ -61,18 +103,34 @@ def initialize_low_level_matrices(n: int, m: int) -> np.ndarray:
 
 def set_boundary_conditions(low_level_matrix: np.ndarray, i: int, j: int,
                             sequence: str, dist_matrix: np.ndarray,
-                            df_dope: pd.DataFrame, gap_score: float) -> None:
+                            df_dope: pd.DataFrame, gap_score: float,
+                            origin_score: float = None) -> None:
+    """
+    Set the first row and column of a low-level matrix.
 
+    Args:
+        low_level_matrix (np.ndarray): The matrix to initialize.
+        i (int): Template position fixed by the low-level matrix.
+        j (int): Sequence position fixed by the low-level matrix.
+        sequence (str): Sequence of residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        gap_score (float): The gap score to be used.
+        origin_score (float, optional): Precomputed DOPE score between 
+            sequence[0] and sequence[j] at dist_matrix[0, i]. Looked up in 
+            df_dope if None. Defaults to None.
+    """
     if i == 0 and j == 0:
         low_level_matrix[0, 0] = 0
     else:
-        dope_score = find_dope_score(
-            res1=sequence[0], 
-            res2=sequence[j],  
-            distance=dist_matrix[0, i],
-            dope_df=df_dope
-        )
-        low_level_matrix[0, 0] = round(dope_score, 2)
+        if origin_score is None:
+            origin_score = find_dope_score(
+                res1=sequence[0], 
+                res2=sequence[j],  
+                distance=dist_matrix[0, i],
+                dope_df=df_dope
+            )
+        low_level_matrix[0, 0] = round(origin_score, 2)
     
     # Initialize first row (i=0) using values from the left
     for j in range(1, j+1):
@@ -88,7 +146,7 @@ def fill_matrix_region(low_level_matrix: np.ndarray, k_range: range,
                        l_range: range, sequence_j: str, 
                        dist_matrix_i: np.ndarray, df_dope: pd.DataFrame, 
                        sequence: list, gap_score: float,
-                       skip: set = None) -> None:
+                       skip: set = None, energies: np.ndarray = None) -> None:
     """
     Fill a region of a low-level matrix dynamically calculating the DOPE score.
     
@@ -101,6 +159,9 @@ def fill_matrix_region(low_level_matrix: np.ndarray, k_range: range,
         df_dope (pd.DataFrame): DataFrame containing DOPE scores.
         sequence (list): Sequence of residues.
         skip (set, optional): Set of (k, l) tuples to skip. Defaults to None.
+        energies (np.ndarray, optional): Precomputed (n, m) DOPE scores 
+            between sequence_j and sequence[l] at dist_matrix_i[k]. Looked 
+            up in df_dope if None. Defaults to None.
     """
     logging.debug(f"Filling matrix region for sequence residue '{sequence_j}'")
         
@@ -112,12 +173,15 @@ def fill_matrix_region(low_level_matrix: np.ndarray, k_range: range,
                 continue
             
             # Calculate DOPE score and fill the matrix
-            dope = find_dope_score(
-                res1=sequence_j,
-                res2=sequence[l],
-                distance=dist_matrix_i[k],
-                dope_df=df_dope
-            )
+            if energies is not None:
+                dope = energies[k, l]
+            else:
+                dope = find_dope_score(
+                    res1=sequence_j,
+                    res2=sequence[l],
+                    distance=dist_matrix_i[k],
+                    dope_df=df_dope
+                )
 
             # Find the minimum value from neighboring cells
             low_level_matrix[k, l] = np.nanmin([
@@ -129,9 +193,122 @@ def fill_matrix_region(low_level_matrix: np.ndarray, k_range: range,
                           f"= {low_level_matrix[k, l]}")
 
 
+def fill_matrix_wavefront(low_level_matrix: np.ndarray, i: int, j: int,
+                          gap_score: float, energies: np.ndarray) -> None:
+    """
+    Fill both regions of a low-level matrix one anti-diagonal at a time.
+
+    Cells on an anti-diagonal k + l = d only depend on the two previous 
+    anti-diagonals, so each anti-diagonal is computed as a single vectorized 
+    operation. The left-top region holds the anti-diagonals up to i + j and 
+    the right-bottom region those after it, so the scores are identical to 
+    the row-major fill of fill_matrix_region, for j > 0 and n > 1.
+
+    Args:
+        low_level_matrix (np.ndarray): The matrix to fill, with its boundary 
+                                       conditions set.
+        i (int): Template position fixed by the low-level matrix.
+        j (int): Sequence position fixed by the low-level matrix.
+        gap_score (float): The gap score to be used.
+        energies (np.ndarray): Precomputed (n, m) DOPE scores of the matrix.
+    """
+    n, m = low_level_matrix.shape
+    for d in range(1, n + m - 1):
+        if d <= i + j:
+            # Left-top region from (1,1) to (i,j)
+            k_min, k_max = max(1, d - j), min(i, d - 1)
+        else:
+            # Right-bottom region from (i,j) to (n-1,m-1)
+            k_min, k_max = max(i, d - m + 1), min(n - 1, d - j)
+        if k_min > k_max:
+            continue
+
+        k = np.arange(k_min, k_max + 1)
+        l = d - k
+        low_level_matrix[k, l] = np.fmin(
+            np.fmin(
+                np.round(low_level_matrix[k-1, l] + gap_score, 2), # Above
+                np.round(low_level_matrix[k, l-1] + gap_score, 2)  # Left
+            ),
+            np.round(low_level_matrix[k-1, l-1] + energies[k, l], 2) # Diag
+        )
+
+
+def fill_low_level_matrix(low_level_matrix: np.ndarray, i: int, j: int,
+                          sequence: list, dist_matrix: np.ndarray,
+                          gap_score: float, df_dope: pd.DataFrame,
+                          energies: np.ndarray = None,
+                          origin_score: float = None,
+                          wavefront: bool = False) -> None:
+    """
+    Fill the low-level matrix fixing template position i on sequence 
+    position j, by setting boundary conditions and filling both regions.
+
+    Args:
+        low_level_matrix (np.ndarray): The (n, m) matrix to fill, holding NaN.
+        i (int): Template position fixed by the low-level matrix.
+        j (int): Sequence position fixed by the low-level matrix.
+        sequence (list): Sequence of residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        gap_score (float): The gap score to be used.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        energies (np.ndarray, optional): Precomputed (n, m) DOPE scores of 
+            the matrix. Defaults to None.
+        origin_score (float, optional): Precomputed DOPE score of the 
+            origin of the matrix. Defaults to None.
+        wavefront (bool): If True and energies are given, fill both regions 
+            with fill_matrix_wavefront. Defaults to False.
+    """
+    n, m = low_level_matrix.shape
+
+    # Set initial boundary conditions
+    set_boundary_conditions(low_level_matrix=low_level_matrix,
+                            i=i, j=j,
+                            sequence=sequence,
+                            dist_matrix=dist_matrix,
+                            df_dope=df_dope,
+                            gap_score=gap_score,
+                            origin_score=origin_score)
+
+    # For j = 0 (or n = 1), cells read the previous row through index -1, 
+    # which only the row-major loops below reproduce
+    if wavefront and energies is not None and j > 0 and n > 1:
+        fill_matrix_wavefront(low_level_matrix, i, j, gap_score, energies)
+        return
+
+    # Fill the left-top region from (1,1) to (i,j)
+    fill_matrix_region(
+        low_level_matrix=low_level_matrix,
+        k_range=range(1, i+1),
+        l_range=range(1, j+1),
+        sequence_j=sequence[j],
+        dist_matrix_i=dist_matrix[i],
+        df_dope=df_dope,
+        gap_score=gap_score,
+        sequence=sequence,
+        energies=energies
+    )
+    
+    # Fill the right-bottom region from (i,j) to (n-1,m-1), skip (i,j)
+    fill_matrix_region(
+        low_level_matrix=low_level_matrix,
+        k_range=range(i, n),
+        l_range=range(j, m),
+        sequence_j=sequence[j],
+        dist_matrix_i=dist_matrix[i],
+        df_dope=df_dope,
+        gap_score=gap_score,
+        sequence=sequence,
+        skip={(i, j)},
+        energies=energies
+    )
+
+
 def fill_low_level_matrices(n: int, m: int, sequence: list, 
                             dist_matrix: np.ndarray, gap_score: float,
-                            df_dope: pd.DataFrame) -> np.ndarray:
+                            df_dope: pd.DataFrame,
+                            profile: TemplateProfile = None,
+                            jobs: int = 1) -> np.ndarray:
     """
     Fill low-level matrices by setting boundary conditions and filling regions.
     
@@ -141,207 +318,896 @@ def fill_low_level_matrices(n: int, m: int, sequence: list,
         sequence (list): List of sequence residues.
         dist_matrix (np.ndarray): Distance matrix for the sequence.
         df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        profile (TemplateProfile, optional): Energy profile of the template. 
+            Taken from the profile cache if None. Defaults to None.
+        jobs (int): Number of processes filling blocks of matrices. 
+            Defaults to 1.
     
     Returns:
         np.ndarray: 4D low-level matrices filled with computed values.
     """
     logging.debug(f"Filling low-level matrices with dimensions ({n}, {m})")
-    low_level_matrices = initialize_low_level_matrices(n, m)
 
-    for i in range(n):
-        for j in range(m):
-            low_level_matrix = low_level_matrices[i, j]
-            
-            # Set initial boundary conditions
-            set_boundary_conditions(low_level_matrix=low_level_matrix,
-                                    i=i, j=j,
-                                    sequence=sequence,
-                                    dist_matrix=dist_matrix,
-                                    df_dope=df_dope,
-                                    gap_score=gap_score)
-
-            # Fill the left-top region from (1,1) to (i,j)
-            fill_matrix_region(
-                low_level_matrix=low_level_matrix,
-                k_range=range(1, i+1),
-                l_range=range(1, j+1),
-                sequence_j=sequence[j],
-                dist_matrix_i=dist_matrix[i],
-                df_dope=df_dope,
-                gap_score=gap_score,
-                sequence=sequence
+    # Gather the energies of the low-level matrices from the template profile
+    if profile is None:
+        profile = get_template_profile(dist_matrix, df_dope)
+    codes = encode_sequence(sequence)
+    origin_scores = profile.origin_energies(codes)
+
+    blocks = np.array_split(np.arange(n * m), 
+                            min(n * m, jobs * BLOCKS_PER_JOB))
+    return fill_shared(_fill_matrices_block, blocks, (n, m, n, m), jobs,
+                       sequence, dist_matrix, gap_score, df_dope, profile,
+                       codes, origin_scores)
+
+
+def _fill_matrices_block(low_level_matrices: np.ndarray, pairs: np.ndarray,
+                         sequence: list, dist_matrix: np.ndarray,
+                         gap_score: float, df_dope: pd.DataFrame,
+                         profile: TemplateProfile, codes: np.ndarray,
+                         origin_scores: np.ndarray) -> None:
+    """Fill the low-level matrices of a block of flat (i, j) pairs."""
+    m = low_level_matrices.shape[1]
+    for i, j in zip(pairs // m, pairs % m):
+        fill_low_level_matrix(
+            low_level_matrix=low_level_matrices[i, j],
+            i=i, j=j,
+            sequence=sequence,
+            dist_matrix=dist_matrix,
+            gap_score=gap_score,
+            df_dope=df_dope,
+            energies=profile.low_level_energies(i, codes[j], codes),
+            origin_score=origin_scores[i, j]
+        )
+
+
+def fill_low_level_scores(n: int, m: int, sequence: list,
+                          dist_matrix: np.ndarray, gap_score: float,
+                          df_dope: pd.DataFrame,
+                          profile: TemplateProfile = None,
+                          wavefront: bool = False,
+                          jobs: int = 1) -> np.ndarray:
+    """
+    Compute the terminal values of the low-level matrices without keeping 
+    the matrices. Each low-level matrix is filled in a single reusable 
+    (n, m) scratch buffer, so memory grows as O(n * m) instead of 
+    O(n^2 * m^2). The values are identical to those of 
+    fill_low_level_matrices.
+
+    Args:
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix.
+        sequence (list): List of sequence residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        gap_score (float): The gap score to be used.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        profile (TemplateProfile, optional): Energy profile of the template. 
+            Taken from the profile cache if None. Defaults to None.
+        wavefront (bool): If True, fill the matrices one anti-diagonal at a 
+            time with fill_matrix_wavefront. Defaults to False.
+        jobs (int): Number of processes filling blocks of matrices, each 
+            with its own scratch buffer. Defaults to 1.
+
+    Returns:
+        np.ndarray: Terminal values low_level_matrices[i, j][-1, -1] with 
+                    shape (n, m).
+    """
+    logging.debug(f"Filling low-level scores with dimensions ({n}, {m})")
+    if profile is None:
+        profile = get_template_profile(dist_matrix, df_dope)
+    codes = encode_sequence(sequence)
+    origin_scores = profile.origin_energies(codes)
+
+    blocks = np.array_split(np.arange(n * m), 
+                            min(n * m, jobs * BLOCKS_PER_JOB))
+    return fill_shared(_fill_scores_block, blocks, (n, m), jobs,
+                       sequence, dist_matrix, gap_score, df_dope, profile,
+                       codes, origin_scores, wavefront)
+
+
+def _fill_scores_block(terminal_scores: np.ndarray, pairs: np.ndarray,
+                       sequence: list, dist_matrix: np.ndarray,
+                       gap_score: float, df_dope: pd.DataFrame,
+                       profile: TemplateProfile, codes: np.ndarray,
+                       origin_scores: np.ndarray, wavefront: bool) -> None:
+    """Fill the terminal values of a block of flat (i, j) pairs."""
+    n, m = terminal_scores.shape
+    scratch = np.empty((n, m), dtype=float)
+    for i, j in zip(pairs // m, pairs % m):
+        scratch.fill(np.nan)
+        fill_low_level_matrix(
+            low_level_matrix=scratch,
+            i=i, j=j,
+            sequence=sequence,
+            dist_matrix=dist_matrix,
+            gap_score=gap_score,
+            df_dope=df_dope,
+            energies=profile.low_level_energies(i, codes[j], codes),
+            origin_score=origin_scores[i, j],
+            wavefront=wavefront
+        )
+        terminal_scores[i, j] = scratch[-1, -1]
+
+
+def fill_low_level_scores_batched(n: int, m: int, sequence: list,
+                                  dist_matrix: np.ndarray, gap_score: float,
+                                  df_dope: pd.DataFrame,
+                                  profile: TemplateProfile = None,
+                                  tile_size: int = None,
+                                  band: int = None,
+                                  jobs: int = 1,
+                                  fixed_point: bool = False) -> np.ndarray:
+    """
+    Compute the terminal values of the low-level matrices in batches.
+
+    All low-level matrices run over the same (k, l) grid, so a tile of 
+    matrices is stacked along a trailing batch axis and the grid is swept 
+    once for the whole tile, in the row-major order of fill_matrix_region. 
+    The interpreter overhead is paid once per cell of the tile instead of 
+    once per cell of every matrix, and the values are identical to those of 
+    fill_low_level_matrices.
+
+    With a band, only the low-level matrices fixing a pair (i, j) within the 
+    band are filled, and each of them only within the band, in tiles with 
+    shape (n, w, tile) where w is the number of diagonals of the band. The 
+    cost drops from O(n^2 m^2) to O(n m w^2), and a band covering all the 
+    diagonals gives the same values as no band.
+
+    Args:
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix.
+        sequence (list): List of sequence residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        gap_score (float): The gap score to be used.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        profile (TemplateProfile, optional): Energy profile of the template. 
+            Taken from the profile cache if None. Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+            Derived from TILE_BYTES if None. Defaults to None.
+        band (int, optional): Width of the band, see band_limits. All the 
+            cells are filled if None. Defaults to None.
+        jobs (int): Number of processes filling tiles. The tiles are made 
+            small enough to give every process work. Defaults to 1.
+        fixed_point (bool, optional): If True, fills the tiles in int32 
+            hundredths, which halves their memory. The values equal those 
+            of the float64 mode up to the rare ties described in 
+            _fixed_point_arithmetic. Defaults to False.
+
+    Returns:
+        np.ndarray: Terminal values low_level_matrices[i, j][-1, -1] with 
+                    shape (n, m), NaN outside the band.
+    """
+    return fill_low_level_scores_sequences(
+        n, m, [sequence], dist_matrix, gap_score, df_dope, profile, 
+        tile_size, band, jobs, fixed_point
+    )[0]
+
+
+def fill_low_level_scores_sequences(n: int, m: int, sequences: list,
+                                    dist_matrix: np.ndarray, 
+                                    gap_score: float, df_dope: pd.DataFrame,
+                                    profile: TemplateProfile = None,
+                                    tile_size: int = None,
+                                    band: int = None,
+                                    jobs: int = 1,
+                                    fixed_point: bool = False) -> np.ndarray:
+    """
+    Compute the terminal values of the low-level matrices of several 
+    sequences of the same length, such as the shuffles of a sequence.
+
+    The low-level matrices of all the sequences are stacked along the batch 
+    axis of fill_low_level_scores_batched, so the tiles mix sequences and 
+    the template data is prepared once for all of them.
+
+    Args:
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix, the length of every 
+                 sequence.
+        sequences (list): Sequences of residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        gap_score (float): The gap score to be used.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        profile (TemplateProfile, optional): Energy profile of the template. 
+            Taken from the profile cache if None. Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+            Derived from TILE_BYTES if None. Defaults to None.
+        band (int, optional): Width of the band, see band_limits. All the 
+            cells are filled if None. Defaults to None.
+        jobs (int): Number of processes filling tiles. Defaults to 1.
+        fixed_point (bool, optional): If True, fills the tiles in int32 
+            hundredths. Defaults to False.
+
+    Returns:
+        np.ndarray: Terminal values with shape (len(sequences), n, m), NaN 
+                    outside the band.
+    """
+    return fill_low_level_scores_gaps(
+        n, m, sequences, dist_matrix, [gap_score], df_dope, profile, 
+        tile_size, band, jobs, fixed_point
+    )[0]
+
+
+def fill_low_level_scores_gaps(n: int, m: int, sequences: list,
+                               dist_matrix: np.ndarray, gap_scores: list,
+                               df_dope: pd.DataFrame,
+                               profile: TemplateProfile = None,
+                               tile_size: int = None,
+                               band: int = None,
+                               jobs: int = 1,
+                               fixed_point: bool = False) -> np.ndarray:
+    """
+    Compute the terminal values of the low-level matrices of several 
+    sequences of the same length for several gap scores.
+
+    The gap score only enters the dynamic programming as an addend, so the 
+    low-level matrices of all the (gap score, sequence) combinations are 
+    stacked along the batch axis, each with its own gap score, and the 
+    energies are gathered once for all the gap scores.
+
+    Args:
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix, the length of every 
+                 sequence.
+        sequences (list): Sequences of residues.
+        dist_matrix (np.ndarray): Distance matrix of the template.
+        gap_scores (list): The gap scores to be used.
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        profile (TemplateProfile, optional): Energy profile of the template. 
+            Taken from the profile cache if None. Defaults to None.
+        tile_size (int, optional): Number of low-level matrices per tile. 
+            Derived from TILE_BYTES if None. Defaults to None.
+        band (int, optional): Width of the band, see band_limits. All the 
+            cells are filled if None. Defaults to None.
+        jobs (int): Number of processes filling tiles. Defaults to 1.
+        fixed_point (bool, optional): If True, fills the tiles in int32 
+            hundredths. Defaults to False.
+
+    Returns:
+        np.ndarray: Terminal values with shape 
+                    (len(gap_scores), len(sequences), n, m), NaN outside the 
+                    band.
+    """
+    if band is None:
+        limits = None
+        width = m
+        pairs = np.arange(n * m)
+    else:
+        limits = lower, upper = band_limits(n, m, band)
+        width = upper - lower + 1
+        offsets = np.arange(m)[None, :] - np.arange(n)[:, None]
+        pairs = np.flatnonzero((offsets >= lower) & (offsets <= upper))
+    n_matrices = len(gap_scores) * len(sequences)
+    all_pairs = (np.arange(n_matrices)[:, None] * n * m + pairs).ravel()
+    if tile_size is None:
+        itemsize = 4 if fixed_point else 8
+        tile_size = max(1, TILE_BYTES // (2 * n * width * itemsize))
+    tile_size = min(tile_size, -(-len(all_pairs) // jobs))
+    logging.debug(f"Filling low-level scores of {len(sequences)} sequences "
+                  f"and {len(gap_scores)} gap scores with dimensions "
+                  f"({n}, {m}) and width {width} in tiles of {tile_size} "
+                  f"matrices")
+    if profile is None:
+        profile = get_template_profile(dist_matrix, df_dope)
+    codes = np.array([encode_sequence(sequence) for sequence in sequences])
+
+    tiles = [all_pairs[start:start + tile_size] 
+             for start in range(0, len(all_pairs), tile_size)]
+    terminal_scores = fill_shared(
+        _fill_tiles_block, tiles, (n_matrices, n, m), jobs, codes, 
+        np.asarray(gap_scores, dtype=float), profile, limits, fixed_point
+    )
+    return terminal_scores.reshape(len(gap_scores), len(sequences), n, m)
+
+
+def _fill_tiles_block(terminal_scores: np.ndarray, pairs: np.ndarray,
+                      codes: np.ndarray, gap_scores: np.ndarray,
+                      profile: TemplateProfile, limits: tuple,
+                      fixed_point: bool = False) -> None:
+    """Fill the terminal values of a tile of flat (gap, sequence, i, j) 
+    pairs, where terminal_scores[g * S + s] holds the matrices of gap score 
+    g and sequence s."""
+    _, n, m = terminal_scores.shape
+    matrix, i, j = pairs // (n * m), pairs // m % n, pairs % m
+    s = matrix % len(codes)
+    gap_score = gap_scores[matrix // len(codes)]
+    code_j = codes[s, j]
+    row_codes = codes[s].T
+    origins = profile.pair_energies(0, i, codes[s, 0], code_j)
+    if limits is None:
+        terminal_scores[matrix, i, j] = _fill_low_level_tile(
+            i, j, n, m, code_j, row_codes, origins, gap_score, profile,
+            fixed_point
+        )
+    else:
+        terminal_scores[matrix, i, j] = _fill_low_level_band_tile(
+            i, j, n, m, *limits, code_j, row_codes, origins, gap_score, 
+            profile, fixed_point
+        )
+
+
+def fill_shared(fill_block, blocks: list, shape: tuple, jobs: int,
+                *args) -> np.ndarray:
+    """
+    Fill a NaN-initialized result by blocks of (i, j) pairs.
+
+    With several jobs, the result is a memory-mapped file in a temporary 
+    folder shared by a process pool: every process writes the values of 
+    its blocks in place, and only the file name is sent to the processes. 
+    Large array arguments, such as the energy profile, are memory-mapped by 
+    joblib as well.
+
+    Args:
+        fill_block (callable): Function called as 
+            fill_block(result, pairs, *args), which fills the values of the 
+            flat (i, j) pairs of a block.
+        blocks (list): Blocks of flat (i, j) pairs.
+        shape (tuple): Shape of the result.
+        jobs (int): Number of processes.
+        *args: Additional arguments of fill_block.
+
+    Returns:
+        np.ndarray: The filled result.
+    """
+    if jobs == 1 or len(blocks) <= 1:
+        result = np.full(shape, np.nan, dtype=float)
+        for pairs in blocks:
+            fill_block(result, pairs, *args)
+        return result
+
+    logging.debug(f"Filling {len(blocks)} blocks of pairs with {jobs} jobs")
+    folder = tempfile.mkdtemp(prefix='threading_')
+    try:
+        result = np.memmap(os.path.join(folder, 'result.mmap'), 
+                           dtype=float, mode='w+', shape=shape)
+        result[:] = np.nan
+        Parallel(n_jobs=jobs)(
+            delayed(fill_block)(result, pairs, *args) for pairs in blocks
+        )
+        return np.array(result)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def band_limits(n: int, m: int, band: int) -> tuple:
+    """
+    Return the diagonal offsets delimiting a band of an (n, m) matrix.
+
+    A cell (k, l) lies within the band if its offset l - k lies within the 
+    returned limits. The band follows the main diagonal, is widened by the 
+    length difference m - n so that it always joins (0, 0) to (n-1, m-1), 
+    and extends `band` diagonals on both sides.
+
+    Args:
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix.
+        band (int): Number of diagonals added on both sides of the band.
+
+    Returns:
+        tuple: Lowest and highest offsets l - k of the band.
+    """
+    return min(0, m - n) - band, max(0, m - n) + band
+
+
+def _fill_low_level_band_tile(i: np.ndarray, j: np.ndarray, n: int, m: int,
+                              lower: int, upper: int, code_j: np.ndarray,
+                              row_codes: np.ndarray, origins: np.ndarray,
+                              gap_score: float,
+                              profile: TemplateProfile,
+                              fixed_point: bool = False) -> np.ndarray:
+    """
+    Fill a tile of banded low-level matrices stacked along a batch axis.
+
+    Cell (k, l) is stored at [k, l - k - lower]. Cells outside the band are 
+    read as NaN, and negative indices wrap around as in the full matrices.
+
+    Args:
+        i (np.ndarray): Template positions fixed by the matrices.
+        j (np.ndarray): Sequence positions fixed by the matrices.
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix.
+        lower (int): Lowest offset of the band.
+        upper (int): Highest offset of the band.
+        code_j (np.ndarray): Residue codes at the positions j.
+        row_codes (np.ndarray): Residue codes of the sequences of the 
+                                matrices, with shape (m, tile).
+        origins (np.ndarray): Energies of the origins of the matrices.
+        gap_score (np.ndarray): The gap score of each matrix, or a single 
+                                gap score.
+        profile (TemplateProfile): Energy profile of the template.
+        fixed_point (bool, optional): If True, fills the tile in int32 
+            hundredths, see _fixed_point_arithmetic. Defaults to False.
+
+    Returns:
+        np.ndarray: Terminal values of the matrices.
+    """
+    width = upper - lower + 1
+    columns = np.clip(np.arange(n)[:, None] + lower + np.arange(width), 
+                      0, m - 1)
+    # Energies of the tile, with shape (n, width, tile)
+    energies = profile.pair_energies(i[None, None, :], 
+                                     np.arange(n)[:, None, None],
+                                     code_j[None, None, :], 
+                                     row_codes[columns])
+    add, add_energy, minimum, origins, gap_score, empty = \
+        _fixed_point_arithmetic(origins, energies, gap_score) if fixed_point \
+        else _float_arithmetic(origins, energies, gap_score)
+    low_level_tile = np.full((n, width, len(i)), empty)
+    outside = np.full(len(i), empty)
+
+    def cell(k: int, l: int) -> np.ndarray:
+        """Read cell (k, l) of the tile, wrapping negative indices."""
+        k, l = k % n, l % m
+        if lower <= l - k <= upper:
+            return low_level_tile[k, l - k - lower]
+        return outside
+
+    # Set initial boundary conditions
+    low_level_tile[0, -lower] = np.where((i == 0) & (j == 0), 0, origins)
+    for l in range(1, min(m - 1, upper) + 1):
+        low_level_tile[0, l - lower] = np.where(
+            l <= j, add(cell(0, l-1), gap_score), empty
+        )
+    for k in range(1, min(n - 1, -lower) + 1):
+        low_level_tile[k, -k - lower] = np.where(
+            k <= i, add(cell(k-1, 0), gap_score), empty
+        )
+
+    # Fill the left-top and right-bottom regions in row-major order
+    for k in range(n):
+        for l in range(max(0, k + lower), min(m, k + upper + 1)):
+            left_top = (1 <= k) & (k <= i) & (1 <= l) & (l <= j)
+            right_bottom = (k >= i) & (l >= j) & ((k != i) | (l != j))
+            region = left_top | right_bottom
+            if not region.any():
+                continue
+            scores = minimum(
+                minimum(
+                    add(cell(k-1, l), gap_score),
+                    add(cell(k, l-1), gap_score)
+                ),
+                add_energy(cell(k-1, l-1), (k, l - k - lower))
             )
-            
-            # Fill the right-bottom region from (i,j) to (n-1,m-1), skip (i,j)
-            fill_matrix_region(
-                low_level_matrix=low_level_matrix,
-                k_range=range(i, n),
-                l_range=range(j, m),
-                sequence_j=sequence[j],
-                dist_matrix_i=dist_matrix[i],
-                df_dope=df_dope,
-                gap_score=gap_score,
-                sequence=sequence,
-                skip={(i, j)}
+            np.copyto(low_level_tile[k, l - k - lower], scores, where=region)
+
+    if fixed_point:
+        return from_fixed_point(cell(n - 1, m - 1))
+    return cell(n - 1, m - 1)
+
+
+def _fill_low_level_tile(i: np.ndarray, j: np.ndarray, n: int, m: int,
+                         code_j: np.ndarray, row_codes: np.ndarray,
+                         origins: np.ndarray, gap_score: float,
+                         profile: TemplateProfile,
+                         fixed_point: bool = False) -> np.ndarray:
+    """
+    Fill a tile of low-level matrices stacked along a trailing batch axis.
+
+    Args:
+        i (np.ndarray): Template positions fixed by the matrices.
+        j (np.ndarray): Sequence positions fixed by the matrices.
+        n (int): Number of rows for the matrix.
+        m (int): Number of columns for the matrix.
+        code_j (np.ndarray): Residue codes at the positions j.
+        row_codes (np.ndarray): Residue codes of the sequences of the 
+                                matrices, with shape (m, tile).
+        origins (np.ndarray): Energies of the origins of the matrices.
+        gap_score (np.ndarray): The gap score of each matrix, or a single 
+                                gap score.
+        profile (TemplateProfile): Energy profile of the template.
+        fixed_point (bool, optional): If True, fills the tile in int32 
+            hundredths, see _fixed_point_arithmetic. Defaults to False.
+
+    Returns:
+        np.ndarray: Terminal values of the matrices.
+    """
+    # Energies of the tile, with shape (n, m, tile)
+    energies = profile.pair_energies(i[None, None, :], 
+                                     np.arange(n)[:, None, None],
+                                     code_j[None, None, :], 
+                                     row_codes[None, :, :])
+    add, add_energy, minimum, origins, gap_score, empty = \
+        _fixed_point_arithmetic(origins, energies, gap_score) if fixed_point \
+        else _float_arithmetic(origins, energies, gap_score)
+    low_level_tile = np.full((n, m, len(i)), empty)
+
+    # Set initial boundary conditions
+    low_level_tile[0, 0] = np.where((i == 0) & (j == 0), 0, origins)
+    for l in range(1, m):
+        low_level_tile[0, l] = np.where(
+            l <= j, add(low_level_tile[0, l-1], gap_score), empty
+        )
+    for k in range(1, n):
+        low_level_tile[k, 0] = np.where(
+            k <= i, add(low_level_tile[k-1, 0], gap_score), empty
+        )
+
+    # Fill the left-top and right-bottom regions in row-major order
+    for k in range(n):
+        for l in range(m):
+            left_top = (1 <= k) & (k <= i) & (1 <= l) & (l <= j)
+            right_bottom = (k >= i) & (l >= j) & ((k != i) | (l != j))
+            region = left_top | right_bottom
+            if not region.any():
+                continue
+            scores = minimum(
+                minimum(
+                    add(low_level_tile[k-1, l], gap_score),
+                    add(low_level_tile[k, l-1], gap_score)
+                ),
+                add_energy(low_level_tile[k-1, l-1], (k, l))
             )
+            np.copyto(low_level_tile[k, l], scores, where=region)
+
+    if fixed_point:
+        return from_fixed_point(low_level_tile[-1, -1])
+    return low_level_tile[-1, -1]
+
+
+def _float_arithmetic(origins: np.ndarray, energies: np.ndarray, 
+                      gap_score: float) -> tuple:
+    """
+    Return the operations and the data of a tile filled in float64, 
+    rounding every sum to two decimals.
+
+    Returns:
+        tuple: The operations add(a, b) and add_energy(a, cell), which adds 
+               energies[cell], the minimum operation, the rounded origins, 
+               the gap score and the value of empty cells.
+    """
+    def add(a, b):
+        return np.round(a + b, 2)
+
+    def add_energy(a, cell):
+        return np.round(a + energies[cell], 2)
+
+    return add, add_energy, np.fmin, np.round(origins, 2), gap_score, np.nan
+
+
+def _fixed_point_arithmetic(origins: np.ndarray, energies: np.ndarray, 
+                            gap_score: float) -> tuple:
+    """
+    Return the operations and the data of a tile filled in int32 hundredths.
+
+    The values are identical to those of _float_arithmetic. Every stored 
+    score s is a whole number of hundredths, and so is the gap score, so 
+    round(s + gap_score, 2) is exact in integers. For an energy E, 
+    round(s + E, 2) equals s + round(E, 2), unless 100 * E is within the 
+    float64 error of a half-integer: the float64 sum then breaks the tie 
+    depending on s. The sums with such energies, about 1% of the DOPE 
+    energies, are redone in float64 from the hundredths, so they break the 
+    tie in the same way. The equivalence holds while the scores stay far 
+    below FIXED_NAN hundredths.
+
+    Returns:
+        tuple: The operations and the data of _float_arithmetic, in 
+               hundredths.
+    """
+    energies = np.asarray(energies, dtype=float)
+    fixed_energies = to_fixed_point(energies)
+    fractions = np.abs(energies * FIXED_POINT_SCALE 
+                       - np.floor(energies * FIXED_POINT_SCALE) - 0.5)
+    ties = fractions < 1e-6
+    tied_cells = ties.reshape(ties.shape[:2] + (-1,)).any(axis=-1) \
+        if ties.ndim > 2 else ties
+
+    def add(a, b):
+        # Sums involving FIXED_NAN are kept from drifting towards overflow
+        return np.minimum(a + b, FIXED_NAN)
+
+    def add_energy(a, cell):
+        sums = add(a, fixed_energies[cell])
+        if tied_cells[cell]:
+            exact = to_fixed_point(from_fixed_point(a) + energies[cell])
+            sums = np.where(ties[cell], exact, sums)
+        return sums
+
+    return (add, add_energy, np.minimum, to_fixed_point(origins), 
+            to_fixed_point(gap_score, exact=True), FIXED_NAN)
+
+
+def to_fixed_point(scores, exact: bool = False):
+    """
+    Convert scores to int32 hundredths, NaN to FIXED_NAN.
+
+    Args:
+        scores (array_like): Scores to convert.
+        exact (bool, optional): If True, the scores must already be whole 
+            hundredths, such as gap scores. Defaults to False.
+
+    Returns:
+        np.ndarray: The scores in hundredths, with dtype int32.
+
+    Raises:
+        ValueError: If exact is True and a score is not whole hundredths.
+    """
+    scores = np.asarray(scores, dtype=float)
+    hundredths = np.rint(np.round(scores, 2) * FIXED_POINT_SCALE)
+    if exact and not np.allclose(hundredths, scores * FIXED_POINT_SCALE, 
+                                 rtol=0, atol=1e-6, equal_nan=True):
+        raise ValueError(f"Scores must be whole hundredths in fixed-point "
+                         f"mode: {scores}")
+    return np.where(np.isnan(hundredths), FIXED_NAN, 
+                    hundredths).astype(np.int32)
 
-    return low_level_matrices
+
+def from_fixed_point(hundredths) -> np.ndarray:
+    """
+    Convert int32 hundredths back to scores, FIXED_NAN (or any value drifted 
+    from it) to NaN. The scores equal the float64 values rounded to two 
+    decimals.
+
+    Args:
+        hundredths (array_like): Scores in hundredths.
+
+    Returns:
+        np.ndarray: The scores, with dtype float64.
+    """
+    hundredths = np.asarray(hundredths)
+    return np.where(hundredths >= FIXED_NAN // 2, np.nan, 
+                    hundredths / FIXED_POINT_SCALE)
+
+
+# Back-pointers of the high-level matrix, 0 at the origin
+MOVE_UP = 1        # Gap in the sequence, template position i unaligned
+MOVE_LEFT = 2      # Gap in the template, residue j unaligned
+MOVE_DIAGONAL = 3  # Residue j aligned with template position i
+
+# Low-level engines, by name, accepted by fill_high_level_matrix
+LOW_LEVEL_ENGINES = {
+    'full': fill_low_level_matrices,
+    'score': fill_low_level_scores,
+    'wavefront': partial(fill_low_level_scores, wavefront=True),
+    'batched': fill_low_level_scores_batched
+}
+
+# Low-level engines accepting the width of a diagonal band
+BAND_ENGINES = {'batched'}
 
 
 def fill_high_level_matrix(low_level_matrices: np.ndarray, 
                            gap_score: float, sequence: str, 
-                           print_alignments: bool) -> np.ndarray:
+                           print_alignments: bool,
+                           band: int = None,
+                           return_pointers: bool = False,
+                           fixed_point: bool = False) -> np.ndarray:
     """
     Fill the high-level matrix using the low-level matrices.
 
+    The move chosen in each cell is stored as an int8 back-pointer 
+    (MOVE_UP, MOVE_LEFT or MOVE_DIAGONAL, in this order of preference on 
+    ties), so that the alignment is recovered by traceback_alignment from 
+    the terminal values of any low-level engine.
+
     Args:
-        low_level_matrices (np.ndarray): The low-level matrices.
+        low_level_matrices (np.ndarray): The (n, m, n, m) low-level matrices, 
+            or only their (n, m) terminal values as returned by 
+            fill_low_level_scores.
         gap_score (float): The gap score to be used.
+        sequence (str): The sequence, to print its alignment.
+        print_alignments (bool): If True, prints the alignment.
+        band (int, optional): Width of the band, see band_limits. Only the 
+            cells within the band are computed, the others are left NaN. 
+            All the cells are computed if None. Defaults to None.
+        return_pointers (bool, optional): If True, also returns the 
+            back-pointers. Defaults to False.
+        fixed_point (bool, optional): If True, fills the matrix in int32 
+            hundredths, where the comparisons of the moves are exact. The 
+            values are identical to the float64 mode, since the terminal 
+            values and the gap score are whole hundredths. Defaults to False.
 
     Returns:
-        np.ndarray: The filled high-level matrix.
+        np.ndarray: The filled high-level matrix, and its (n, m) int8 
+                    back-pointers if return_pointers is True.
     """
     logging.debug("Filling high-level matrix using low-level matrices")
-    n, m = low_level_matrices.shape[:2]
+    terminal_scores = _terminal_scores(low_level_matrices)
+    n, m = terminal_scores.shape
+    lower, upper = band_limits(n, m, band) if band is not None \
+        else (-n, m)
+    if fixed_point:
+        terminal_scores = to_fixed_point(terminal_scores).tolist()
+        gap_score = int(to_fixed_point(gap_score, exact=True))
     
-    # Initialize high_level_matrix
-    high_level_matrix = np.full((n, m), np.nan, dtype=float)
+    def add(a, b):
+        if fixed_point:
+            return min(a + b, FIXED_NAN)
+        return round(a + b, 2)
     
-    high_level_matrix[0, 0] = low_level_matrices[0, 0][-1, -1]
+    # Initialize high_level_matrix and its back-pointers
+    high_level_matrix = np.full((n, m), FIXED_NAN if fixed_point else np.nan,
+                                dtype=np.int32 if fixed_point else float)
+    pointers = np.zeros((n, m), dtype=np.int8)
     
-    for i in range(1, n):
-        high_level_matrix[i, 0] = round(
-            high_level_matrix[i-1, 0] + gap_score, 2
-            )
-    for j in range(1, m):
-        high_level_matrix[0, j] = round(
-            high_level_matrix[0, j-1] + gap_score, 2
-            )
+    high_level_matrix[0, 0] = terminal_scores[0][0]
+    
+    for i in range(1, min(n, 1 - lower)):
+        high_level_matrix[i, 0] = add(high_level_matrix[i-1, 0], gap_score)
+        pointers[i, 0] = MOVE_UP
+    for j in range(1, min(m, upper + 1)):
+        high_level_matrix[0, j] = add(high_level_matrix[0, j-1], gap_score)
+        pointers[0, j] = MOVE_LEFT
 
     for i in range(1, n):
-        for j in range(1, m):
-            high_level_matrix[i, j] = np.nanmin([
-                round(high_level_matrix[i-1, j] + gap_score, 2), 
-                round(high_level_matrix[i, j-1] + gap_score, 2), 
-                round(
-                    high_level_matrix[i-1, j-1] + low_level_matrices[i, j][-1, -1], 2
-                    )
-                ])
+        for j in range(max(1, i + lower), min(m, i + upper + 1)):
+            moves = [
+                add(high_level_matrix[i-1, j], gap_score), 
+                add(high_level_matrix[i, j-1], gap_score), 
+                add(high_level_matrix[i-1, j-1], terminal_scores[i][j])
+                ]
+            high_level_matrix[i, j] = min(moves) if fixed_point \
+                else np.nanmin(moves)
+            for move, value in zip((MOVE_UP, MOVE_LEFT, MOVE_DIAGONAL), 
+                                   moves):
+                if value == high_level_matrix[i, j]:
+                    pointers[i, j] = move
+                    break
             
     # Print alignment
     if print_alignments:
-        traceback_alignment(low_level_matrices, high_level_matrix, 
-                            gap_score, sequence, n, m)
+        with stage('traceback'):
+            alignment = traceback_alignment(pointers)
+        print(format_alignment(alignment, sequence, n))
     
+    if fixed_point:
+        high_level_matrix = from_fixed_point(high_level_matrix)
+    if return_pointers:
+        return high_level_matrix, pointers
     return high_level_matrix
 
 
-def traceback_alignment(low_level_matrices: np.ndarray,
-                        high_level_matrix: np.ndarray, gap_score: float, 
-                        sequence: str, n: int, m: int, 
-                        max_line_length: int = 60) -> tuple:
-    """Traceback the alignment and print the aligned sequences.
+def fill_high_level_matrices(terminal_scores: np.ndarray, gap_score: float,
+                             band: int = None, 
+                             fixed_point: bool = False) -> np.ndarray:
+    """
+    Fill the high-level matrices of several sequences at once.
+
+    The recurrence of fill_high_level_matrix is vectorized along the 
+    sequence axis, with the same rounding, so the values are identical.
 
     Args:
-        low_level_matrices (np.ndarray): Matrix of low-level matrices.
-        high_level_matrix (np.ndarray): High-level matrix.
-        gap_score (float): Gap score used in the alignment.
-        sequence (str): Sequence to align.
-        n (int): Length of the structure.
-        m (int): Length of the sequence.
-        max_line_length (int): Maximum character length per line (default: 60).
+        terminal_scores (np.ndarray): Terminal values of the low-level 
+            matrices with shape (S, n, m), as returned by 
+            fill_low_level_scores_sequences.
+        gap_score (float): The gap score to be used, or an array with the 
+            gap score of each of the S matrices.
+        band (int, optional): Width of the band, see band_limits. 
+            Defaults to None.
+        fixed_point (bool, optional): If True, fills the matrices in int32 
+            hundredths, with identical values. Defaults to False.
 
     Returns:
-        tuple: Strings with the aligned indices, residues, and connectors.
+        np.ndarray: The filled high-level matrices with shape (S, n, m).
     """
-    aligned_indices = []
-    aligned_residues = []
-    alignment_connectors = []
+    logging.debug("Filling high-level matrices of "
+                  f"{terminal_scores.shape[0]} sequences")
+    # Sequences along the last axis, to sweep contiguous cells
+    terminal_scores = np.moveaxis(terminal_scores, 0, -1)
+    n, m = terminal_scores.shape[:2]
+    lower, upper = band_limits(n, m, band) if band is not None \
+        else (-n, m)
+
+    add, add_energy, minimum, _, gap_score, empty = \
+        _fixed_point_arithmetic(0, terminal_scores, gap_score) \
+        if fixed_point else _float_arithmetic(0, terminal_scores, gap_score)
+
+    high_level_matrices = np.full(terminal_scores.shape, empty)
+    high_level_matrices[0, 0] = add_energy(0, (0, 0))
+    for i in range(1, min(n, 1 - lower)):
+        high_level_matrices[i, 0] = add(high_level_matrices[i-1, 0], 
+                                        gap_score)
+    for j in range(1, min(m, upper + 1)):
+        high_level_matrices[0, j] = add(high_level_matrices[0, j-1], 
+                                        gap_score)
+
+    for i in range(1, n):
+        for j in range(max(1, i + lower), min(m, i + upper + 1)):
+            high_level_matrices[i, j] = minimum(
+                minimum(
+                    add(high_level_matrices[i-1, j], gap_score),
+                    add(high_level_matrices[i, j-1], gap_score)
+                ),
+                add_energy(high_level_matrices[i-1, j-1], (i, j))
+            )
+
+    if fixed_point:
+        high_level_matrices = from_fixed_point(high_level_matrices)
+    return np.moveaxis(high_level_matrices, -1, 0)
+
+
+def _terminal_scores(low_level_matrices: np.ndarray) -> np.ndarray:
+    """Return the (n, m) terminal values of 4D or already reduced matrices."""
+    if low_level_matrices.ndim == 2:
+        return low_level_matrices
+    return low_level_matrices[:, :, -1, -1]
+
+
+def traceback_alignment(pointers: np.ndarray) -> np.ndarray:
+    """Follow the back-pointers of a high-level matrix from its last cell.
+
+    Args:
+        pointers (np.ndarray): The (n, m) int8 back-pointers returned by 
+                               fill_high_level_matrix.
+
+    Returns:
+        np.ndarray: The template position aligned with each residue of the 
+                    sequence, with shape (m,), -1 for the residues facing a 
+                    gap.
+
+    Raises:
+        ValueError: If the back-pointers do not lead to the origin, such as 
+                    from a cell outside the band.
+    """
+    n, m = pointers.shape
+    alignment = np.full(m, -1, dtype=np.intp)
     
     # Start from the bottom-right corner of the high-level matrix
     i, j = n - 1, m - 1
-    
-    while (i > 0) and (j > 0):
-        current_value = high_level_matrix[i, j]
-        low_level_value = low_level_matrices[i, j][-1, -1]
-        
-        vertical_move = high_level_matrix[i-1, j] + gap_score
-        horizontal_move = high_level_matrix[i, j-1] + gap_score
-        diagonal_move = high_level_matrix[i-1, j-1] + low_level_value
-        
-        if np.isclose(current_value, round(vertical_move, 2)):
-            # Move up (gap in sequence[j])
-            nb_spaces = 3 - len(str(i))
-            aligned_indices.append(f'{" " * nb_spaces}{i}')
-            aligned_residues.append('  -')
-            alignment_connectors.append('   ')
+    while (i, j) != (0, 0):
+        move = pointers[i, j]
+        if move == MOVE_DIAGONAL:
+            alignment[j] = i
             i -= 1
-        
-        elif np.isclose(current_value, round(horizontal_move, 2)):
-            # Move left (gap in sequence[i])
-            aligned_indices.append('  -')
-            aligned_residues.append(f'  {sequence[j-1]}')
-            alignment_connectors.append('   ')
             j -= 1
-        
-        elif np.isclose(current_value, round(diagonal_move, 2)):
-            # Move diagonally (match/mismatch)
-            nb_spaces = 3 - len(str(i))
-            aligned_indices.append(f'{" " * nb_spaces}{i}')
-            aligned_residues.append(f'  {sequence[j-1]}')
-            alignment_connectors.append('  |')
+        elif move == MOVE_UP:
             i -= 1
+        elif move == MOVE_LEFT:
             j -= 1
+        else:
+            raise ValueError(f"No back-pointer at cell ({i}, {j}).")
+    
+    # The origin aligns the first residue with the first template position
+    alignment[0] = 0
+    return alignment
+
+
+def format_alignment(alignment: np.ndarray, sequence: str, n: int, 
+                     max_line_length: int = 60) -> str:
+    """Format an alignment as lines of positions, connectors and residues.
 
-    # Add the starting point (i=0, j=0)
-    aligned_indices.append('  0')
-    aligned_residues.append(f'  {sequence[0]}')
-    alignment_connectors.append('  |')
+    Args:
+        alignment (np.ndarray): Template position aligned with each residue, 
+                                as returned by traceback_alignment.
+        sequence (str): The aligned sequence.
+        n (int): Length of the structure.
+        max_line_length (int): Maximum character length per line (default: 60).
+
+    Returns:
+        str: Blocks of three lines: template positions (- for a gap), 
+             connectors (| for an aligned pair) and residues (- for a gap).
+    """
+    aligned_indices = []
+    aligned_residues = []
+    alignment_connectors = []
+    
+    def add_column(index, connector, residue):
+        aligned_indices.append(f'{index:>3}')
+        alignment_connectors.append(f'{connector:>3}')
+        aligned_residues.append(f'{residue:>3}')
     
-    # Reverse the lists since we built them backward
-    aligned_indices.reverse()
-    aligned_residues.reverse()
-    alignment_connectors.reverse()
+    position = 0
+    for j, aligned in enumerate(alignment):
+        if aligned < 0:
+            add_column('-', ' ', sequence[j])
+            continue
+        # Template positions skipped before this pair
+        for i in range(position, aligned):
+            add_column(i, ' ', '-')
+        add_column(int(aligned), '|', sequence[j])
+        position = aligned + 1
+    for i in range(position, n):
+        add_column(i, ' ', '-')
     
     # Convert lists to strings
     aligned_indices_str = ''.join(aligned_indices)
     alignment_connectors_str = ''.join(alignment_connectors)
     aligned_residues_str = ''.join(aligned_residues)
     
-    # Add line breaks every 60 characters
-    aligned_indices_lines = [aligned_indices_str[i:i+max_line_length] 
-                            for i in range(
-                                0, 
-                                len(aligned_indices_str), 
-                                max_line_length
-                                )
-                            ]
-    alignment_connectors_lines = [alignment_connectors_str[i:i+max_line_length] 
-                                          for i in range(
-                                              0, 
-                                              len(alignment_connectors_str), 
-                                              max_line_length
-                                              )
-                                 ]
-    aligned_residues_lines = [aligned_residues_str[i:i+max_line_length] 
-                                      for i in range(
-                                          0, 
-                                          len(aligned_residues_str), 
-                                          max_line_length
-                                          )
-                             ]
-    
-    alignment_str = ''
-    
-    # Combine them in alternating order (indices -> connectors -> residues)
-    for idx_line, con_line, res_line in zip(
-                                            aligned_indices_lines, 
-                                            alignment_connectors_lines, 
-                                            aligned_residues_lines
-                                            ):
-        alignment_str += idx_line + '\n' + con_line + '\n' + res_line + '\n'
-        
-    print(alignment_str[:-1])
-    
-    return aligned_indices_str, alignment_connectors_str, aligned_residues_str
-
+    # Combine them in alternating order (indices -> connectors -> residues), 
+    # with line breaks every max_line_length characters
+    blocks = []
+    for start in range(0, len(aligned_indices_str), max_line_length):
+        end = start + max_line_length
+        blocks.append('\n'.join((aligned_indices_str[start:end], 
+                                 alignment_connectors_str[start:end], 
+                                 aligned_residues_str[start:end])))
+    return '\n'.join(blocks)
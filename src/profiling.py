@@ -0,0 +1,262 @@
+"""
+Profiling Module
+
+This module records where the time of a threading run goes: the stages of
+each task (PDB parsing, distance matrix, energy profile, low-level fill,
+high-level fill and traceback) are timed in the process running the task,
+sent back to the parent with the result of the task by the scheduler, and
+exported as a JSON summary and as a Chrome trace-event timeline, which can
+be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Profiling is off by default: a stage then costs a single test of a global
+flag, and the tasks are submitted to the workers unchanged.
+
+Functions:
+- enable_profiling: Turns profiling on or off in the current process.
+- profiling_enabled: Returns whether profiling is on.
+- task: Context manager timing a task.
+- stage: Context manager timing a stage of the current task.
+- run_profiled: Runs a function with profiling on and returns its events.
+- collect_events: Returns and clears the events of the current process.
+- add_events: Adds events recorded by another process.
+- summarize_profile: Aggregates the events by stage, task and worker.
+- export_profile: Saves the summary and the Chrome trace of the events.
+
+Example:
+    from profiling import enable_profiling, export_profile, stage, task
+    enable_profiling()
+    with task('process_template', template='1crn.pdb'):
+        with stage('parse_pdb'):
+            coords = pdb_to_c_alpha_coordinates(pdb_file)
+    export_profile('run_profile.json', 'run_trace.json')
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+from contextlib import contextmanager, nullcontext
+from itertools import count
+import json
+import logging
+import os
+import threading
+import time
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+_enabled = False
+_start = None
+_events = []
+_current_task = None
+_task_ids = count()
+
+# Context returned by task and stage while profiling is off
+_NULL_CONTEXT = nullcontext()
+
+
+def enable_profiling(enabled: bool = True) -> None:
+    """
+    Turn profiling on or off in the current process. Turning it on clears
+    the recorded events and starts the clock of the timeline.
+
+    Args:
+        enabled (bool, optional): Whether to record events.
+                                  Defaults to True.
+    """
+    global _enabled, _start
+    if enabled and not _enabled:
+        _events.clear()
+        _start = time.perf_counter()
+    _enabled = enabled
+
+
+def profiling_enabled() -> bool:
+    """Return whether profiling is on in the current process."""
+    return _enabled
+
+
+@contextmanager
+def _record(name: str, category: str, args: dict):
+    """Record the duration of a block as an event."""
+    global _current_task
+    start = time.perf_counter()
+    if category == 'task':
+        parent_task = _current_task
+        _current_task = f"{os.getpid()}:{name}#{next(_task_ids)}"
+        task_id = _current_task
+    else:
+        task_id = _current_task
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if category == 'task':
+            _current_task = parent_task
+        _events.append({
+            'name': name, 'category': category, 'task': task_id,
+            'start': start, 'duration': end - start, 'pid': os.getpid(),
+            'tid': threading.get_ident(), 'args': args
+        })
+
+
+def task(name: str, **args):
+    """
+    Time a task, such as a template-sequence pair. The stages timed inside
+    the block are attributed to it.
+
+    Args:
+        name (str): Name of the task.
+        **args: Details of the task shown in the trace, such as the template.
+
+    Returns:
+        contextmanager: The context timing the block.
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    return _record(name, 'task', args)
+
+
+def stage(name: str, **args):
+    """
+    Time a stage of the current task.
+
+    Args:
+        name (str): Name of the stage.
+        **args: Details of the stage shown in the trace.
+
+    Returns:
+        contextmanager: The context timing the block.
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    return _record(name, 'stage', args)
+
+
+def collect_events() -> list:
+    """
+    Return and clear the events recorded in the current process.
+
+    Returns:
+        list: Events, as dictionaries.
+    """
+    events = list(_events)
+    _events.clear()
+    return events
+
+
+def add_events(events: list) -> None:
+    """
+    Add events recorded by another process, such as a worker.
+
+    Args:
+        events (list): Events returned by collect_events.
+    """
+    _events.extend(events)
+
+
+def run_profiled(function, *args) -> tuple:
+    """
+    Run a function with profiling on, in a worker process.
+
+    Args:
+        function (callable): Function to run.
+        *args: Arguments of the function.
+
+    Returns:
+        tuple: The result of the function and the events it recorded.
+    """
+    previous = _enabled
+    enable_profiling()
+    try:
+        return function(*args), collect_events()
+    finally:
+        enable_profiling(previous)
+
+
+def summarize_profile(events: list = None) -> dict:
+    """
+    Aggregate events by stage, by task and by worker process.
+
+    Args:
+        events (list, optional): Events to aggregate. Defaults to the events
+                                 of the current process.
+
+    Returns:
+        dict: The 'wall_time' of the run, the 'stages' with their number of
+              'calls' and their 'total', 'mean' and 'max' durations, the
+              'tasks' with their 'duration', worker 'pid' and stages, and
+              the 'workers' with their number of 'tasks' and 'busy' time.
+    """
+    events = _events if events is None else events
+    stages, tasks, workers = {}, {}, {}
+    for event in events:
+        if event['category'] == 'task':
+            tasks.setdefault(event['task'], {'stages': {}}).update({
+                'task': event['name'], 'args': event['args'],
+                'pid': event['pid'], 'duration': event['duration']
+            })
+            worker = workers.setdefault(str(event['pid']),
+                                        {'tasks': 0, 'busy': 0.0})
+            worker['tasks'] += 1
+            worker['busy'] += event['duration']
+            continue
+
+        total = stages.setdefault(event['name'], {'calls': 0, 'total': 0.0,
+                                                  'max': 0.0})
+        total['calls'] += 1
+        total['total'] += event['duration']
+        total['max'] = max(total['max'], event['duration'])
+        if event['task'] is not None:
+            task_stages = tasks.setdefault(event['task'],
+                                           {'stages': {}})['stages']
+            task_stage = task_stages.setdefault(event['name'],
+                                                {'calls': 0, 'total': 0.0})
+            task_stage['calls'] += 1
+            task_stage['total'] += event['duration']
+
+    for total in stages.values():
+        total['mean'] = total['total'] / total['calls']
+    wall_time = time.perf_counter() - _start if _start is not None else None
+    return {'wall_time': wall_time, 'stages': stages,
+            'tasks': list(tasks.values()), 'workers': workers}
+
+
+def export_profile(summary_file: str, trace_file: str) -> None:
+    """
+    Save the summary of the events of the current process, and their
+    timeline in the Chrome trace-event format, with one row per worker.
+
+    Args:
+        summary_file (str): Path of the JSON summary.
+        trace_file (str): Path of the JSON trace.
+    """
+    origin = _start if _start is not None \
+        else min((event['start'] for event in _events), default=0.0)
+    trace_events = [{
+        'name': event['name'], 'cat': event['category'], 'ph': 'X',
+        'ts': (event['start'] - origin) * 1e6,
+        'dur': event['duration'] * 1e6,
+        'pid': event['pid'], 'tid': event['tid'], 'args': event['args']
+    } for event in _events]
+    trace_events += [{
+        'name': 'process_name', 'ph': 'M', 'pid': pid,
+        'args': {'name': 'main' if pid == os.getpid() else f"worker {pid}"}
+    } for pid in sorted({event['pid'] for event in _events})]
+
+    for path, content in [(summary_file, summarize_profile()),
+                          (trace_file, {'traceEvents': trace_events,
+                                        'displayTimeUnit': 'ms'})]:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(content, f, indent=2, default=str)
+    logging.info(f"Profile saved to '{summary_file}' and trace to "
+                 f"'{trace_file}'.")
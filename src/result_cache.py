@@ -0,0 +1,201 @@
+"""
+Result Cache Module
+
+This module keeps the energy scores of sequence-template pairs in an SQLite
+database across runs, so that re-running the threading after adding a few
+sequences or templates only computes the new pairs.
+
+Scores are addressed by content rather than by file name: the key of a
+score combines a hash of the residues of the sequence, a hash of the C-alpha
+coordinates of the template, the gap score, a hash of the DOPE table and the
+version of the engines with the options that change the scores (distance
+cutoff and band). Renamed files hit the cache, identical sequences or
+templates under different names are computed once, and editing a template
+or the DOPE table misses it.
+
+Functions:
+- hash_sequence: Hashes the residues of a sequence.
+- hash_template: Hashes the C-alpha coordinates of a template.
+- hash_dope: Hashes a DOPE table.
+- engine_key: Returns the version of the engines and the scoring options.
+- open_cache: Opens or creates a cache database.
+- lookup_scores: Returns the cached scores of a list of keys.
+- store_scores: Saves scores in the cache.
+
+Example:
+    from result_cache import open_cache, lookup_scores, store_scores
+    cache = open_cache('results/scores.sqlite')
+    key = (hash_sequence(sequence), hash_template(coords), gap_score,
+           hash_dope(df_dope), engine_key())
+    cached = lookup_scores(cache, [key])
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+import hashlib
+import logging
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from process_dope import compile_dope
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Version of the scoring of the engines, to bump whenever a change to the
+# engines changes the energy scores, so that older cached scores miss
+ENGINE_VERSION = 1
+
+# Number of keys looked up per query
+LOOKUP_CHUNK = 500
+
+
+def hash_sequence(sequence: str) -> str:
+    """
+    Hash the residues of a sequence.
+
+    Args:
+        sequence (str): Sequence of residues.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    return hashlib.sha256(sequence.upper().encode()).hexdigest()
+
+
+def hash_template(coords: np.ndarray) -> str:
+    """
+    Hash the C-alpha coordinates of a template.
+
+    Args:
+        coords (np.ndarray): C-alpha coordinates with shape (n, 3), in the
+                             dtype the distances are computed from.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{coords.shape}{coords.dtype}".encode())
+    digest.update(np.ascontiguousarray(coords).tobytes())
+    return digest.hexdigest()
+
+
+def hash_dope(df_dope: pd.DataFrame) -> str:
+    """
+    Hash a DOPE table through its compiled tensor and distances.
+
+    Args:
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+
+    Returns:
+        str: Hexadecimal SHA-256 digest.
+    """
+    dope_tensor, dope_distances = compile_dope(df_dope)
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(dope_tensor).tobytes())
+    digest.update(np.ascontiguousarray(dope_distances).tobytes())
+    return digest.hexdigest()
+
+
+def engine_key(cutoff: float = None, band: int = None) -> str:
+    """
+    Return the version of the engines and the options changing the scores.
+    All the engines give identical scores, so the engine name and options
+    such as the tile size or the fixed-point mode are not part of the key.
+
+    Args:
+        cutoff (float, optional): Distance cutoff of the template contacts.
+                                  Defaults to None.
+        band (int, optional): Width of the diagonal band of the matrices.
+                              Defaults to None.
+
+    Returns:
+        str: The engine key.
+    """
+    cutoff = None if cutoff is None else float(cutoff)
+    return f"v{ENGINE_VERSION};cutoff={cutoff};band={band}"
+
+
+def open_cache(cache_file: str) -> sqlite3.Connection:
+    """
+    Open a cache database, creating it if it does not exist.
+
+    Args:
+        cache_file (str): Path of the SQLite database.
+
+    Returns:
+        sqlite3.Connection: Connection to the database.
+    """
+    directory = os.path.dirname(cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    cache = sqlite3.connect(cache_file)
+    cache.execute("PRAGMA journal_mode=WAL")
+    cache.execute(
+        "CREATE TABLE IF NOT EXISTS scores ("
+        "sequence TEXT NOT NULL, template TEXT NOT NULL, "
+        "gap_score REAL NOT NULL, dope TEXT NOT NULL, engine TEXT NOT NULL, "
+        "energy_score REAL NOT NULL, "
+        "PRIMARY KEY (sequence, template, gap_score, dope, engine)"
+        ") WITHOUT ROWID"
+    )
+    cache.commit()
+    logging.debug(f"Opened result cache '{cache_file}'")
+    return cache
+
+
+def lookup_scores(cache: sqlite3.Connection, keys: list) -> dict:
+    """
+    Return the cached scores of a list of keys.
+
+    Args:
+        cache (sqlite3.Connection): Connection to the cache database.
+        keys (list): Keys (sequence hash, template hash, gap score,
+                     DOPE hash, engine key).
+
+    Returns:
+        dict: Energy scores of the keys found in the cache.
+    """
+    keys = list(dict.fromkeys(keys))
+    scores = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        rows = cache.execute(
+            "SELECT sequence, template, gap_score, dope, engine, "
+            "energy_score FROM scores WHERE "
+            + " OR ".join(["(sequence = ? AND template = ? AND gap_score = ? "
+                           "AND dope = ? AND engine = ?)"] * len(chunk)),
+            [float(value) if isinstance(value, (int, float)) else value
+             for key in chunk for value in key]
+        )
+        for *key, energy_score in rows:
+            scores[tuple(key)] = energy_score
+    return scores
+
+
+def store_scores(cache: sqlite3.Connection, scores: dict) -> None:
+    """
+    Save scores in the cache. NaN scores, from failed pairs, are not saved.
+
+    Args:
+        cache (sqlite3.Connection): Connection to the cache database.
+        scores (dict): Energy scores keyed as in lookup_scores.
+    """
+    rows = [(*key[:2], float(key[2]), *key[3:], float(energy_score))
+            for key, energy_score in scores.items()
+            if not np.isnan(energy_score)]
+    with cache:
+        cache.executemany(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    logging.debug(f"Saved {len(rows)} scores to the result cache")
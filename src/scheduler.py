@@ -0,0 +1,301 @@
+"""
+Task Scheduler Module
+
+This module runs the tasks of a threading run, such as the (sequence,
+template) pairs or the (template, shuffles) batches, from a single queue
+served by one long-lived pool of worker processes.
+
+The cost of a task is dominated by its n * m low-level matrices of n * m
+cells each, so tasks are submitted by decreasing estimated cost n^2 m^2:
+the largest tasks start first and the small ones fill the tail, which keeps
+all the workers busy until the queue is empty.
+
+The pool is a loky executor owned by this module. It is started on first
+use and kept alive between calls, so that the worker processes, and the
+stores, libraries and energy profiles they cache, are reused across
+sequences and shuffle batches. It is not the reusable executor of loky,
+which joblib also uses for its own parallel loops, such as the low-level
+matrices of a pair run in the calling process.
+
+With a memory budget, tasks are only admitted while the sum of the
+estimated peak footprints of the running tasks fits in it: the next task
+that fits is started as soon as a running task completes.
+
+Functions:
+- task_cost: Estimates the cost of a task.
+- task_memory: Estimates the peak memory footprint of a task.
+- tile_matrix_bytes: Returns the bytes of a low-level matrix in a tile.
+- parse_memory: Parses a memory size such as '8G'.
+- get_pool: Returns the persistent pool of worker processes.
+- run_tasks: Runs tasks longest first and returns their results in order.
+
+Example:
+    from scheduler import run_tasks, task_cost
+    costs = [task_cost(n, m) for n, m in sizes]
+    results = run_tasks(process_pair, tasks, costs, jobs=8)
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+from concurrent.futures import FIRST_COMPLETED, wait
+import logging
+
+from joblib.externals.loky import BrokenProcessPool, ProcessPoolExecutor
+import numpy as np
+
+from process_dope import AMINO_ACIDS
+from process_matrix import TILE_BYTES, band_limits
+from profiling import add_events, profiling_enabled, run_profiled
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Seconds an idle worker of the pool waits for tasks before exiting
+POOL_TIMEOUT = 300
+
+# Suffixes of the memory sizes accepted by parse_memory
+MEMORY_UNITS = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+# Persistent pool of worker processes and its number of workers
+_pool = None
+_pool_jobs = None
+
+
+def task_cost(n: int, m: int, n_sequences: int = 1) -> float:
+    """
+    Estimate the cost of threading sequences of length m on a template with
+    n residues: n * m low-level matrices of n * m cells per sequence.
+
+    Args:
+        n (int): Number of template residues.
+        m (int): Length of the sequences.
+        n_sequences (int, optional): Number of sequences of the task.
+                                     Defaults to 1.
+
+    Returns:
+        float: Estimated cost of the task, in cells.
+    """
+    return float(n) ** 2 * float(m) ** 2 * n_sequences
+
+
+def tile_matrix_bytes(n: int, m: int, band: int = None,
+                      fixed_point: bool = False) -> int:
+    """
+    Return the bytes of one low-level matrix in a tile of the batched
+    engine, with its band width and item size, from which the engine
+    derives its default tile size.
+
+    Args:
+        n (int): Number of template residues.
+        m (int): Length of the sequences.
+        band (int, optional): Width of the band of the batched engine.
+                              Defaults to None.
+        fixed_point (bool, optional): If True, the tiles are int32.
+                                      Defaults to False.
+
+    Returns:
+        int: Bytes per low-level matrix of a tile.
+    """
+    width = m
+    if band is not None:
+        lower, upper = band_limits(n, m, band)
+        width = upper - lower + 1
+    itemsize = 4 if fixed_point else 8
+    return 2 * n * width * itemsize
+
+
+def task_memory(n: int, m: int, engine: str = 'batched',
+                n_matrices: int = 1, tile_size: int = None,
+                band: int = None, fixed_point: bool = False,
+                jobs: int = 1) -> int:
+    """
+    Estimate the peak memory footprint of the arrays of a task threading
+    sequences of length m on a template with n residues: the distance
+    matrix, the dense energy profile of the template, the working set of
+    the low-level engine in each of its processes, and the terminal values
+    and high-level matrices of the n_matrices (gap score, sequence)
+    combinations. The interpreter of the worker is not included, nor the
+    profiles of earlier tasks cached by the worker, which are bounded by
+    energy_profile.PROFILE_CACHE_BYTES.
+
+    Args:
+        n (int): Number of template residues.
+        m (int): Length of the sequences.
+        engine (str, optional): Name of the low-level engine.
+                                Defaults to 'batched'.
+        n_matrices (int, optional): Number of (gap score, sequence)
+                                    combinations of the task. Defaults to 1.
+        tile_size (int, optional): Number of low-level matrices per tile of
+                                   the batched engine. Derived from
+                                   TILE_BYTES if None. Defaults to None.
+        band (int, optional): Width of the band of the batched engine.
+                              Defaults to None.
+        fixed_point (bool, optional): If True, the batched engine fills
+                                      int32 tiles. Defaults to False.
+        jobs (int, optional): Number of processes filling the low-level
+                              matrices, each with its own working set.
+                              Defaults to 1.
+
+    Returns:
+        int: Estimated peak footprint, in bytes.
+    """
+    n_residues = len(AMINO_ACIDS)
+    template_bytes = 8 * n * n * (1 + n_residues ** 2)
+    results_bytes = n_matrices * n * m * (8 + 8 + 1)
+
+    if engine == 'full':
+        engine_bytes = 8 * n * m * n * m
+    elif engine == 'batched':
+        matrix_bytes = tile_matrix_bytes(n, m, band, fixed_point)
+        if tile_size is None:
+            tile_size = max(1, TILE_BYTES // matrix_bytes)
+        tile_size = min(tile_size, -(-n_matrices * n * m // jobs))
+        engine_bytes = jobs * matrix_bytes * tile_size
+    else:
+        # An (n, m) scratch buffer and its energies per process
+        engine_bytes = jobs * 2 * 8 * n * m
+    return template_bytes + results_bytes + engine_bytes
+
+
+def parse_memory(size: str) -> int:
+    """
+    Parse a memory size in bytes, or with a K, M, G or T suffix in powers
+    of 1024, such as '512M' or '8G'.
+
+    Args:
+        size (str): The memory size.
+
+    Returns:
+        int: The size in bytes.
+
+    Raises:
+        ValueError: If the size is not a positive number of bytes or units.
+    """
+    text = str(size).strip().upper().removesuffix('B')
+    unit = MEMORY_UNITS.get(text[-1:], 1)
+    try:
+        value = float(text[:-1] if text[-1:] in MEMORY_UNITS else text)
+    except ValueError:
+        raise ValueError(f"Invalid memory size: {size}")
+    if value <= 0:
+        raise ValueError(f"Invalid memory size: {size}")
+    return int(value * unit)
+
+
+def get_pool(jobs: int):
+    """
+    Return the persistent pool of worker processes, restarted with `jobs`
+    workers if it was started with another size.
+
+    Args:
+        jobs (int): Number of worker processes.
+
+    Returns:
+        loky.ProcessPoolExecutor: The pool of worker processes.
+    """
+    global _pool, _pool_jobs
+    if _pool is not None and _pool_jobs != jobs:
+        _pool.shutdown(wait=True)
+        _pool = None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=jobs, timeout=POOL_TIMEOUT)
+        _pool_jobs = jobs
+    return _pool
+
+
+def run_tasks(function, tasks: list, costs: list, jobs: int,
+              callback=None, footprints: list = None,
+              max_memory: int = None) -> list:
+    """
+    Run tasks by decreasing cost on the persistent pool.
+
+    Tasks of equal cost keep their order. With a single job or a single
+    task, the tasks run in the calling process. When profiling is on, the 
+    workers also profile the tasks and send their events back with the 
+    results. If a worker dies, the pool is discarded, so that the next 
+    call starts a new one, and the error is raised.
+
+    With a memory budget, a task is started only when its footprint fits 
+    next to the footprints of the running tasks, so that fewer than `jobs` 
+    tasks may run at once. The longest task that fits is started first, 
+    and a task larger than the whole budget runs alone.
+
+    Args:
+        function (callable): Function called with the arguments of each task.
+        tasks (list): Tuples of arguments of the tasks.
+        costs (list): Estimated costs of the tasks, see task_cost.
+        jobs (int): Number of worker processes.
+        callback (callable, optional): Function called as 
+            callback(index, result) in the calling process as soon as each 
+            task completes, such as to stream the results. Defaults to None.
+        footprints (list, optional): Estimated peak memory of the tasks, in 
+            bytes, see task_memory. Defaults to None.
+        max_memory (int, optional): Memory budget of the running tasks, in 
+            bytes. Defaults to None (no budget).
+
+    Returns:
+        list: Results of the tasks, in the order of `tasks`.
+
+    Raises:
+        BrokenProcessPool: If a worker process died.
+    """
+    order = np.argsort(-np.asarray(costs, dtype=float), kind='stable')
+    results = [None] * len(tasks)
+
+    if jobs == 1 or len(tasks) <= 1:
+        for index in order:
+            results[index] = function(*tasks[index])
+            if callback is not None:
+                callback(index, results[index])
+        return results
+
+    global _pool
+    pool = get_pool(jobs)
+    logging.debug(f"Scheduling {len(tasks)} tasks on {jobs} workers")
+    profile = profiling_enabled()
+    if footprints is None or max_memory is None:
+        footprints, max_memory = [0] * len(tasks), float('inf')
+
+    # Start the queued tasks, longest first, while they fit in the budget
+    queue = list(order)
+    running = {}
+    used = 0
+    try:
+        while queue or running:
+            for index in list(queue):
+                if len(running) == jobs:
+                    break
+                if running and used + footprints[index] > max_memory:
+                    continue
+                queue.remove(index)
+                future = pool.submit(run_profiled, function, *tasks[index]) \
+                    if profile else pool.submit(function, *tasks[index])
+                running[future] = index
+                used += footprints[index]
+            if queue and len(running) < jobs:
+                logging.debug(f"Memory budget: {len(running)} tasks running, "
+                              f"{len(queue)} waiting")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                used -= footprints[index]
+                results[index] = future.result()
+                if profile:
+                    results[index], events = results[index]
+                    add_events(events)
+                if callback is not None:
+                    callback(index, results[index])
+    except BrokenProcessPool:
+        # Start a new pool on the next call
+        pool.shutdown(wait=False, kill_workers=True)
+        _pool = None
+        raise
+    return results
@@ -0,0 +1,154 @@
+"""
+Shared Data Store Module
+
+This module shares the read-only data of a threading run between worker
+processes without copying it into every task. The parent process writes the
+DOPE table and the C-alpha coordinates and distance matrices of the
+templates once into a store directory, on the memory-backed filesystem
+/dev/shm when it is available. Workers memory-map the store the first time
+they see it, so that tasks only carry the path of the store and the names
+of their template and sequence.
+
+The DOPE table is saved in the format of the DOPE cache and the templates as
+a float64 template library, so attached data gives the same scores as data
+read from the original files.
+
+Functions:
+- create_store: Writes the DOPE table and the templates into a new store.
+- attach_store: Memory-maps a store, once per process.
+- remove_store: Deletes a store.
+- shared_store: Context manager creating and removing a store.
+
+Example:
+    from shared_store import shared_store, attach_store
+    with shared_store(df_dope, templates, templates_dir) as store:
+        df_dope, library = attach_store(store)
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+from contextlib import contextmanager
+from functools import lru_cache
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from load_data import (coordinates_to_distance_matrices, load_dope_table,
+                       read_c_alpha, save_dope_table)
+from profiling import stage
+from template_library import write_library
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Memory-backed filesystem holding the stores, if available
+SHARED_MEMORY_DIR = '/dev/shm'
+
+DOPE_TABLE = 'dope.npy'
+TEMPLATE_LIBRARY = 'templates.ptlib'
+
+
+def create_store(df_dope: pd.DataFrame, templates: list,
+                 templates_dir: str = None, library: str = None) -> str:
+    """
+    Write the DOPE table and the templates of a run into a new store.
+
+    Args:
+        df_dope (pd.DataFrame): DataFrame containing DOPE scores.
+        templates (list): Names of the template files.
+        templates_dir (str, optional): Directory of the template files.
+                                       Defaults to None.
+        library (str, optional): Path of a compiled template library. If set,
+                                 the library is already memory-mapped by the
+                                 workers and is not copied. Defaults to None.
+
+    Returns:
+        str: Path of the store directory.
+    """
+    shared_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) \
+        else None
+    store = tempfile.mkdtemp(prefix='threading_store_', dir=shared_dir)
+    logging.debug(f"Creating shared store '{store}'")
+    save_dope_table(df_dope, os.path.join(store, DOPE_TABLE))
+
+    if library:
+        os.symlink(os.path.abspath(library),
+                   os.path.join(store, TEMPLATE_LIBRARY))
+        return store
+
+    # Parse the templates once, missing ones are reported by the workers
+    names, sequences, coords_list = [], [], []
+    with stage('parse_pdb', templates=len(templates)):
+        for template in templates:
+            try:
+                sequence, coords = read_c_alpha(
+                    os.path.join(templates_dir, template), dtype=float
+                )
+            except (OSError, ValueError) as e:
+                logging.debug(f"Template {template} not stored: {e}")
+                continue
+            names.append(template)
+            sequences.append(sequence)
+            coords_list.append(coords)
+    with stage('distance_matrix', templates=len(names)):
+        dist_matrices = coordinates_to_distance_matrices(coords_list)
+    with stage('write_store'):
+        write_library(os.path.join(store, TEMPLATE_LIBRARY), names, 
+                      sequences, coords_list, dist_matrices, 
+                      dtype='float64')
+
+    logging.debug(f"Shared store holds {len(names)} templates")
+    return store
+
+
+@lru_cache(maxsize=None)
+def attach_store(store: str) -> tuple:
+    """
+    Memory-map a store. The store is attached once per process.
+
+    Args:
+        store (str): Path of the store directory.
+
+    Returns:
+        tuple: The DOPE DataFrame and the path of the template library.
+    """
+    logging.debug(f"Attaching shared store '{store}'")
+    return (load_dope_table(os.path.join(store, DOPE_TABLE)),
+            os.path.join(store, TEMPLATE_LIBRARY))
+
+
+def remove_store(store: str) -> None:
+    """
+    Delete a store. Memory maps still open in workers stay valid.
+
+    Args:
+        store (str): Path of the store directory.
+    """
+    shutil.rmtree(store, ignore_errors=True)
+    logging.debug(f"Removed shared store '{store}'")
+
+
+@contextmanager
+def shared_store(df_dope: pd.DataFrame, templates: list,
+                 templates_dir: str = None, library: str = None):
+    """
+    Create a store for the duration of a with block, see create_store.
+
+    Yields:
+        str: Path of the store directory.
+    """
+    store = create_store(df_dope, templates, templates_dir, library)
+    try:
+        yield store
+    finally:
+        remove_store(store)
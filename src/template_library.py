@@ -0,0 +1,263 @@
+"""
+Template Library Module
+
+This module compiles a directory of template structures into a single
+packed library file, and memory-maps that file so that threading runs read
+templates by name without parsing any PDB file or recomputing any distance
+matrix.
+
+The library file starts with the magic bytes `PTLIB001`, followed by the
+length of a JSON header (little-endian uint64) and the header itself. The
+header lists, for each template, its name, residue sequence, length and
+offsets into two raw data sections: the concatenated C-alpha coordinates
+with shape (sum(n), 3), then the concatenated flattened distance matrices
+with shape (sum(n * n),). Both sections are aligned to 64 bytes.
+
+Functions:
+- compile_library: Compiles a structures directory into a library file.
+- write_library: Writes templates held in memory into a library file.
+- load_library: Memory-maps a library file and returns its templates.
+
+Usage:
+    python src/template_library.py --templates_dir <structures_dir> \
+                                   --output_file <library_file>
+
+Example:
+    from template_library import compile_library, load_library
+    compile_library('data/example1/structures/', 'data/example1.ptlib')
+    templates = load_library('data/example1.ptlib')
+    dist_matrix = templates['1crn.pdb']['dist_matrix']
+"""
+
+__authors__ = "Nadezhda Zhukova"
+__contact__ = "nadiajuckova@gmail.com"
+__copyright__ = "MIT"
+__date__ = "2026-10-18"
+__version__ = "1.0.0"
+
+
+import argparse
+from functools import lru_cache
+import json
+import logging
+from multiprocessing import cpu_count
+import os
+import struct
+
+import numpy as np
+
+from load_data import coordinates_to_distance_matrices, read_c_alpha_directory
+
+# Setup logging configuration if not already configured
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+LIBRARY_MAGIC = b'PTLIB001'
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the next multiple of ALIGNMENT."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _section_starts(header_length: int, header: dict) -> tuple:
+    """Return the byte offsets of the coordinates and distances sections."""
+    coords_start = _aligned(len(LIBRARY_MAGIC) + 8 + header_length)
+    itemsize = np.dtype(header['dtype']).itemsize
+    coords_size = header['coords_count'] * 3 * itemsize
+    return coords_start, _aligned(coords_start + coords_size)
+
+
+def compile_library(templates_dir: str, library_file: str,
+                    jobs: int = cpu_count(), dtype: str = 'float32',
+                    chain: str = None, altloc: str = None) -> None:
+    """
+    Compile all the structures of a directory into a packed library file.
+
+    Args:
+        templates_dir (str): Directory containing PDB or mmCIF files.
+        library_file (str): Path of the library file to write.
+        jobs (int): Number of parallel jobs to use for parsing.
+        dtype (str): Data type of the stored coordinates and distances.
+                     Use 'float64' to reproduce the scores obtained from
+                     the structure files exactly.
+        chain (str, optional): Chain identifier to keep. Defaults to None.
+        altloc (str, optional): Alternate location to keep. Defaults to None.
+    """
+    logging.info(f"Compiling template library from '{templates_dir}'...")
+    structures = read_c_alpha_directory(templates_dir, jobs=jobs,
+                                        chain=chain, altloc=altloc,
+                                        dtype=float)
+    names = list(structures)
+    coords_list = [structures[name][1] for name in names]
+    write_library(library_file, names, 
+                  [structures[name][0] for name in names], coords_list,
+                  coordinates_to_distance_matrices(coords_list), dtype=dtype)
+
+    logging.info(f"Compiled {len(names)} templates into '{library_file}'.")
+
+
+def write_library(library_file: str, names: list, sequences: list,
+                  coords_list: list, dist_matrices: list,
+                  dtype: str = 'float32') -> None:
+    """
+    Write templates held in memory into a packed library file.
+
+    Args:
+        library_file (str): Path of the library file to write.
+        names (list): Names of the templates.
+        sequences (list): Residue sequences of the templates.
+        coords_list (list): C-alpha coordinates of the templates.
+        dist_matrices (list): Distance matrices of the templates.
+        dtype (str): Data type of the stored coordinates and distances.
+    """
+    # Describe every template by its offsets into the data sections
+    templates = []
+    coords_offset = 0
+    dist_offset = 0
+    for name, sequence, coords in zip(names, sequences, coords_list):
+        n = coords.shape[0]
+        templates.append({
+            'name': name,
+            'sequence': sequence,
+            'length': n,
+            'coords_offset': coords_offset,
+            'dist_offset': dist_offset
+        })
+        coords_offset += n
+        dist_offset += n * n
+
+    header = {'dtype': np.dtype(dtype).name, 'templates': templates,
+              'coords_count': coords_offset, 'dist_count': dist_offset}
+    header_bytes = json.dumps(header).encode('utf-8')
+    coords_start, dist_start = _section_starts(len(header_bytes), header)
+
+    with open(f"{library_file}.tmp", 'wb') as f:
+        f.write(LIBRARY_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.seek(coords_start)
+        for coords in coords_list:
+            f.write(np.ascontiguousarray(coords, dtype=dtype).tobytes())
+        f.seek(dist_start)
+        for dist_matrix in dist_matrices:
+            f.write(np.ascontiguousarray(dist_matrix, dtype=dtype).tobytes())
+    os.replace(f"{library_file}.tmp", library_file)
+
+
+@lru_cache(maxsize=None)
+def load_library(library_file: str) -> dict:
+    """
+    Memory-map a library file and return its templates.
+
+    The library is opened once per process. Arrays are read-only views of
+    the memory-mapped file, so only the templates that are accessed are
+    read from disk.
+
+    Args:
+        library_file (str): Path of the library file.
+
+    Returns:
+        dict: Templates keyed by name. Each template is a dict with the
+              'sequence' (str), 'coords' (np.ndarray with shape (n, 3))
+              and 'dist_matrix' (np.ndarray with shape (n, n)).
+
+    Raises:
+        ValueError: If the file is not a template library.
+    """
+    logging.debug(f"Loading template library '{library_file}'")
+    with open(library_file, 'rb') as f:
+        if f.read(len(LIBRARY_MAGIC)) != LIBRARY_MAGIC:
+            raise ValueError(f"'{library_file}' is not a template library.")
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    if not header['templates']:
+        return {}
+
+    dtype = np.dtype(header['dtype'])
+    coords_start, dist_start = _section_starts(header_length, header)
+    all_coords = np.memmap(library_file, dtype=dtype, mode='r',
+                           offset=coords_start,
+                           shape=(header['coords_count'], 3))
+    all_dists = np.memmap(library_file, dtype=dtype, mode='r',
+                          offset=dist_start,
+                          shape=(header['dist_count'],))
+
+    templates = {}
+    for template in header['templates']:
+        n = template['length']
+        coords_offset = template['coords_offset']
+        dist_offset = template['dist_offset']
+        templates[template['name']] = {
+            'sequence': template['sequence'],
+            'coords': all_coords[coords_offset:coords_offset + n],
+            'dist_matrix': all_dists[
+                dist_offset:dist_offset + n * n
+            ].reshape(n, n)
+        }
+
+    logging.debug(f"Template library loaded with {len(templates)} templates")
+    return templates
+
+
+def main() -> None:
+    """
+    Main function to compile a structures directory into a library file.
+
+    Command-line Arguments:
+        --templates_dir: Directory containing the structure files.
+        --output_file: Path of the library file to write.
+        --dtype (optional): Data type of the stored arrays.
+        --chain (optional): Chain identifier to keep.
+        --altloc (optional): Alternate location to keep.
+        --jobs (optional): Number of parallel jobs to use.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compile template structures into a library file."
+    )
+    parser.add_argument(
+        '--templates_dir',
+        type=str,
+        required=True,
+        help='Directory containing the PDB or mmCIF template files'
+        )
+    parser.add_argument(
+        '--output_file',
+        type=str,
+        required=True,
+        help='Path of the library file to write'
+        )
+    parser.add_argument(
+        '--dtype',
+        type=str,
+        choices=['float32', 'float64'],
+        default='float32',
+        help='Data type of the stored coordinates and distances'
+        )
+    parser.add_argument(
+        '--chain',
+        type=str,
+        help='Chain identifier to keep, default is all chains'
+        )
+    parser.add_argument(
+        '--altloc',
+        type=str,
+        help='Alternate location to keep, default is the first one'
+        )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=cpu_count(),
+        help='Number of parallel jobs to run, default is all cores'
+        )
+
+    args = parser.parse_args()
+
+    compile_library(args.templates_dir, args.output_file, jobs=args.jobs,
+                    dtype=args.dtype, chain=args.chain, altloc=args.altloc)
+
+
+if __name__ == "__main__":
+    main()
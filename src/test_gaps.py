@@ -6,8 +6,10 @@ and homologous structures, and logs the process.
 
 Functions:
     - calculate_performance: Calculates performance based on predictions.
-    - run_tests: Runs the sequence-structure matching program for different 
-      gap scores.
+    - run_tests: Runs the sequence-structure matching program once for all 
+      the gap scores.
+    - load_results: Reads the energy scores of each gap score from the 
+      output files.
     - process_results: Processes the output files and calculates performance 
       results.
     - main: Main function to coordinate the tests and result processing.
@@ -20,7 +22,7 @@ import subprocess
 import pandas as pd
 import logging
 
-from config import gap_scores, homolog_pairs
+from config import DOPE_CACHE, DOPE_URL, gap_scores, homolog_pairs
 
 
 # Configure logging
@@ -73,28 +75,75 @@ def calculate_performance(df, homolog_pairs):
     return performance, correctly_guessed_count, similar_structure_count
 
 
-def run_tests(program_path, output_dir):
+# Long-format energy scores of all the gap scores, written by run_tests
+SWEEP_FILE = 'energy_scores_sweep.csv'
+
+
+def run_tests(program_path, output_dir, dope=DOPE_URL, dope_cache=DOPE_CACHE):
     """
-    Run the sequence-structure matching program for each gap score and save 
-    the results.
+    Run the sequence-structure matching program once for all the gap scores, 
+    which share the template data and energies, and save the results in 
+    long format.
 
     Args:
         program_path (str): Path to the program to run (e.g., main.py).
         output_dir (str): Directory where output CSV files will be saved.
+        dope (str): URL or path of the DOPE score data file.
+        dope_cache (str): Path of the cached DOPE CA-CA table shared by 
+                          all runs.
     """
     os.makedirs(output_dir, exist_ok=True)
-    for gap_score in gap_scores:
-        output_file = os.path.join(output_dir, f'energy_scores_{gap_score}.csv')
-        command = ['python', program_path, '--gap_score', str(gap_score), 
-                   '--output_file', output_file]
-        
-        logging.info(f'Running test with gap score {gap_score}...')
-        try:
-            subprocess.run(command, check=True)
-            logging.info(f'Successfully ran test with gap score {gap_score}, '
-                         f'output saved to {output_file}')
-        except subprocess.CalledProcessError as e:
-            logging.error(f'Error running test with gap score {gap_score}: {e}')
+    output_file = os.path.join(output_dir, SWEEP_FILE)
+    command = ['python', program_path, 
+               '--gap_scores', ','.join(str(gap_score) 
+                                        for gap_score in gap_scores), 
+               '--output_file', output_file, 
+               '--dope', dope, '--dope_cache', dope_cache]
+    
+    logging.info(f'Running tests with gap scores {gap_scores}...')
+    try:
+        subprocess.run(command, check=True)
+        logging.info(f'Successfully ran tests with gap scores {gap_scores}, '
+                     f'output saved to {output_file}')
+    except subprocess.CalledProcessError as e:
+        logging.error(f'Error running tests with gap scores {gap_scores}: {e}')
+
+
+def load_results(output_dir):
+    """
+    Read the energy scores of each gap score from the output directory: the 
+    long-format table written by run_tests, or one energy_scores_<gap>.csv 
+    file per gap score as written by separate runs. Other files matching 
+    the pattern, such as the skipped pairs or drift reports of a run, are 
+    ignored.
+
+    Args:
+        output_dir (str): Directory containing the output CSV files.
+
+    Returns:
+        dict: Energy scores DataFrames (sequences x templates) keyed by gap 
+              score.
+    """
+    results = {}
+    csv_files = glob.glob(os.path.join(output_dir, 'energy_scores_*.csv'))
+    for csv_file in csv_files:
+        if os.path.basename(csv_file) == SWEEP_FILE:
+            df = pd.read_csv(csv_file)
+            for gap_score, scores in df.groupby('gap_score', sort=False):
+                results[float(gap_score)] = scores.pivot(
+                    index='sequence', columns='template', 
+                    values='energy_score'
+                )
+        else:
+            suffix = os.path.basename(csv_file)[len('energy_scores_'):
+                                                -len('.csv')]
+            try:
+                gap_score = float(suffix)
+            except ValueError:
+                logging.debug(f'Ignoring {csv_file}: not a gap score file.')
+                continue
+            results[gap_score] = pd.read_csv(csv_file, index_col=0)
+    return results
 
 
 def process_results(output_dir, homolog_pairs, result_file):
@@ -108,12 +157,9 @@ def process_results(output_dir, homolog_pairs, result_file):
                               structures.
         result_file (str): Path to save the final performance results CSV.
     """
-    csv_files = glob.glob(os.path.join(output_dir, 'energy_scores_*.csv'))
     performances = []
 
-    for csv_file in csv_files:
-        gap_score = float(csv_file.split('_')[-1].replace('.csv', ''))
-        df = pd.read_csv(csv_file, index_col=0)
+    for gap_score, df in load_results(output_dir).items():
         performance, correctly_guessed, similar_structure = calculate_performance(
             df, homolog_pairs)
 
@@ -144,11 +190,15 @@ def main():
                         help="Directory to save the gap test results")
     parser.add_argument('--result_file', default='results/performance.csv', 
                         help="File to save the performance results")
+    parser.add_argument('--dope', default=DOPE_URL, 
+                        help="URL or path of the DOPE score data file")
+    parser.add_argument('--dope_cache', default=DOPE_CACHE, 
+                        help="Path of the cached DOPE CA-CA table (.npy)")
     
     args = parser.parse_args()
 
     # Run tests with different gap scores
-    run_tests(args.program_path, args.output_dir)
+    run_tests(args.program_path, args.output_dir, args.dope, args.dope_cache)
     
     # Process the results and generate performance CSV
     process_results(args.output_dir, homolog_pairs, args.result_file)